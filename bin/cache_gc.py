@@ -121,9 +121,8 @@ def list_cached_jobs():
 
 def clear_job_data(job_id):
     """
-    Clear KVS cache data for the given job. This is done by searching in the
-    KVS for keys matching a job key (derived from the job_id) and deleting each
-    result.
+    Clear KVS cache data for the given job. This is done by deleting, in
+    batches, the keys in the KVS index set of the job.
 
     Invoked by the -j or --job command line arg.
 
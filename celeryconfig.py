@@ -42,6 +42,10 @@ BROKER_VHOST = amqp.get("vhost")
 
 CELERY_RESULT_BACKEND = "amqp"
 
+# The in-memory KVS is only visible to the current process, tasks must run
+# in the process that submits them.
+CELERY_ALWAYS_EAGER = config.get("kvs", "backend") == "memory"
+
 
 CELERY_IMPORTS = (
     "openquake.risk.job", "openquake.hazard.tasks", "tests.utils.tasks")
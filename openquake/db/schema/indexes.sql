@@ -76,3 +76,6 @@ CREATE INDEX riskr_bcr_distribution_data_bcr_distribution_id_idx on riskr.bcr_di
 
 -- oqmif indexes
 CREATE INDEX oqmif_exposure_data_site_idx ON oqmif.exposure_data USING gist(site);
+
+-- hzrdr indexes
+CREATE INDEX hzrdr_hazard_curve_data_location_idx ON hzrdr.hazard_curve_data USING gist(location);
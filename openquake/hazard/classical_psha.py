@@ -35,6 +35,15 @@ QUANTILE_PARAM_NAME = "QUANTILE_LEVELS"
 POES_PARAM_NAME = "POES_HAZARD_MAPS"
 
 
+# number of sites whose hazard curves are loaded and processed together
+# when computing mean and quantile curves
+CURVE_BLOCK_SIZE = 100
+
+# plotting positions used by mquantiles (and by the R default, type 7)
+QUANTILE_ALPHAP = 0.4
+QUANTILE_BETAP = 0.4
+
+
 def compute_mean_curve(curves):
     """Compute a mean hazard curve.
 
@@ -59,8 +68,66 @@ def compute_quantile_curve(curves, quantile):
     return result
 
 
+def compute_mean_curves(block):
+    """Compute the mean hazard curve of each site in a block.
+
+    :param block: the hazard curves of the sites, as returned by
+        :py:func:`hazard_curves_block`
+    :type block: :py:class:`numpy.ndarray` of shape
+        (sites, realizations, IMLs)
+    :returns: the mean curves, one row per site
+    :rtype: :py:class:`numpy.ndarray` of shape (sites, IMLs)
+    """
+
+    return block.mean(axis=1)
+
+
+def compute_quantile_curves(block, quantiles):
+    """Compute the quantile hazard curves of each site in a block.
+
+    The results are the same computed by :py:func:`compute_quantile_curve`
+    (i.e. by `mquantiles` with its default plotting positions) for each
+    site and quantile, but the curves of all the sites are sorted and
+    interpolated at once.
+
+    :param block: the hazard curves of the sites, as returned by
+        :py:func:`hazard_curves_block`
+    :type block: :py:class:`numpy.ndarray` of shape
+        (sites, realizations, IMLs)
+    :param quantiles: the quantile levels
+    :type quantiles: list of :py:class:`float`
+    :returns: the quantile curves, indexed by quantile and site
+    :rtype: :py:class:`numpy.ndarray` of shape (quantiles, sites, IMLs)
+    """
+    sites, realizations, imls = block.shape
+
+    if not block.size:
+        return numpy.zeros((len(quantiles), sites, 0))
+
+    result = numpy.empty((len(quantiles), sites, imls))
+
+    if realizations == 1:
+        result[:] = block[:, 0, :]
+        return result
+
+    block = numpy.sort(block, axis=1)
+
+    for i, quantile in enumerate(quantiles):
+        # same arithmetic (and order of operations) as
+        # scipy.stats.mstats.mquantiles, so that the results are identical
+        m = QUANTILE_ALPHAP + quantile * (
+            1. - QUANTILE_ALPHAP - QUANTILE_BETAP)
+        aleph = realizations * quantile + m
+        k = int(math.floor(min(max(aleph, 1), realizations - 1)))
+        gamma = min(max(aleph - k, 0), 1)
+
+        result[i] = (1. - gamma) * block[:, k - 1, :] + gamma * block[:, k, :]
+
+    return result
+
+
 def poes_at(job_id, site, realizations):
-    """Return all the json deserialized hazard curves for
+    """Return all the deserialized hazard curves for
     a single site (different realizations).
 
     :param job_id: the id of the job.
@@ -79,19 +146,52 @@ def poes_at(job_id, site, realizations):
     return kvs.mget_decoded(keys)
 
 
+def hazard_curves_block(job_id, sites, realizations):
+    """Return the hazard curves of all the given sites and realizations,
+    read from the KVS with a single command.
+
+    :param job_id: the id of the job.
+    :type job_id: integer
+    :param sites: sites where the curves are computed.
+    :type sites: list of :py:class:`shapes.Site` objects
+    :param realizations: number of realizations.
+    :type realizations: integer
+    :returns: the probabilities of exceedence of the curves
+    :rtype: :py:class:`numpy.ndarray` of shape (sites, realizations, IMLs)
+    """
+    keys = [kvs.tokens.hazard_curve_poes_key(job_id, realization, site)
+                for site in sites for realization in xrange(realizations)]
+    curves = kvs.mget_array(keys)
+
+    if any(curve is None for curve in curves):
+        raise ValueError("missing hazard curves for job %s" % job_id)
+
+    imls = len(curves[0]) if curves else 0
+
+    return numpy.array(curves, dtype=float).reshape(
+        (len(sites), realizations, imls))
+
+
+def _site_blocks(sites):
+    """Split the given sites in blocks of :py:data:`CURVE_BLOCK_SIZE`."""
+    for start in xrange(0, len(sites), CURVE_BLOCK_SIZE):
+        yield sites[start:start + CURVE_BLOCK_SIZE]
+
+
 def compute_mean_hazard_curves(job_id, sites, realizations):
     """Compute a mean hazard curve for each site in the list
     using as input all the pre-computed curves for different realizations."""
     keys = []
-    for site in sites:
-        poes = poes_at(job_id, site, realizations)
-
-        mean_poes = compute_mean_curve(poes)
+    with kvs.BulkWriter() as writer:
+        for block_sites in _site_blocks(sites):
+            block = hazard_curves_block(job_id, block_sites, realizations)
+            curves = compute_mean_curves(block)
 
-        key = kvs.tokens.mean_hazard_curve_key(job_id, site)
-        keys.append(key)
+            for site, mean_poes in zip(block_sites, curves):
+                key = kvs.tokens.mean_hazard_curve_key(job_id, site)
+                keys.append(key)
 
-        kvs.set_value_json_encoded(key, mean_poes)
+                writer.set_value_array(key, mean_poes)
 
     return keys
 
@@ -104,17 +204,21 @@ def compute_quantile_hazard_curves(job_id, sites, realizations, quantiles):
     LOG.debug("[QUANTILE_HAZARD_CURVES] List of quantiles is %s" % quantiles)
 
     keys = []
-    for site in sites:
-        poes = poes_at(job_id, site, realizations)
+    if not quantiles:
+        return keys
 
-        for quantile in quantiles:
-            quantile_poes = compute_quantile_curve(poes, quantile)
+    with kvs.BulkWriter() as writer:
+        for block_sites in _site_blocks(sites):
+            block = hazard_curves_block(job_id, block_sites, realizations)
+            curves = compute_quantile_curves(block, quantiles)
 
-            key = kvs.tokens.quantile_hazard_curve_key(
-                    job_id, site, quantile)
-            keys.append(key)
+            for i, site in enumerate(block_sites):
+                for j, quantile in enumerate(quantiles):
+                    key = kvs.tokens.quantile_hazard_curve_key(
+                            job_id, site, quantile)
+                    keys.append(key)
 
-            kvs.set_value_json_encoded(key, quantile_poes)
+                    writer.set_value_array(key, curves[j, i])
 
     return keys
 
@@ -172,19 +276,21 @@ def compute_quantile_hazard_maps(job_id, sites, quantiles, imls, poes):
     LOG.debug("[QUANTILE_HAZARD_MAPS] List of quantiles is %s" % quantiles)
 
     keys = []
-    for quantile in quantiles:
-        for site in sites:
-            quantile_poes = kvs.get_value_json_decoded(
-                kvs.tokens.quantile_hazard_curve_key(job_id, site, quantile))
+    with kvs.BulkWriter() as writer:
+        for quantile in quantiles:
+            for site in sites:
+                quantile_poes = kvs.get_value_array(
+                    kvs.tokens.quantile_hazard_curve_key(
+                        job_id, site, quantile))
 
-            interpolate = build_interpolator(quantile_poes, imls, site)
+                interpolate = build_interpolator(quantile_poes, imls, site)
 
-            for poe in poes:
-                key = kvs.tokens.quantile_hazard_map_key(
-                        job_id, site, poe, quantile)
-                keys.append(key)
+                for poe in poes:
+                    key = kvs.tokens.quantile_hazard_map_key(
+                            job_id, site, poe, quantile)
+                    keys.append(key)
 
-                kvs.set_value_json_encoded(key, interpolate(poe))
+                    writer.set_value_json_encoded(key, interpolate(poe))
 
     return keys
 
@@ -197,15 +303,16 @@ def compute_mean_hazard_maps(job_id, sites, imls, poes):
     LOG.debug("[MEAN_HAZARD_MAPS] List of POEs is %s" % poes)
 
     keys = []
-    for site in sites:
-        mean_poes = kvs.get_value_json_decoded(
-            kvs.tokens.mean_hazard_curve_key(job_id, site))
-        interpolate = build_interpolator(mean_poes, imls, site)
+    with kvs.BulkWriter() as writer:
+        for site in sites:
+            mean_poes = kvs.get_value_array(
+                kvs.tokens.mean_hazard_curve_key(job_id, site))
+            interpolate = build_interpolator(mean_poes, imls, site)
 
-        for poe in poes:
-            key = kvs.tokens.mean_hazard_map_key(job_id, site, poe)
-            keys.append(key)
+            for poe in poes:
+                key = kvs.tokens.mean_hazard_map_key(job_id, site, poe)
+                keys.append(key)
 
-            kvs.set_value_json_encoded(key, interpolate(poe))
+                writer.set_value_json_encoded(key, interpolate(poe))
 
     return keys
@@ -48,7 +48,6 @@ class DeterministicEventBasedMixin(BasePSHAMixin):
             "Random")(int(self.params["GMF_RANDOM_SEED"]))
 
         encoder = json.JSONEncoder()
-        kvs_client = kvs.get_client()
 
         grid = self.region.grid
 
@@ -64,7 +63,7 @@ class DeterministicEventBasedMixin(BasePSHAMixin):
                 key = kvs.tokens.ground_motion_values_key(
                     self.job_id, point)
 
-                kvs_client.rpush(key, encoder.encode(gmv))
+                kvs.rpush(key, encoder.encode(gmv))
 
     def _number_of_calculations(self):
         """Return the number of calculations to trigger.
@@ -20,6 +20,7 @@
 Wrapper around the OpenSHA-lite java library.
 """
 
+import json
 import math
 import os
 import multiprocessing
@@ -32,12 +33,14 @@ from openquake import java
 from openquake import kvs
 from openquake import logs
 from openquake import shapes
+from openquake import writer
 from openquake import xml
 
 from openquake.hazard import classical_psha
 from openquake.hazard import job
 from openquake.hazard import tasks
 from openquake.job.mixins import Mixin
+from openquake.kvs import cache
 from openquake.output import hazard as hazard_output
 from openquake.utils import config
 from openquake.utils import tasks as utils_tasks
@@ -97,14 +100,17 @@ def unwrap_validation_error(jpype, runtime_exception, path=None):
 class BasePSHAMixin(Mixin):
     """Contains common functionality for PSHA Mixins."""
 
-    def store_source_model(self, seed):
+    def store_source_model(self, seed, realization=None):
         """Generates an Earthquake Rupture Forecast, using the source zones and
         logic trees specified in the job config file. Note that this has to be
         done currently using the file itself, since it has nested references to
-        other files."""
+        other files.
+
+        When a `realization` is given the source model is stored under a key
+        of its own, so that realizations can be computed concurrently."""
 
         LOG.info("Storing source model from job config")
-        key = kvs.tokens.source_model_key(self.job_id)
+        key = kvs.tokens.source_model_key(self.job_id, realization)
         print "source model key is", key
         jpype = java.jvm()
         try:
@@ -114,10 +120,15 @@ class BasePSHAMixin(Mixin):
                 jpype, ex,
                 self.params.get("SOURCE_MODEL_LOGIC_TREE_FILE_PATH"))
 
-    def store_gmpe_map(self, seed):
+        kvs.register_job_keys([key])
+
+    def store_gmpe_map(self, seed, realization=None):
         """Generates a hash of tectonic regions and GMPEs, using the logic tree
-        specified in the job config file."""
-        key = kvs.tokens.gmpe_key(self.job_id)
+        specified in the job config file.
+
+        When a `realization` is given the map is stored under a key of its
+        own, so that realizations can be computed concurrently."""
+        key = kvs.tokens.gmpe_key(self.job_id, realization)
         print "GMPE map key is", key
         jpype = java.jvm()
         try:
@@ -126,15 +137,30 @@ class BasePSHAMixin(Mixin):
             unwrap_validation_error(
                 jpype, ex, self.params.get("GMPE_LOGIC_TREE_FILE_PATH"))
 
-    def generate_erf(self):
+        kvs.register_job_keys([key])
+
+    def generate_erf(self, realization=None):
         """Generate the Earthquake Rupture Forecast from the currently stored
-        source model logic tree."""
-        key = kvs.tokens.source_model_key(self.job_id)
-        sources = java.jclass("JsonSerializer").getSourceListFromCache(
-                    self.cache, key)
-        erf = java.jclass("GEM1ERF")(sources)
-        self.calc.setGEM1ERFParams(erf)
-        return erf
+        source model logic tree.
+
+        When a `realization` is given, the source model stored for that
+        realization is used and the ERF is kept in the worker-local
+        :py:data:`openquake.kvs.cache.JOB_CACHE` and reused by the following
+        calls for the same realization."""
+        key = kvs.tokens.source_model_key(self.job_id, realization)
+
+        def load():
+            """Fetch and deserialize the source model."""
+            sources = java.jclass("JsonSerializer").getSourceListFromCache(
+                        self.cache, key)
+            erf = java.jclass("GEM1ERF")(sources)
+            self.calc.setGEM1ERFParams(erf)
+            return erf
+
+        if realization is None:
+            return load()
+
+        return cache.JOB_CACHE.get(self.job_id, (key, realization), load)
 
     def set_gmpe_params(self, gmpe_map):
         """Push parameters from configuration file into the GMPE objects"""
@@ -153,13 +179,26 @@ class BasePSHAMixin(Mixin):
                 jpype.JObject(gmpe, java.jclass("AttenuationRelationship")))
             gmpe_map.put(tect_region, gmpe)
 
-    def generate_gmpe_map(self):
-        """Generate the GMPE map from the stored GMPE logic tree."""
-        key = kvs.tokens.gmpe_key(self.job_id)
-        gmpe_map = java.jclass(
-            "JsonSerializer").getGmpeMapFromCache(self.cache, key)
-        self.set_gmpe_params(gmpe_map)
-        return gmpe_map
+    def generate_gmpe_map(self, realization=None):
+        """Generate the GMPE map from the stored GMPE logic tree.
+
+        When a `realization` is given, the map stored for that realization is
+        used and kept in the worker-local
+        :py:data:`openquake.kvs.cache.JOB_CACHE` and reused by the following
+        calls for the same realization."""
+        key = kvs.tokens.gmpe_key(self.job_id, realization)
+
+        def load():
+            """Fetch and deserialize the GMPE map."""
+            gmpe_map = java.jclass(
+                "JsonSerializer").getGmpeMapFromCache(self.cache, key)
+            self.set_gmpe_params(gmpe_map)
+            return gmpe_map
+
+        if realization is None:
+            return load()
+
+        return cache.JOB_CACHE.get(self.job_id, (key, realization), load)
 
     def get_iml_list(self):
         """Build the appropriate Arbitrary Discretized Func from the IMLs,
@@ -213,6 +252,38 @@ class ClassicalMixin(BasePSHAMixin):
         value = value.strip() if value else None
         return 2 * multiprocessing.cpu_count() if value is None else int(value)
 
+    def concurrent_realizations(self):
+        """How many logic tree realizations should be computed at the same
+        time?"""
+        value = self.params.get("CONCURRENT_REALIZATIONS")
+        value = value.strip() if value else None
+        return 1 if value is None else max(1, int(value))
+
+    def dynamic_distribution(self):
+        """Should the sites be handed out to the `celery` tasks in chunks
+        sized while the calculation goes on (see
+        :py:func:`openquake.utils.tasks.distribute_dynamically`)?"""
+        value = self.params.get("TASK_DISTRIBUTION")
+        value = value.strip().lower() if value else "static"
+
+        if value not in ("static", "dynamic"):
+            raise ValueError(
+                "invalid TASK_DISTRIBUTION '%s', valid values are: static, "
+                "dynamic" % value)
+
+        return value == "dynamic"
+
+    def distribute(self, the_task, (name, data), other_args):
+        """Run `the_task` over the sites in `data`, as selected by
+        :py:meth:`dynamic_distribution`, and wait for it to complete."""
+        if self.dynamic_distribution():
+            distribute = utils_tasks.distribute_dynamically
+        else:
+            distribute = utils_tasks.distribute
+
+        distribute(self.number_of_tasks(), the_task, (name, data),
+                   other_args, flatten_results=True)
+
     def do_curves(self, sites, realizations,
                   serializer=None,
                   the_task=tasks.compute_hazard_curve):
@@ -221,6 +292,10 @@ class ClassicalMixin(BasePSHAMixin):
         The calculated curves will only be serialized if the `serializer`
         parameter is not `None`.
 
+        Up to :py:meth:`concurrent_realizations` realizations are computed at
+        the same time, each realization is serialized as soon as all its
+        curves are available.
+
         :param sites: The sites for which to calculate hazard curves.
         :type sites: list of :py:class:`openquake.shapes.Site`
         :param realizations: The number of realizations to calculate
@@ -245,20 +320,32 @@ class ClassicalMixin(BasePSHAMixin):
         gmpe_generator = random.Random()
         gmpe_generator.seed(self.params.get("GMPE_LT_RANDOM_SEED", None))
 
-        for realization in xrange(0, realizations):
+        def start(realization):
+            """Store the logic tree samples of a realization."""
             LOG.info("Calculating hazard curves for realization %s"
                      % realization)
-            self.store_source_model(source_model_generator.getrandbits(32))
-            self.store_gmpe_map(source_model_generator.getrandbits(32))
-
-            utils_tasks.distribute(
-                self.number_of_tasks(), the_task, ("site_list", sites),
-                dict(job_id=self.job_id, realization=realization),
-                flatten_results=True)
-
+            self.store_source_model(source_model_generator.getrandbits(32),
+                                    realization)
+            self.store_gmpe_map(source_model_generator.getrandbits(32),
+                                realization)
+
+        def finish(realization, _):
+            """Serialize the curves of a realization and drop its logic tree
+            samples."""
             if serializer:
                 serializer(sites, realization)
 
+            kvs.delete_job_keys([
+                kvs.tokens.source_model_key(self.job_id, realization),
+                kvs.tokens.gmpe_key(self.job_id, realization)])
+
+        utils_tasks.distribute_many(
+            self.number_of_tasks(), the_task, ("site_list", sites),
+            [dict(job_id=self.job_id, realization=realization)
+             for realization in xrange(0, realizations)],
+            self.concurrent_realizations(), start=start, finish=finish,
+            flatten_results=True, dynamic=self.dynamic_distribution())
+
     def param_set(self, name):
         """Is the parameter with the given `name` set and non-empty?
 
@@ -309,10 +396,9 @@ class ClassicalMixin(BasePSHAMixin):
         # Compute and serialize the mean curves.
         LOG.info("Computing mean hazard curves")
 
-        utils_tasks.distribute(
-            self.number_of_tasks(), curve_task, ("sites", sites),
-            dict(job_id=self.job_id, realizations=realizations),
-            flatten_results=True)
+        self.distribute(
+            curve_task, ("sites", sites),
+            dict(job_id=self.job_id, realizations=realizations))
 
         if curve_serializer:
             LOG.info("Serializing mean hazard curves")
@@ -367,11 +453,10 @@ class ClassicalMixin(BasePSHAMixin):
         # compute and serialize quantile hazard curves
         LOG.info("Computing quantile hazard curves")
 
-        utils_tasks.distribute(
-            self.number_of_tasks(), curve_task, ("sites", sites),
+        self.distribute(
+            curve_task, ("sites", sites),
             dict(job_id=self.job_id, realizations=realizations,
-                 quantiles=quantiles),
-            flatten_results=True)
+                 quantiles=quantiles))
 
         if curve_serializer:
             LOG.info("Serializing quantile curves for %s values"
@@ -494,23 +579,25 @@ class ClassicalMixin(BasePSHAMixin):
 
         curve_writer = hazard_output.create_hazardcurve_writer(
             self.job_id, self.serialize_results_to, nrml_path)
-        hc_data = []
 
-        for site in sites:
-            # Use hazard curve ordinate values (PoE) from KVS and abscissae
-            # from the IML list in config.
-            hc_attrib = {
-                'investigationTimeSpan': self['INVESTIGATION_TIME'],
-                'IMLValues': self.imls,
-                'IMT': self['INTENSITY_MEASURE_TYPE'],
+        def hc_data():
+            """The curves of the sites, read from the KVS one at a time
+            while they are written (once per writer)."""
+            for site in sites:
+                # Use hazard curve ordinate values (PoE) from KVS and
+                # abscissae from the IML list in config.
+                hc_attrib = {
+                    'investigationTimeSpan': self['INVESTIGATION_TIME'],
+                    'IMLValues': self.imls,
+                    'IMT': self['INTENSITY_MEASURE_TYPE'],
 
-                'PoEValues': kvs.get_value_json_decoded(key_template
-                                                        % hash(site))}
+                    'PoEValues': kvs.get_value_json_decoded(key_template
+                                                            % hash(site))}
 
-            hc_attrib.update(hc_attrib_update)
-            hc_data.append((site, hc_attrib))
+                hc_attrib.update(hc_attrib_update)
+                yield (site, hc_attrib)
 
-        curve_writer.serialize(hc_data)
+        curve_writer.serialize(writer.Reiterable(hc_data))
 
         return nrml_path
 
@@ -587,35 +674,39 @@ class ClassicalMixin(BasePSHAMixin):
 
         map_writer = hazard_output.create_hazardmap_writer(
             self.job_id, self.serialize_results_to, nrml_path)
-        hm_data = []
-
-        for site in sites:
-            # use hazard map IML values from KVS
-            hm_attrib = {
-                'investigationTimeSpan': self.params['INVESTIGATION_TIME'],
-                'IMT': self.params['INTENSITY_MEASURE_TYPE'],
-                'vs30': self.params['REFERENCE_VS30_VALUE'],
-                'IML': kvs.get_value_json_decoded(key_template % hash(site)),
-                'poE': poe}
-
-            hm_attrib.update(hm_attrib_update)
-            hm_data.append((site, hm_attrib))
 
-        map_writer.serialize(hm_data)
+        def hm_data():
+            """The map values of the sites, read from the KVS one at a
+            time while they are written (once per writer)."""
+            for site in sites:
+                # use hazard map IML values from KVS
+                hm_attrib = {
+                    'investigationTimeSpan':
+                        self.params['INVESTIGATION_TIME'],
+                    'IMT': self.params['INTENSITY_MEASURE_TYPE'],
+                    'vs30': self.params['REFERENCE_VS30_VALUE'],
+                    'IML': kvs.get_value_json_decoded(
+                        key_template % hash(site)),
+                    'poE': poe}
+
+                hm_attrib.update(hm_attrib_update)
+                yield (site, hm_attrib)
+
+        map_writer.serialize(writer.Reiterable(hm_data))
 
         return nrml_path
 
     @preload
     def compute_hazard_curve(self, sites, realization):
-        """ Compute hazard curves, write them to KVS as JSON,
+        """ Compute hazard curves, write them to KVS as binary arrays,
         and return a list of the KVS keys for each curve. """
         jpype = java.jvm()
         try:
             calc = java.jclass("HazardCalculator")
             poes_list = calc.getHazardCurvesAsJson(
                 self.parameterize_sites(sites),
-                self.generate_erf(),
-                self.generate_gmpe_map(),
+                self.generate_erf(realization),
+                self.generate_gmpe_map(realization),
                 self.get_iml_list(),
                 float(self.params['MAXIMUM_DISTANCE']))
         except jpype.JavaException, ex:
@@ -624,13 +715,14 @@ class ClassicalMixin(BasePSHAMixin):
         # write the poes to the KVS and return a list of the keys
 
         curve_keys = []
-        for site, poes in izip(sites, poes_list):
-            curve_key = kvs.tokens.hazard_curve_poes_key(
-                self.job_id, realization, site)
+        with kvs.BulkWriter(ttl=self.intermediate_key_ttl()) as kvs_writer:
+            for site, poes in izip(sites, poes_list):
+                curve_key = kvs.tokens.hazard_curve_poes_key(
+                    self.job_id, realization, site)
 
-            kvs.set(curve_key, poes)
+                kvs_writer.set_value_array(curve_key, json.loads(poes))
 
-            curve_keys.append(curve_key)
+                curve_keys.append(curve_key)
 
         return curve_keys
 
@@ -804,6 +896,8 @@ class EventBasedMixin(BasePSHAMixin):
                 java.jclass("Random")(seed),
                 jpype.JBoolean(correlate))
 
+        kvs.register_job_keys([key])
+
 
 job.HazJobMixin.register("Event Based", EventBasedMixin, order=0)
 job.HazJobMixin.register("Classical", ClassicalMixin, order=1)
@@ -54,8 +54,7 @@ def generate_erf(job_id):
     # TODO(JM): implement real ERF computation
 
     check_job_status(job_id)
-    kvs.get_client().set(kvs.tokens.erf_key(job_id),
-                         json.JSONEncoder().encode([job_id]))
+    kvs.set(kvs.tokens.erf_key(job_id), json.JSONEncoder().encode([job_id]))
 
     return job_id
 
@@ -20,20 +20,40 @@
 
 """Serializer to save exposure data to the database"""
 
+import logging
+
 from openquake.db import models
+from openquake.utils.db import copy_rows
+from django.db import connections
 from django.db import router
 from django.db import transaction
 
+LOGGER = logging.getLogger('exposure-serializer')
+
+# the number of assets loaded with a single COPY command
+COPY_BATCH_SIZE = 10000
+
+# the exposure_data columns filled by the COPY command
+COPY_COLUMNS = ('exposure_model_id', 'asset_ref', 'value', 'vf_ref',
+                'structure_type', 'retrofitting_cost', 'site')
+
 
 class ExposureDBWriter(object):
     """
     Serialize the exposure model to database
     """
 
-    def __init__(self, owner):
-        """Create a new serializer for the specified user"""
+    def __init__(self, owner, batch_size=None):
+        """Create a new serializer for the specified user
+
+        :param batch_size: the number of assets loaded with a single
+            COPY command, defaults to :py:data:`COPY_BATCH_SIZE`
+        :type batch_size: int
+        """
         self.model = None
         self.owner = owner
+        self.batch_size = batch_size or COPY_BATCH_SIZE
+        self.count = 0
 
     @transaction.commit_on_success(router.db_for_write(models.ExposureModel))
     def serialize(self, iterator):
@@ -41,10 +61,39 @@ class ExposureDBWriter(object):
         Serialize a list of values produced by
         :class:`openquake.parser.exposure.ExposurePortfolioFile`
 
+        The assets are streamed to the database with ``COPY FROM STDIN``,
+        `batch_size` assets at a time, in a single transaction.
+
         :type iterator: any iterable
         """
+        rows = []
+
         for point, values in iterator:
-            self.insert_datum(point, values)
+            if not self.model:
+                self.insert_model(values)
+
+            rows.append(self._copy_row(point, values))
+
+            if len(rows) >= self.batch_size:
+                self._copy(rows)
+                rows = []
+
+        if rows:
+            self._copy(rows)
+
+    def insert_model(self, values):
+        """
+        Insert the main exposure model entry.
+
+        :param values: dictionary of values (see
+            :class:`openquake.parser.exposure.ExposurePortfolioFile`)
+        """
+        self.model = models.ExposureModel(
+            owner=self.owner,
+            description=values.get('listDescription'),
+            category=values['assetCategory'],
+            unit=values['assetValueUnit'])
+        self.model.save()
 
     def insert_datum(self, point, values):
         """
@@ -60,12 +109,7 @@ class ExposureDBWriter(object):
         present,
         """
         if not self.model:
-            self.model = models.ExposureModel(
-                owner=self.owner,
-                description=values.get('listDescription'),
-                category=values['assetCategory'],
-                unit=values['assetValueUnit'])
-            self.model.save()
+            self.insert_model(values)
 
         data = models.ExposureData(
             exposure_model=self.model, asset_ref=values['assetID'],
@@ -75,3 +119,24 @@ class ExposureDBWriter(object):
             site="POINT(%s %s)" % (point.point.x, point.point.y),
             retrofitting_cost=None)
         data.save()
+
+    def _copy_row(self, point, values):
+        """Return the asset as a row of :py:data:`COPY_COLUMNS` values, the
+        site is in EWKT."""
+        return (self.model.id, values['assetID'], float(values['assetValue']),
+                values['vulnerabilityFunctionReference'],
+                values['structureCategory'], None,
+                "SRID=4326;POINT(%r %r)" % (point.point.x, point.point.y))
+
+    def _copy(self, rows):
+        """Load the given rows into the exposure_data table."""
+        alias = router.db_for_write(models.ExposureData)
+
+        # pylint: disable=W0212
+        copy_rows(connections[alias].cursor(),
+                  '"%s"' % models.ExposureData._meta.db_table,
+                  COPY_COLUMNS, rows)
+        transaction.set_dirty(using=alias)
+
+        self.count += len(rows)
+        LOGGER.info("%s assets loaded" % self.count)
@@ -34,6 +34,7 @@ from openquake import kvs
 from openquake import logs
 from openquake import OPENQUAKE_ROOT
 from openquake import shapes
+from openquake import signalling
 from openquake.db.models import OqJob, OqParams, OqUser
 from openquake.supervising import supervisor
 from openquake.job.handlers import resolve_handler
@@ -124,7 +125,8 @@ def run_job(job_file, output_type):
     if is_job_valid[0]:
         a_job.set_status('running')
 
-        spawn_job_supervisor(a_job.job_id, os.getpid())
+        supervised = spawn_job_supervisor(a_job.job_id, os.getpid())
+        outcome = 'failed'
 
         try:
             a_job.launch()
@@ -134,6 +136,17 @@ def run_job(job_file, output_type):
             raise
         else:
             a_job.set_status('succeeded')
+            outcome = 'succeeded'
+        finally:
+            # otherwise the supervisor tells the workers the job is over
+            if not supervised:
+                try:
+                    signalling.signal_job_outcome(a_job.job_id, outcome)
+                # pylint: disable=W0703
+                except Exception, exc:
+                    # keep the outcome (and traceback) of the job itself
+                    LOG.warn("Can't signal the outcome of job %s (%s)"
+                             % (a_job.job_id, exc))
     else:
         a_job.set_status('failed')
 
@@ -456,17 +469,36 @@ class Job(object):
         job.status = status
         job.save()
 
+    def intermediate_key_ttl(self):
+        """
+        The time to live, in seconds, of the intermediate results stored in
+        the KVS (the `KVS_INTERMEDIATE_KEY_TTL` parameter), or `None` if they
+        must be kept until the job is garbage collected.
+        """
+        value = self.params.get("KVS_INTERMEDIATE_KEY_TTL")
+        value = value.strip() if value else None
+        return int(value) if value else None
+
     @property
     def region(self):
         """Compute valid region with appropriate cell size from config file."""
         if not self.has('REGION_VERTEX'):
             return None
 
-        region = shapes.RegionConstraint.from_coordinates(
-            self._extract_coords('REGION_VERTEX'))
+        # the region (and its grid) is cached as long as the parameters
+        # it is built from don't change
+        key = (self.params['REGION_VERTEX'],
+               self.params.get('REGION_GRID_SPACING'))
+        cached = getattr(self, '_region', None)
+
+        if cached is None or cached[0] != key:
+            region = shapes.RegionConstraint.from_coordinates(
+                self._extract_coords('REGION_VERTEX'))
 
-        region.cell_size = float(self['REGION_GRID_SPACING'])
-        return region
+            region.cell_size = float(self['REGION_GRID_SPACING'])
+            cached = self._region = (key, region)
+
+        return cached[1]
 
     @property
     def super_config_path(self):
@@ -528,7 +560,6 @@ class Job(object):
     def _slurp_files(self):
         """Read referenced files and write them into kvs, keyed on their
         sha1s."""
-        kvs_client = kvs.get_client()
         if self.base_path is None:
             LOG.debug("Can't slurp files without a base path, homie...")
             return
@@ -539,7 +570,7 @@ class Job(object):
                     LOG.debug("Slurping %s" % path)
                     blob = data_file.read()
                     file_key = kvs.tokens.generate_blob_key(self.job_id, blob)
-                    kvs_client.set(file_key, blob)
+                    kvs.set(file_key, blob)
                     self.params[key] = file_key
                     self.params[key + "_PATH"] = path
 
@@ -577,11 +608,7 @@ class Job(object):
 
     def _sites_for_region(self):
         """Return the list of sites for the region at hand."""
-        region = shapes.Region.from_coordinates(
-            self._extract_coords('REGION_VERTEX'))
-
-        region.cell_size = float(self.params['REGION_GRID_SPACING'])
-        return [site for site in region]
+        return self.region.sites
 
     def build_nrml_path(self, nrml_file):
         """Return the complete output path for the given nrml_file"""
@@ -24,10 +24,13 @@ the underlying kvs systems.
 
 import json
 import numpy
+import struct
 
 from openquake import logs
 from openquake.kvs import tokens
+from openquake.kvs.memory import MemoryKVS
 from openquake.kvs.redis import Redis
+from openquake.utils import config
 
 
 LOG = logs.LOG
@@ -37,6 +40,25 @@ INTERNAL_ID_SEPARATOR = ':'
 MAX_LENGTH_RANDOM_ID = 36
 SITES_KEY_TOKEN = "sites"
 
+# the KVS backends that can be selected with the `backend` parameter in the
+# `kvs` section of the configuration
+BACKENDS = {"redis": Redis, "memory": MemoryKVS}
+DEFAULT_BACKEND = "redis"
+DEFAULT_BULK_WRITE_CHUNK_SIZE = 1000
+# maximum number of keys deleted with a single command by cache_gc()
+GC_BATCH_SIZE = 1000
+
+# Binary format used to store numeric arrays in the KVS: a fixed header
+# (magic, format version, type code, number of dimensions) followed by one
+# unsigned 32 bit integer per dimension and the raw little-endian float64
+# values. The magic can never be the first bytes of a JSON document, so
+# readers can tell the two formats apart.
+ARRAY_FORMAT_MAGIC = '\x93OQA'
+ARRAY_FORMAT_VERSION = 1
+ARRAY_TYPE_CODE = 'd'
+_ARRAY_HEADER = struct.Struct('<4sBcB')
+_ARRAY_DTYPE = numpy.dtype('<f8')
+
 
 def flush():
     """Flush (delete) all the values stored in the underlying kvs system."""
@@ -61,16 +83,33 @@ def mget(keys):
 
 def mget_decoded(keys):
     """
-    Retrieve multiple JSON values from the KVS
+    Retrieve multiple JSON or binary array values from the KVS
 
     :param keys: keys to retrieve (the corresponding value must be a
-        JSON string)
+        JSON string or an array stored with :py:func:`set_value_array`)
     :type keys: list
-    :returns: one value for each key in the list
+    :returns: one value for each key in the list, arrays are returned as
+        (nested) lists of floats
+    """
+    decoder = json.JSONDecoder()
+
+    return [_decode_value(value, decoder) for value in get_client().mget(keys)]
+
+
+def mget_array(keys):
+    """
+    Retrieve multiple numeric arrays from the KVS.
+
+    :param keys: keys to retrieve (the corresponding value must be an array
+        stored with :py:func:`set_value_array` or a JSON list of numbers)
+    :type keys: list
+    :returns: one :py:class:`numpy.ndarray` (or None, for missing keys) for
+        each key in the list
     """
     decoder = json.JSONDecoder()
 
-    return [decoder.decode(value) for value in get_client().mget(keys)]
+    return [_decode_array_value(value, decoder)
+            for value in get_client().mget(keys)]
 
 
 def get_pattern(regexp):
@@ -97,7 +136,7 @@ def get_pattern_decoded(regexp):
     decoder = json.JSONDecoder()
 
     for value in get_pattern(regexp):
-        decoded_values.append(decoder.decode(value))
+        decoded_values.append(_decode_value(value, decoder))
 
     return decoded_values
 
@@ -108,18 +147,29 @@ def get(key):
 
 
 def get_client(**kwargs):
-    """possible kwargs:
+    """Return a client for the KVS backend selected in the configuration.
+
+    possible kwargs:
         db: database identifier
     """
-    return Redis(**kwargs)
+    backend = config.get("kvs", "backend") or DEFAULT_BACKEND
+
+    if backend not in BACKENDS:
+        raise ValueError("unknown KVS backend '%s', valid backends are: %s"
+                         % (backend, ", ".join(sorted(BACKENDS))))
+
+    return BACKENDS[backend](**kwargs)
 
 
 def get_value_json_decoded(key):
-    """ Get value from kvs and json decode """
+    """ Get value from kvs and json decode
+
+    Values stored with :py:func:`set_value_array` are understood as well and
+    returned as (nested) lists of floats.
+    """
     try:
         value = get_client().get(key)
-        decoder = json.JSONDecoder()
-        return decoder.decode(value)
+        return _decode_value(value, json.JSONDecoder())
     except (TypeError, ValueError), e:
         print "Key was %s" % key
         print e
@@ -153,27 +203,278 @@ class NumpyAwareJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def set_value_json_encoded(key, value):
-    """ Encode value and set in kvs """
+def set_value_json_encoded(key, value, ttl=None):
+    """ Encode value and set in kvs
+
+    :param ttl: optional time to live of the key, in seconds
+    :type ttl: int
+    """
     encoder = NumpyAwareJSONEncoder()
 
     try:
         encoded_value = encoder.encode(value)
-        get_client().set(key, encoded_value)
     except (TypeError, ValueError):
         raise ValueError("cannot encode value %s of type %s to JSON"
                          % (value, type(value)))
 
+    return set(key, encoded_value, ttl)
+
+
+def encode_array(values):
+    """
+    Encode a numeric array in the KVS binary array format.
+
+    :param values: the values to encode, anything that can be converted
+        to a float64 :py:class:`numpy.ndarray`
+    :returns: the encoded value
+    :rtype: string
+    """
+    values = numpy.asarray(values, dtype=_ARRAY_DTYPE)
+
+    header = _ARRAY_HEADER.pack(ARRAY_FORMAT_MAGIC, ARRAY_FORMAT_VERSION,
+                                ARRAY_TYPE_CODE, values.ndim)
+    shape = struct.pack('<%dI' % values.ndim, *values.shape)
+
+    return header + shape + values.tostring()
+
+
+def is_encoded_array(value):
+    """Return True if the given raw KVS value is a binary encoded array."""
+    return isinstance(value, str) and value.startswith(ARRAY_FORMAT_MAGIC)
+
+
+def decode_array(value):
+    """
+    Decode a value encoded with :py:func:`encode_array`.
+
+    :param value: the raw KVS value
+    :type value: string
+    :returns: the decoded array
+    :rtype: :py:class:`numpy.ndarray` of float64
+    """
+    if not is_encoded_array(value):
+        raise ValueError("value is not a binary encoded array")
+
+    _, version, type_code, ndim = _ARRAY_HEADER.unpack_from(value)
+
+    if version != ARRAY_FORMAT_VERSION or type_code != ARRAY_TYPE_CODE:
+        raise ValueError("unsupported binary array format (version %s, "
+                         "type %s)" % (version, type_code))
+
+    offset = _ARRAY_HEADER.size
+    shape = struct.unpack_from('<%dI' % ndim, value, offset)
+    offset += struct.calcsize('<%dI' % ndim)
+
+    return numpy.fromstring(value[offset:], dtype=_ARRAY_DTYPE).reshape(shape)
+
+
+def _decode_value(value, decoder):
+    """Decode a raw KVS value, either JSON or a binary encoded array."""
+    if is_encoded_array(value):
+        return decode_array(value).tolist()
+
+    return decoder.decode(value)
+
+
+def _decode_array_value(value, decoder):
+    """Decode a raw KVS value, either JSON or a binary encoded array, to
+    a :py:class:`numpy.ndarray`."""
+    if value is None:
+        return None
+
+    if is_encoded_array(value):
+        return decode_array(value)
+
+    return numpy.array(decoder.decode(value), dtype=_ARRAY_DTYPE)
+
+
+def get_value_array(key):
+    """
+    Get a numeric array from the KVS.
+
+    :param key: the KVS key
+    :type key: string
+    :returns: the array stored under the given key, or None if the key
+        does not exist
+    :rtype: :py:class:`numpy.ndarray` of float64
+    """
+    return _decode_array_value(get_client().get(key), json.JSONDecoder())
+
+
+def set_value_array(key, values, ttl=None):
+    """
+    Store a numeric array in the KVS using the binary array format.
+
+    Unlike :py:func:`set_value_json_encoded` the floats are stored as raw
+    little-endian float64 values, with no string conversion.
+
+    :param key: the KVS key
+    :type key: string
+    :param values: the values to store
+    :type values: :py:class:`numpy.ndarray` or (nested) list of floats
+    :param ttl: optional time to live of the key, in seconds
+    :type ttl: int
+    """
+    return set(key, encode_array(values), ttl)
+
+
+def set(key, encoded_value, ttl=None):  # pylint: disable=W0622
+    """ Set value in kvs, for objects that have their own encoding method.
+
+    :param ttl: optional time to live of the key, in seconds
+    :type ttl: int
+    """
+    pipe = get_client().pipeline(transaction=False)
+    pipe.set(key, encoded_value)
+    _track_keys(pipe, [key], ttl)
+    pipe.execute()
+
     return True
 
 
-def set(key, encoded_value):  # pylint: disable=W0622
-    """ Set value in kvs, for objects that have their own encoding method. """
+def rpush(key, encoded_value):
+    """ Append a value, that has already been encoded, to a kvs list. """
+    pipe = get_client().pipeline(transaction=False)
+    pipe.rpush(key, encoded_value)
+    _track_keys(pipe, [key])
+    pipe.execute()
 
-    get_client().set(key, encoded_value)
     return True
 
 
+def register_job_keys(keys):
+    """
+    Make keys written without the functions of this module (e.g. by the
+    Java side) known to :py:func:`cache_gc`.
+
+    :param keys: the KVS keys
+    :type keys: list of strings
+    """
+    pipe = get_client().pipeline(transaction=False)
+    _track_keys(pipe, keys)
+    pipe.execute()
+
+
+def delete_job_keys(keys):
+    """
+    Delete keys before the job they belong to completes, dropping them from
+    the index used by :py:func:`cache_gc`.
+
+    :param keys: the KVS keys
+    :type keys: list of strings
+    """
+    pipe = get_client().pipeline(transaction=False)
+    pipe.delete(*keys)
+
+    for key in keys:
+        job_id = tokens.job_id_from_key(key)
+
+        if job_id is not None:
+            pipe.srem(tokens.job_keys_index_key(job_id), key)
+
+    pipe.execute()
+
+
+def _track_keys(pipe, keys, ttl=None):
+    """
+    Queue on a pipeline the commands needed to garbage collect the given keys.
+
+    Keys with a time to live expire on their own, the others are added to the
+    index set of the job they belong to (if any), so that they can be deleted
+    by :py:func:`cache_gc`.
+    """
+    for key in keys:
+        if ttl:
+            pipe.expire(key, ttl)
+        else:
+            job_id = tokens.job_id_from_key(key)
+
+            if job_id is not None:
+                pipe.sadd(tokens.job_keys_index_key(job_id), key)
+
+
+def bulk_write_chunk_size():
+    """
+    Return the maximum number of values sent to the KVS in a single
+    :py:class:`BulkWriter` round-trip, as set by the `bulk_write_chunk_size`
+    parameter in the `kvs` section of the configuration.
+    """
+    value = config.get("kvs", "bulk_write_chunk_size")
+    return int(value) if value else DEFAULT_BULK_WRITE_CHUNK_SIZE
+
+
+class BulkWriter(object):
+    """
+    Queue KVS writes and send them in batches, with a single MSET command
+    (one network round-trip) for every `chunk_size` values.
+
+    Values are flushed automatically when `chunk_size` writes are pending,
+    by calling :py:meth:`flush` or when leaving a `with` block::
+
+        with kvs.BulkWriter() as writer:
+            for site, curve in curves:
+                writer.set_value_array(key_for(site), curve)
+    """
+
+    def __init__(self, chunk_size=None, ttl=None):
+        """
+        :param chunk_size: the maximum number of values written with a
+            single command, defaults to :py:func:`bulk_write_chunk_size`
+        :type chunk_size: int
+        :param ttl: optional time to live of the written keys, in seconds
+        :type ttl: int
+        """
+        self.chunk_size = chunk_size or bulk_write_chunk_size()
+        self.ttl = ttl
+        self.pending = []
+        self.round_trips = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def set(self, key, encoded_value):  # pylint: disable=W0622
+        """Queue a value that has already been encoded."""
+        self.pending.append((key, encoded_value))
+
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def set_value_json_encoded(self, key, value):
+        """Queue a value, encoded as JSON."""
+        try:
+            encoded_value = NumpyAwareJSONEncoder().encode(value)
+        except (TypeError, ValueError):
+            raise ValueError("cannot encode value %s of type %s to JSON"
+                             % (value, type(value)))
+
+        self.set(key, encoded_value)
+
+    def set_value_array(self, key, values):
+        """Queue a numeric array, encoded with :py:func:`encode_array`."""
+        self.set(key, encode_array(values))
+
+    def flush(self):
+        """Write all the pending values to the KVS."""
+        client = get_client()
+
+        for start in xrange(0, len(self.pending), self.chunk_size):
+            chunk = dict(self.pending[start:start + self.chunk_size])
+
+            # later writes to the same key win, as with sequential SETs
+            pipe = client.pipeline(transaction=False)
+            pipe.mset(chunk)
+            _track_keys(pipe, chunk.keys(), self.ttl)
+            pipe.execute()
+
+            self.round_trips += 1
+
+        self.pending = []
+
+
 def _prefix_id_generator(prefix):
     """Generator for IDs with a specific prefix (prefix + sequence number)."""
 
@@ -218,8 +519,14 @@ def current_jobs():
 
 def cache_gc(job_id):
     """
-    Garbage collection for the KVS. This works by simply removing all keys
-    which contain the input job key.
+    Garbage collection for the KVS. This works by removing all the keys
+    in the index set of the given job (see
+    :py:func:`openquake.kvs.tokens.job_keys_index_key`), in batches of
+    :py:data:`GC_BATCH_SIZE` keys, so that the KVS server is never blocked
+    for long and other jobs can keep running.
+
+    Keys written with a time to live are not in the index and expire on their
+    own.
 
     The job key must be a member of the 'CURRENT_JOBS' set. If it isn't, this
     function will do nothing and simply return None.
@@ -235,9 +542,19 @@ def cache_gc(job_id):
     if client.sismember(tokens.CURRENT_JOBS, job_id):
         # matches a current job
         # do the garbage collection
-        keys = client.keys('*%s*' % tokens.generate_job_key(job_id))
+        index_key = tokens.job_keys_index_key(job_id)
+        deleted = 0
+
+        while True:
+            pipe = client.pipeline(transaction=False)
 
-        if len(keys) > 0:
+            for _ in xrange(GC_BATCH_SIZE):
+                pipe.spop(index_key)
+
+            keys = [key for key in pipe.execute() if key is not None]
+
+            if not keys:
+                break
 
             success = client.delete(*keys)
             # delete should return True
@@ -246,14 +563,16 @@ def cache_gc(job_id):
                 LOG.error(msg)
                 raise RuntimeError(msg)
 
+            deleted += len(keys)
+
         # finally, remove the job key from CURRENT_JOBS
         client.srem(tokens.CURRENT_JOBS, job_id)
 
         msg = 'KVS garbage collection removed %s keys for job %s'
-        msg %= (len(keys), job_id)
+        msg %= (deleted, job_id)
         LOG.info(msg)
 
-        return len(keys)
+        return deleted
     else:
         # does not match a current job
         msg = 'KVS garbage collection was called with an invalid job key: ' \
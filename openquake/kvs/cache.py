@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+"""
+Process-local cache for the immutable per-job artifacts that are read from
+the KVS (and usually deserialized) over and over by the tasks running in
+a worker process.
+"""
+
+from openquake.utils import config
+
+
+DEFAULT_MAX_ENTRIES = 8
+
+
+def max_entries():
+    """
+    Return the maximum number of entries held by :py:data:`JOB_CACHE`, as
+    set by the `job_cache_size` parameter in the `kvs` section of the
+    configuration.
+    """
+    value = config.get("kvs", "job_cache_size")
+    return int(value) if value else DEFAULT_MAX_ENTRIES
+
+
+class JobCache(object):
+    """
+    A bounded read-through cache, keyed by job id and key.
+
+    When full, the least recently used entry is evicted. The entries of a job
+    must be dropped with :py:meth:`invalidate` when the job finishes.
+    """
+
+    def __init__(self, size=None):
+        """
+        :param size: the maximum number of entries, defaults to
+            :py:func:`max_entries`
+        :type size: int
+        """
+        self.size = size or max_entries()
+        self.entries = {}
+        # least recently used first
+        self.usage = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, job_id, key, load):
+        """
+        Return the value cached for the given job and key, calling `load`
+        to compute it on a miss.
+
+        :param job_id: the id of the job the value belongs to
+        :type job_id: int
+        :param key: the key of the value, any hashable object
+        :param load: computes the value when it's not in the cache
+        :type load: a callable without parameters
+        """
+        cache_key = (str(job_id), key)
+
+        if cache_key in self.entries:
+            self.hits += 1
+            self.usage.remove(cache_key)
+            self.usage.append(cache_key)
+
+            return self.entries[cache_key]
+
+        self.misses += 1
+        value = load()
+
+        if len(self.usage) >= self.size:
+            del self.entries[self.usage.pop(0)]
+
+        self.entries[cache_key] = value
+        self.usage.append(cache_key)
+
+        return value
+
+    def invalidate(self, job_id):
+        """Drop all the entries of the given job."""
+        job_id = str(job_id)
+
+        for cache_key in [k for k in self.usage if k[0] == job_id]:
+            del self.entries[cache_key]
+            self.usage.remove(cache_key)
+
+    def clear(self):
+        """Drop all the entries and reset the counters."""
+        self.entries = {}
+        self.usage = []
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        :returns: the number of hits, misses and cached entries
+        :rtype: dict
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    entries=len(self.entries))
+
+
+# the cache shared by all the tasks running in this process
+JOB_CACHE = JobCache()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+"""
+A pure-Python, in-process KVS backend.
+
+It implements the subset of the Redis commands used by OpenQuake, with the
+same semantics (values are stored as strings, lists and sets), so that
+single-process runs and unit tests don't need a Redis server.
+
+Data written here is not visible to other processes: the Java side and
+remote celery workers still need the Redis backend.
+"""
+
+import fnmatch
+import time
+
+
+WRONG_TYPE_MSG = "Operation against a key holding the wrong kind of value"
+
+
+def _encode(value):
+    """Convert a value to a string, like the Redis client does."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    return str(value)
+
+
+class MemoryKVS(object):
+    """ A Borg-style in-memory store with a Redis-like interface. """
+    __shared_state = {}
+
+    def __new__(cls, **kwargs):  # pylint: disable=W0613
+        self = object.__new__(cls)
+        self.__dict__ = cls.__shared_state
+        return self
+
+    def __init__(self, **kwargs):  # pylint: disable=W0613
+        if not self.__dict__:
+            self.data = {}
+            # expiry time (as returned by time.time()) of the keys with a TTL
+            self.expiry = {}
+            self.commands_processed = 0
+
+    def _live(self, key):
+        """Drop the given key if it has expired, return the key."""
+        key = _encode(key)
+        expiry = self.expiry.get(key)
+
+        if expiry is not None and expiry <= time.time():
+            del self.expiry[key]
+            self.data.pop(key, None)
+
+        self.commands_processed += 1
+        return key
+
+    def _typed(self, key, type_, create=False):
+        """Return the value of the given key, checking its type."""
+        key = self._live(key)
+        value = self.data.get(key)
+
+        if value is None:
+            if not create:
+                return None
+
+            value = self.data[key] = type_()
+
+        if not isinstance(value, type_):
+            raise ValueError(WRONG_TYPE_MSG)
+
+        return value
+
+    # keys
+
+    def exists(self, key):
+        """ Return True if the key exists """
+        return self._live(key) in self.data
+
+    def delete(self, *keys):
+        """ Delete the given keys, return the number of deleted keys """
+        deleted = 0
+
+        for key in keys:
+            key = self._live(key)
+
+            if key in self.data:
+                del self.data[key]
+                self.expiry.pop(key, None)
+                deleted += 1
+
+        return deleted
+
+    def keys(self, pattern='*'):
+        """ Return the keys matching the given glob-style pattern """
+        return [key for key in list(self.data)
+                if fnmatch.fnmatchcase(self._live(key), pattern)
+                and key in self.data]
+
+    def expire(self, key, seconds):
+        """ Set a time to live on the given key """
+        key = self._live(key)
+
+        if key not in self.data:
+            return False
+
+        self.expiry[key] = time.time() + int(seconds)
+        return True
+
+    def ttl(self, key):
+        """ Return the remaining time to live of the key, in seconds """
+        key = self._live(key)
+
+        if key not in self.expiry:
+            return None
+
+        return int(round(self.expiry[key] - time.time()))
+
+    def flushdb(self):
+        """ Delete all the keys """
+        self.data.clear()
+        self.expiry.clear()
+        return True
+
+    flushall = flushdb
+
+    def info(self):
+        """ A subset of the Redis server information """
+        return {'total_commands_processed': self.commands_processed,
+                'db0': {'keys': len(self.data)}}
+
+    # strings
+
+    def get(self, key):
+        """ Return the value of the key, or None """
+        return self._typed(key, str)
+
+    def set(self, key, value):  # pylint: disable=W0622
+        """ Set the value of the key """
+        key = self._live(key)
+        self.data[key] = _encode(value)
+        self.expiry.pop(key, None)
+        return True
+
+    def mget(self, keys, *args):
+        """ Return the values of the given keys """
+        if isinstance(keys, basestring):
+            keys = [keys]
+
+        return [self.get(key) for key in list(keys) + list(args)]
+
+    def mset(self, mapping):
+        """ Set the values of multiple keys """
+        for key, value in mapping.iteritems():
+            self.set(key, value)
+
+        return True
+
+    def get_multi(self, keys):
+        """ Return value of multiple keys identically to the kvs way """
+        return dict(zip(keys, self.mget(keys)))
+
+    # lists
+
+    def rpush(self, key, value):
+        """ Append a value to a list, return the length of the list """
+        values = self._typed(key, list, create=True)
+        values.append(_encode(value))
+        return len(values)
+
+    def lrange(self, key, start, end):
+        """ Return a range of a list, `end` included """
+        values = self._typed(key, list) or []
+        end = len(values) if end == -1 else end + 1
+        return values[start:end]
+
+    def llen(self, key):
+        """ Return the length of a list """
+        return len(self._typed(key, list) or [])
+
+    def lpop(self, key):
+        """ Remove and return the first element of a list """
+        values = self._typed(key, list)
+
+        if not values:
+            return None
+
+        value = values.pop(0)
+
+        if not values:
+            self.delete(key)
+
+        return value
+
+    def blpop(self, keys, timeout=0):
+        """
+        Remove and return the first element of the first non-empty list, as
+        a ``(key, value)`` tuple, waiting up to `timeout` seconds (0 for no
+        limit) for one to be pushed; return None on timeout.
+        """
+        if isinstance(keys, basestring):
+            keys = [keys]
+
+        deadline = time.time() + timeout
+
+        while True:
+            for key in keys:
+                value = self.lpop(key)
+
+                if value is not None:
+                    return _encode(key), value
+
+            if timeout and time.time() >= deadline:
+                return None
+
+            time.sleep(0.01)
+
+    # sets
+
+    def sadd(self, key, member):
+        """ Add a member to a set, return True if it wasn't already there """
+        members = self._typed(key, set, create=True)
+        member = _encode(member)
+
+        if member in members:
+            return False
+
+        members.add(member)
+        return True
+
+    def srem(self, key, member):
+        """ Remove a member from a set """
+        members = self._typed(key, set) or set()
+        member = _encode(member)
+
+        if member not in members:
+            return False
+
+        members.remove(member)
+
+        if not members:
+            self.delete(key)
+
+        return True
+
+    def smembers(self, key):
+        """ Return the members of a set """
+        return set(self._typed(key, set) or set())
+
+    def sismember(self, key, member):
+        """ Return True if the member is in the set """
+        return _encode(member) in (self._typed(key, set) or set())
+
+    def spop(self, key):
+        """ Remove and return an arbitrary member of a set """
+        members = self._typed(key, set)
+
+        if not members:
+            return None
+
+        member = members.pop()
+
+        if not members:
+            self.delete(key)
+
+        return member
+
+    def pipeline(self, transaction=True):  # pylint: disable=W0613
+        """ Return a pipeline, commands are run when it's executed """
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline(object):
+    """ Queue commands for a :py:class:`MemoryKVS` until executed. """
+
+    def __init__(self, kvs):
+        self.kvs = kvs
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.kvs, name)
+
+        def queue(*args, **kwargs):
+            """ Queue the command, return the pipeline for chaining """
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        """ Run the queued commands, return their results """
+        commands, self.commands = self.commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
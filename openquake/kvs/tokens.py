@@ -50,6 +50,8 @@ VULNERABILITY_CURVE_KEY_TOKEN = 'VULNERABILITY_CURVE'
 
 
 CURRENT_JOBS = 'CURRENT_JOBS'
+JOB_KEYS_TOKEN = 'KEYS'
+TASKSET_DONE_TOKEN = 'TASKSET_DONE'
 
 
 def _generate_key(job_id, type_, *parts):
@@ -92,6 +94,42 @@ def generate_job_key(job_id):
     return JOB_KEY_FMT % job_id
 
 
+def job_id_from_key(kvs_key):
+    """
+    Extract the job id from a KVS key built with the functions in this
+    module.
+
+    :param kvs_key: the KVS key
+    :type kvs_key: string
+    :returns: the job id (as a string) or None if the key doesn't belong to
+        a job
+    """
+    prefix, _, _ = JOB_KEY_FMT.partition('%s')
+
+    if not kvs_key.startswith(prefix):
+        return None
+
+    job_id, found, _ = kvs_key[len(prefix):].partition('::')
+
+    return job_id if found else None
+
+
+def job_keys_index_key(job_id):
+    """
+    Return the key of the set used to keep track of all the KVS keys
+    of the given job, see :py:func:`openquake.kvs.cache_gc`.
+    """
+    return _generate_key(job_id, JOB_KEYS_TOKEN)
+
+
+def taskset_done_key(taskset_id):
+    """
+    Return the key of the list the workers push the completion of the
+    subtasks of a task set to, see :py:mod:`openquake.utils.tasks`.
+    """
+    return _KVS_KEY_SEPARATOR.join([TASKSET_DONE_TOKEN, str(taskset_id)])
+
+
 def generate_blob_key(job_id, blob):
     """ Return the KVS key for a binary blob """
     return _generate_key(job_id, 'blob', hashlib.sha1(blob).hexdigest())
@@ -102,19 +140,27 @@ def vuln_key(job_id):
     return _generate_key(job_id, "VULN_CURVES")
 
 
-def asset_key(job_id, row, col):
-    """ Return an asset key """
-    return _generate_key(job_id, EXPOSURE_KEY_TOKEN, row, col)
+def block_assets_key(job_id, block_id):
+    """ Return the KVS key for the assets of the given block """
+    return _generate_key(job_id, EXPOSURE_KEY_TOKEN, block_id)
 
 
-def source_model_key(job_id):
-    """ Return the KVS key for the source model of the given job"""
-    return _generate_key(job_id, SOURCE_MODEL_TOKEN)
+def source_model_key(job_id, realization=None):
+    """ Return the KVS key for the source model of the given job (and
+    logic tree realization, if any)"""
+    if realization is None:
+        return _generate_key(job_id, SOURCE_MODEL_TOKEN)
 
+    return _generate_key(job_id, SOURCE_MODEL_TOKEN, realization)
 
-def gmpe_key(job_id):
-    """ Return the KVS key for the GMPE of the given job"""
-    return _generate_key(job_id, GMPE_TOKEN)
+
+def gmpe_key(job_id, realization=None):
+    """ Return the KVS key for the GMPE of the given job (and logic tree
+    realization, if any)"""
+    if realization is None:
+        return _generate_key(job_id, GMPE_TOKEN)
+
+    return _generate_key(job_id, GMPE_TOKEN, realization)
 
 
 def stochastic_set_key(job_id, history, realization):
@@ -132,21 +178,6 @@ def mgm_key(job_id, block_id, site_id):
     return _generate_key(job_id, MGM_KEY_TOKEN, block_id, site_id)
 
 
-def asset_row_col_from_kvs_key(kvs_key):
-    """
-    Extract row and column from a key of type EXPOSURE_KEY_TOKEN
-    :param:kvs_key: the key
-    :type:kvs_key: string
-
-    :returns: a tuple (row, col)
-    """
-    assert _kvs_key_type(kvs_key) == EXPOSURE_KEY_TOKEN
-
-    row, col = kvs_key.rsplit(_KVS_KEY_SEPARATOR, 2)[-2:]
-
-    return int(row), int(col)
-
-
 def loss_ratio_key(job_id, row, col, asset_id):
     """ Return a loss ratio key  """
     return _generate_key(job_id, LOSS_RATIO_CURVE_KEY_TOKEN, asset_id,
@@ -29,7 +29,9 @@ all the lxml object model in memory
 due to the fact that curves can be grouped by IDmodel and
 IML. Couldn't find a way to do so writing an object at a
 time without making a restriction to the order on which
-objects are received.
+objects are received. In incremental mode that restriction is made:
+the curves of each branch label must be written one after the other,
+and they are written to file as they are received.
 
 * Hazard maps:
 
@@ -39,9 +41,15 @@ in the base class.
 * Ground Motion Fields (GMFs):
 
 GMFs are serialized per object (=Site) as implemented in the base class.
+
+All the XML writers have an incremental mode, where each node is written to
+file as soon as it's received instead of keeping the whole lxml tree in
+memory (see :py:class:`openquake.output.nrml.IncrementalTreeWriter`).
 """
 
+import functools
 import logging
+from django.db import router
 from lxml import etree
 
 from openquake.db import models
@@ -49,6 +57,8 @@ from openquake.db import models
 from openquake import job
 from openquake import shapes
 from openquake import writer
+from openquake.output import nrml
+from openquake.utils import db
 from openquake.utils import round_float
 from openquake.xml import NSMAP, NRML, GML, NSMAP_WITH_QUAKEML
 
@@ -67,14 +77,17 @@ SRS_EPSG_4326 = 'epsg:4326'
 class HazardCurveXMLWriter(writer.FileWriter):
     """This class writes an hazard curve into the NRML format."""
 
-    def __init__(self, path):
+    def __init__(self, path, incremental=False):
         writer.FileWriter.__init__(self, path)
 
         self.nrml_el = None
         self.result_el = None
         self.curves_per_branch_label = {}
+        self.last_branch_label = None
         self.hcnode_counter = 0
         self.hcfield_counter = 0
+        self.incremental = incremental
+        self.tree_writer = None
 
     def close(self):
         """Override the default implementation writing all the
@@ -85,8 +98,11 @@ class HazardCurveXMLWriter(writer.FileWriter):
                         "a valid output!"
             raise RuntimeError(error_msg)
 
-        self.file.write(etree.tostring(self.nrml_el, pretty_print=True,
-            xml_declaration=True, encoding="UTF-8"))
+        if self.tree_writer is not None:
+            self.tree_writer.finish()
+        else:
+            self.file.write(etree.tostring(self.nrml_el, pretty_print=True,
+                xml_declaration=True, encoding="UTF-8"))
 
         writer.FileWriter.close(self)
 
@@ -125,6 +141,10 @@ class HazardCurveXMLWriter(writer.FileWriter):
             _set_optional_attributes(hazard_processing_el, values,
                 ('investigationTimeSpan', 'IDmodel', 'saPeriod', 'saDamping'))
 
+            if self.incremental:
+                self.tree_writer = nrml.IncrementalTreeWriter(
+                    self.file, self.nrml_el)
+
         # check if we have hazard curves for an end branch label, or
         # for mean/median/quantile
         if 'endBranchLabel' in values and 'statistics' in values:
@@ -142,7 +162,17 @@ class HazardCurveXMLWriter(writer.FileWriter):
 
         if curve_label in self.curves_per_branch_label:
             hazard_curve_field_el = self.curves_per_branch_label[curve_label]
+
+            if hazard_curve_field_el is None:
+                error_msg = "in incremental mode the curves of %s have to " \
+                            "be written one after the other" % curve_label
+                raise ValueError(error_msg)
         else:
+            if self.tree_writer is not None and self.curves_per_branch_label:
+                # the hazardCurveField of the previous label is complete
+                self.tree_writer.close()
+                self.curves_per_branch_label[self.last_branch_label] = None
+
             # nrml:hazardCurveField, needs gml:id
             hazard_curve_field_el = etree.SubElement(self.result_el,
                 "%shazardCurveField" % NRML)
@@ -170,6 +200,10 @@ class HazardCurveXMLWriter(writer.FileWriter):
             iml_el.set("IMT", str(values["IMT"]))
 
             self.curves_per_branch_label[curve_label] = hazard_curve_field_el
+            self.last_branch_label = curve_label
+
+            if self.tree_writer is not None:
+                self.tree_writer.open(hazard_curve_field_el)
 
         # nrml:HCNode, needs gml:id
         hcnode_el = etree.SubElement(hazard_curve_field_el, "%sHCNode" % NRML)
@@ -196,6 +230,9 @@ class HazardCurveXMLWriter(writer.FileWriter):
 
         poe_el.text = " ".join([str(x) for x in values["PoEValues"]])
 
+        if self.tree_writer is not None:
+            self.tree_writer.write(hcnode_el)
+
 
 class HazardMapXMLWriter(writer.XMLFileWriter):
     """This class serializes hazard map information
@@ -232,13 +269,15 @@ class HazardMapXMLWriter(writer.XMLFileWriter):
     HAZARD_MAP_DEFAULT_ID = 'hm'
     HAZARD_MAP_NODE_ID_PREFIX = 'n_'
 
-    def __init__(self, path):
+    def __init__(self, path, incremental=False):
         super(HazardMapXMLWriter, self).__init__(path)
 
         self.hmnode_counter = 0
         self.root_node = None
         self.parent_node = None
         self.hazard_processing_node = None
+        self.incremental = incremental
+        self.tree_writer = None
 
     def write(self, point, val):
         """Writes hazard map for one site.
@@ -282,13 +321,20 @@ class HazardMapXMLWriter(writer.XMLFileWriter):
             self.hazard_map_tag, nsmap=NSMAP)
         self.parent_node.attrib['%sid' % GML] = self.HAZARD_MAP_DEFAULT_ID
 
+        if self.incremental:
+            self.tree_writer = nrml.IncrementalTreeWriter(
+                self.file, self.root_node)
+
     def write_footer(self):
         """Serialize tree to file."""
 
         if self._ensure_all_attributes_set():
-            et = etree.ElementTree(self.root_node)
-            et.write(self.file, pretty_print=True, xml_declaration=True,
-                    encoding="UTF-8")
+            if self.tree_writer is not None:
+                self.tree_writer.finish()
+            else:
+                et = etree.ElementTree(self.root_node)
+                et.write(self.file, pretty_print=True, xml_declaration=True,
+                        encoding="UTF-8")
         else:
             error_msg = "not all required attributes set in hazard curve " \
                         "dataset"
@@ -297,6 +343,18 @@ class HazardMapXMLWriter(writer.XMLFileWriter):
     def _append_node(self, point, val, parent_node):
         """Write HMNode element."""
 
+        # check/set common attributes
+        # TODO(fab): this could be moved to common base class
+        # of all serializers
+        _set_common_attributes(self.PROCESSING_ATTRIBUTES_TO_CHECK,
+                self.hazard_processing_node, val)
+        _set_common_attributes(self.MAP_ATTRIBUTES_TO_CHECK,
+                parent_node, val)
+
+        if (self.tree_writer is not None
+            and not self.tree_writer.is_open(parent_node)):
+            self.tree_writer.open(parent_node)
+
         self.hmnode_counter += 1
         node_node = etree.SubElement(parent_node, self.node_tag, nsmap=NSMAP)
         node_node.attrib["%sid" % GML] = "%s%s" % (
@@ -317,13 +375,8 @@ class HazardMapXMLWriter(writer.XMLFileWriter):
         iml_node = etree.SubElement(node_node, self.iml_tag, nsmap=NSMAP)
         iml_node.text = str(val['IML'])
 
-        # check/set common attributes
-        # TODO(fab): this could be moved to common base class
-        # of all serializers
-        _set_common_attributes(self.PROCESSING_ATTRIBUTES_TO_CHECK,
-                self.hazard_processing_node, val)
-        _set_common_attributes(self.MAP_ATTRIBUTES_TO_CHECK,
-                parent_node, val)
+        if self.tree_writer is not None:
+            self.tree_writer.write(node_node)
 
     def _ensure_all_attributes_set(self):
         """Ensure that all the attributes are set if required."""
@@ -386,7 +439,7 @@ class GMFXMLWriter(writer.XMLFileWriter):
     pos_tag = GML + "pos"
     ground_motion_attr = "groundMotion"
 
-    def __init__(self, path):
+    def __init__(self, path, incremental=False):
         super(GMFXMLWriter, self).__init__(path)
         self.node_counter = 0
 
@@ -396,6 +449,9 @@ class GMFXMLWriter(writer.XMLFileWriter):
         # <nrml/> the root of the document
         self.root_node = None
 
+        self.incremental = incremental
+        self.tree_writer = None
+
     def write(self, point, val):
         """Writes GMF for one site.
 
@@ -453,15 +509,26 @@ class GMFXMLWriter(writer.XMLFileWriter):
 
         _set_gml_id(self.parent_node, GMF_GML_ID)
 
+        if self.incremental:
+            self.tree_writer = nrml.IncrementalTreeWriter(
+                self.file, self.root_node)
+
     def write_footer(self):
         """Write out the file footer."""
-        et = etree.ElementTree(self.root_node)
-        et.write(self.file, pretty_print=True, xml_declaration=True,
-                 encoding="UTF-8")
+        if self.tree_writer is not None:
+            self.tree_writer.finish()
+        else:
+            et = etree.ElementTree(self.root_node)
+            et.write(self.file, pretty_print=True, xml_declaration=True,
+                     encoding="UTF-8")
 
     def _append_site_node(self, point, val, parent_node):
         """Write a single GMFNode element."""
 
+        if (self.tree_writer is not None
+            and not self.tree_writer.is_open(parent_node)):
+            self.tree_writer.open(parent_node)
+
         gmf_node = etree.SubElement(
                 parent_node, GMFXMLWriter.node_tag, nsmap=NSMAP)
 
@@ -485,6 +552,9 @@ class GMFXMLWriter(writer.XMLFileWriter):
 
         self.node_counter += 1
 
+        if self.tree_writer is not None:
+            self.tree_writer.write(gmf_node)
+
 
 def _set_optional_attributes(element, value_dict, attr_keys):
     """Set the attributes for the given element specified
@@ -603,6 +673,8 @@ class HazardMapDBWriter(writer.DBWriter):
 
         self.bulk_inserter = writer.BulkInserter(models.HazardMapData)
         self.hazard_map = None
+        # (minimum, maximum) IML of the items inserted so far
+        self.iml_range = None
 
     def get_output_type(self):
         return "hazard_map"
@@ -610,8 +682,20 @@ class HazardMapDBWriter(writer.DBWriter):
     def serialize(self, iterable):
         self.insert_output(self.get_output_type())
 
-        # get the value for HazardMap from the first value
-        header = iterable[0][1]
+        # the hazard map and the minimum/maximum values are taken from the
+        # items as they are inserted, so that the iterable is read once
+        super(HazardMapDBWriter, self).serialize(iterable)
+
+        # Update the output record with the minimum/maximum values.
+        if self.iml_range is not None:
+            self.output.min_value = round_float(self.iml_range[0])
+            self.output.max_value = round_float(self.iml_range[1])
+
+            self.output.save()
+
+    def _insert_hazard_map(self, header):
+        """Insert the hazard map record, with the values of the first
+        item."""
         self.hazard_map = models.HazardMap(
             output=self.output, poe=header['poE'],
             statistic_type=header['statistics'])
@@ -620,16 +704,6 @@ class HazardMapDBWriter(writer.DBWriter):
 
         self.hazard_map.save()
 
-        # Update the output record with the minimum/maximum values.
-        self.output.min_value = round_float(min(
-            data[1].get("IML") for data in iterable))
-        self.output.max_value = round_float(max(
-            data[1].get("IML") for data in iterable))
-
-        self.output.save()
-
-        super(HazardMapDBWriter, self).serialize(iterable)
-
     def insert_datum(self, point, value):
         """Inserts a single hazard map datum.
 
@@ -645,7 +719,17 @@ class HazardMapDBWriter(writer.DBWriter):
         if isinstance(point, shapes.Site):
             point = point.point
 
+        if self.hazard_map is None:
+            self._insert_hazard_map(value)
+
         value = value.get("IML")
+
+        if self.iml_range is None:
+            self.iml_range = (value, value)
+        else:
+            self.iml_range = (min(self.iml_range[0], value),
+                              max(self.iml_range[1], value))
+
         if value is None:
             LOGGER.warn(
                 "No IML value for position: [%s, %s]" % (point.x, point.y))
@@ -663,19 +747,34 @@ class HazardCurveDBReader(object):
     :func:`HazardCurveXMLWriter.serialize` to produce an XML file.
     """
 
-    def deserialize(self, output_id):  # pylint: disable=R0201
+    def deserialize(self, output_id):
         """
         Read a the given hazard curve from the database.
 
         The structure of the result is documented in
         :class:`HazardCurveDBWriter`.
         """
+        return list(self.stream(output_id))
+
+    def stream(self, output_id, fetch_size=None):  # pylint: disable=R0201
+        """
+        Read the given hazard curve from the database `fetch_size` rows at
+        a time (see :py:func:`openquake.utils.db.iter_rows`).
+
+        :returns: an iterator on the items of the list returned by
+            :py:meth:`deserialize`
+        """
         hazard_curves = models.HazardCurve.objects.filter(output=output_id)
         params = models.Output.objects.get(id=output_id).oq_job.oq_params
-        points = []
 
         for hazard_curve_datum in hazard_curves:
-            hazard_curve_data = hazard_curve_datum.hazardcurvedata_set.all()
+            # pylint: disable=W0212
+            hazard_curve_data = db.iter_rows(
+                router.db_for_read(models.HazardCurveData),
+                "SELECT ST_X(location), ST_Y(location), poes "
+                "FROM \"%s\" WHERE hazard_curve_id = %%s"
+                % models.HazardCurveData._meta.db_table,
+                [hazard_curve_datum.id], fetch_size)
 
             common = {
                 'IMLValues': params.imls,
@@ -690,14 +789,11 @@ class HazardCurveDBReader(object):
             else:
                 common['endBranchLabel'] = hazard_curve_datum.end_branch_label
 
-            for datum in hazard_curve_data:
+            for lon, lat, poes in hazard_curve_data:
                 attrs = common.copy()
-                attrs['PoEValues'] = datum.poes
+                attrs['PoEValues'] = poes
 
-                loc = datum.location
-                points.append((shapes.Site(loc.x, loc.y), attrs))
-
-        return points
+                yield shapes.Site(lon, lat), attrs
 
 
 class HazardCurveDBWriter(writer.DBWriter):
@@ -792,16 +888,26 @@ class GmfDBReader(object):
 
         The structure of the result is documented in :class:`GmfDBWriter`.
         """
-        gmf_data = models.GmfData.objects.filter(output=output_id)
-        points = {}
+        return dict(GmfDBReader.stream(output_id))
 
-        for datum in gmf_data:
-            loc = datum.location
-            points[shapes.Site(loc.x, loc.y)] = {
-                'groundMotion': datum.ground_motion,
-            }
+    @staticmethod
+    def stream(output_id, fetch_size=None):
+        """
+        Read the given ground motion field from the database `fetch_size`
+        rows at a time (see :py:func:`openquake.utils.db.iter_rows`).
 
-        return points
+        :returns: an iterator on the ``(site, values)`` items of the
+            dictionary returned by :py:meth:`deserialize`
+        """
+        # pylint: disable=W0212
+        rows = db.iter_rows(
+            router.db_for_read(models.GmfData),
+            "SELECT ST_X(location), ST_Y(location), ground_motion "
+            "FROM \"%s\" WHERE output_id = %%s"
+            % models.GmfData._meta.db_table, [output_id], fetch_size)
+
+        for lon, lat, ground_motion in rows:
+            yield shapes.Site(lon, lat), {'groundMotion': ground_motion}
 
 
 class GmfDBWriter(writer.DBWriter):
@@ -871,7 +977,8 @@ def create_hazardcurve_writer(job_id, serialize_to, nrml_path):
         :py:class:`output.hazard.HazardCurveDBWriter` instance.
     """
     return _create_writer(job_id, serialize_to, nrml_path,
-                          HazardCurveXMLWriter,
+                          functools.partial(HazardCurveXMLWriter,
+                                            incremental=True),
                           HazardCurveDBWriter)
 
 
@@ -888,7 +995,8 @@ def create_hazardmap_writer(job_id, serialize_to, nrml_path):
         :py:class:`output.hazard.HazardMapDBWriter` instance.
     """
     return _create_writer(job_id, serialize_to, nrml_path,
-                          HazardMapXMLWriter,
+                          functools.partial(HazardMapXMLWriter,
+                                            incremental=True),
                           HazardMapDBWriter)
 
 
@@ -905,5 +1013,5 @@ def create_gmf_writer(job_id, serialize_to, nrml_path):
         :py:class:`output.hazard.GmfDBWriter` instance.
     """
     return _create_writer(job_id, serialize_to, nrml_path,
-                          GMFXMLWriter,
+                          functools.partial(GMFXMLWriter, incremental=True),
                           GmfDBWriter)
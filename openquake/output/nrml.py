@@ -35,6 +35,175 @@ NRML_DEFAULT_ID = 'nrml'
 RISKRESULT_DEFAULT_ID = 'rr'
 HAZARDRESULT_DEFAULT_ID = 'hr'
 
+# tag of the placeholder element used to find where the children of an
+# element start in the serialized tree
+STREAM_SENTINEL_NAME = 'streamSentinel'
+STREAM_SENTINEL_TAG = '%s%s' % (xml.NRML, STREAM_SENTINEL_NAME)
+
+
+class IncrementalTreeWriter(object):
+    """
+    Serialize an lxml tree to a stream one element at a time.
+
+    The tree only holds the elements that are still open (with the children
+    that precede the streamed ones, e.g. a config element) and the element
+    being written. :py:meth:`open` writes the start of an element,
+    :py:meth:`write` writes a complete child of the innermost open element
+    and drops it from the tree, :py:meth:`close` writes the end of the
+    innermost open element and drops it from the tree.
+
+    The result is byte by byte the same produced by serializing the whole
+    tree at once with `etree.tostring(root, pretty_print=True,
+    xml_declaration=True, encoding="UTF-8")`, with one exception: an open
+    element without children is not collapsed to an empty element tag.
+    """
+
+    def __init__(self, stream, root):
+        self.stream = stream
+        self.root = root
+        # [element, prefix, closing] for each open element, outermost first:
+        # the serialized tree up to the children of the element (None until
+        # the element becomes the innermost one) and the line closing it
+        self.opened = []
+        # (open element, root of its scaffold, copy of the open element,
+        # depth of the open element)
+        self.scaffold = None
+
+    def _serialize(self):
+        """Serialize the current tree."""
+        return etree.tostring(self.root, pretty_print=True,
+            xml_declaration=True, encoding="UTF-8")
+
+    def _split(self, element):
+        """Serialize the current tree, return the text preceding and
+        following a new last child of the given element."""
+        sentinel = etree.SubElement(element, STREAM_SENTINEL_TAG)
+
+        try:
+            text = self._serialize()
+        finally:
+            element.remove(sentinel)
+
+        marker = text.index(STREAM_SENTINEL_NAME)
+        start = text.rindex("\n", 0, marker) + 1
+        end = text.index("\n", marker) + 1
+
+        return text[:start], text[end:]
+
+    def _suffix(self):
+        """The serialized tree following the children of the innermost open
+        element."""
+        return "".join(closing for _, _, closing in reversed(self.opened))
+
+    def is_open(self, element):
+        """Is the given element open?"""
+        return element in [opened[0] for opened in self.opened]
+
+    def open(self, element):
+        """Write the start of the given element, and of its ancestors that
+        are not open yet.
+
+        The element (and each of these ancestors) must be the last child of
+        its parent.
+        """
+        written = self.opened[-1][1] if self.opened else ""
+        suffix = self._suffix() if self.opened else ""
+
+        new = [element]
+        parent = element.getparent()
+
+        while parent is not None and not self.is_open(parent):
+            new.append(parent)
+            parent = parent.getparent()
+
+        prefix, following = self._split(element)
+        closings = following.splitlines(True)
+
+        if (not prefix.startswith(written)
+            or "".join(closings[len(new):]) != suffix):
+            raise ValueError("open elements can't be changed once written")
+
+        self.stream.write(prefix[len(written):])
+
+        for i in reversed(xrange(len(new))):
+            self.opened.append(
+                [new[i], prefix if i == 0 else None, closings[i]])
+
+    def _build_scaffold(self, parent):
+        """Copy the given element and its ancestors, without attributes
+        and other children, so that an element moved under the copy is
+        serialized at the same depth and with the same namespaces.
+
+        Return the root of the scaffold, the copy of the given element and
+        its depth."""
+        ancestors = []
+
+        while parent is not None:
+            ancestors.append(parent)
+            parent = parent.getparent()
+
+        root = copy = None
+
+        for original in reversed(ancestors):
+            if copy is None:
+                root = copy = etree.Element(original.tag,
+                                            nsmap=original.nsmap)
+            else:
+                copy = etree.SubElement(copy, original.tag,
+                                        nsmap=original.nsmap)
+
+        return root, copy, len(ancestors)
+
+    def write(self, element):
+        """Write the given element, the last child of the innermost open
+        element, and drop it from the tree.
+
+        Only the element is serialized, moved under a scaffold of its open
+        ancestors (see :py:meth:`_build_scaffold`), instead of the whole
+        tree."""
+        parent = self.opened[-1][0]
+
+        if self.scaffold is None or self.scaffold[0] is not parent:
+            self.scaffold = (parent, ) + self._build_scaffold(parent)
+
+        _, scaffold_root, scaffold_parent, depth = self.scaffold
+
+        scaffold_parent.append(element)
+
+        try:
+            lines = etree.tostring(
+                scaffold_root, pretty_print=True).splitlines(True)
+        finally:
+            scaffold_parent.remove(element)
+
+        # one line for the start and one for the end of each ancestor
+        self.stream.write("".join(lines[depth:len(lines) - depth]))
+
+    def close(self):
+        """Write the end of the innermost open element, and drop it from the
+        tree."""
+        element, _, closing = self.opened.pop()
+        self.stream.write(closing)
+        self.scaffold = None
+
+        parent = element.getparent()
+
+        if parent is not None:
+            parent.remove(element)
+
+        if self.opened and self.opened[-1][1] is None:
+            self.opened[-1][1] = self._split(parent)[0]
+
+    def finish(self):
+        """Close all the open elements, or write the whole tree if nothing
+        was written yet."""
+        if not self.opened:
+            self.stream.write(self._serialize())
+
+        while self.opened:
+            self.close()
+
+
 class TreeNRMLWriter(writer.FileWriter):
     """
     Abstract base class for a writer that doesn't write (site, attribute)
@@ -43,7 +212,17 @@ class TreeNRMLWriter(writer.FileWriter):
     This is required when the (site, attribute) pairs have to be collected
     per category in different tree branches (e.g., for loss curves, several
     curves have to be assigned to the same asset). 
+
+    In incremental mode the elements are instead written as soon as they are
+    complete by an :py:class:`IncrementalTreeWriter`, and the pairs of the
+    same category must be written one after the other.
     """
+    def __init__(self, path, incremental=False):
+        super(TreeNRMLWriter, self).__init__(path)
+
+        self.incremental = incremental
+        self.tree_writer = None
+
     def write(self, point, value):
         """Write out an individual point (has to be implemented in 
         derived class).
@@ -59,14 +238,20 @@ class TreeNRMLWriter(writer.FileWriter):
                         "build a valid output!"
             raise RuntimeError(error_msg)
 
-        self.file.write(etree.tostring(self.root_node, pretty_print=True,
-            xml_declaration=True, encoding="UTF-8"))
+        if self.tree_writer is not None:
+            self.tree_writer.finish()
+        else:
+            self.file.write(etree.tostring(self.root_node, pretty_print=True,
+                xml_declaration=True, encoding="UTF-8"))
         super(TreeNRMLWriter, self).close()
 
     def _create_root_element(self):
         """Adds NRML root element to lxml tree representation.""" 
         self.root_node = etree.Element(xml.NRML_ROOT_TAG, nsmap=xml.NSMAP)
 
+        if self.incremental:
+            self.tree_writer = IncrementalTreeWriter(self.file, self.root_node)
+
 
 def set_gml_id(element, gml_id):
     """Set gml:id attribute for element"""
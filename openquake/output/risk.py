@@ -24,8 +24,9 @@ NRML serialization of risk-related data sets.
 - loss map
 """
 
-from collections import defaultdict
+import itertools
 
+from django.db import router
 from lxml import etree
 
 from openquake.db import models
@@ -36,6 +37,7 @@ from openquake import writer
 from openquake import xml
 
 from openquake.output import nrml
+from openquake.utils import db
 from openquake.xml import NRML_NS, GML_NS
 
 LOGGER = logs.RISK_LOG
@@ -50,8 +52,8 @@ class BaseXMLWriter(nrml.TreeNRMLWriter):
     """
     container_tag = None
 
-    def __init__(self, path):
-        super(BaseXMLWriter, self).__init__(path)
+    def __init__(self, path, incremental=False):
+        super(BaseXMLWriter, self).__init__(path, incremental)
 
         self.result_el = None
 
@@ -92,8 +94,8 @@ class LossMapXMLWriter(nrml.TreeNRMLWriter):
         'lossMapID': 'undefined', 'endBranchLabel': 'undefined',
         'lossCategory': 'undefined', 'unit': 'undefined'}
 
-    def __init__(self, path):
-        nrml.TreeNRMLWriter.__init__(self, path)
+    def __init__(self, path, incremental=False):
+        nrml.TreeNRMLWriter.__init__(self, path, incremental)
         self.lmnode_counter = 0
 
         # root <nrml> element:
@@ -205,6 +207,10 @@ class LossMapXMLWriter(nrml.TreeNRMLWriter):
                             xml.RISK_LOSS_MAP_STANDARD_DEVIATION_TAG)
             stddev.text = "%s" % loss_dict['stddev_loss']
 
+        if (self.tree_writer is not None
+            and not self.tree_writer.is_open(self.loss_map_node)):
+            self.tree_writer.open(self.loss_map_node)
+
         # Generate an id for the new LMNode
         # Note: ids are created start at '1'
         self.lmnode_counter += 1
@@ -233,6 +239,9 @@ class LossMapXMLWriter(nrml.TreeNRMLWriter):
         for value in values:
             new_loss_node(lmnode_el, value[0], value[1])
 
+        if self.tree_writer is not None:
+            self.tree_writer.write(lmnode_el)
+
     def _get_site_elem_for_site(self, site):
         """
         Searches the current xml document for a Site node matching the input
@@ -277,17 +286,39 @@ class LossMapDBReader(object):
 
         The structure of the result is documented in :class:`LossMapDBWriter`.
         """
+        return list(self.stream(output_id))
+
+    def stream(self, output_id, fetch_size=None):
+        """
+        Read the given loss map from the database `fetch_size` rows at a
+        time (see :py:func:`openquake.utils.db.iter_rows`).
+
+        :returns: an iterator on the items of the list returned by
+            :py:meth:`deserialize`, the metadata first and then the losses
+            of each site
+        """
         loss_map = models.LossMap.objects.get(output=output_id)
-        loss_map_data = loss_map.lossmapdata_set.all()
 
-        items = defaultdict(list)
+        yield self._get_metadata(loss_map)
+
+        # the rows of the same site are consecutive, so that the losses of
+        # a site can be yielded as soon as they are all read
+        # pylint: disable=W0212
+        rows = db.iter_rows(
+            router.db_for_read(models.LossMapData),
+            "SELECT ST_X(location), ST_Y(location), asset_ref, value, "
+            "std_dev FROM \"%s\" WHERE loss_map_id = %%s "
+            "ORDER BY ST_X(location), ST_Y(location), id"
+            % models.LossMapData._meta.db_table, [loss_map.id], fetch_size)
+
+        for (lon, lat), site_rows in itertools.groupby(
+            rows, lambda row: row[:2]):
 
-        for datum in loss_map_data:
-            loc = datum.location
-            site, loss_asset = self._get_item(loss_map, loc.x, loc.y, datum)
-            items[site].append(loss_asset)
+            items = [
+                self._get_item(loss_map, lon, lat, asset_ref, value, std_dev)
+                for _, _, asset_ref, value, std_dev in site_rows]
 
-        return [self._get_metadata(loss_map)] + items.items()
+            yield items[0][0], [loss_asset for _, loss_asset in items]
 
     @staticmethod
     def _get_metadata(loss_map):
@@ -300,7 +331,7 @@ class LossMapDBReader(object):
                         for key, metadata_key in LOSS_MAP_METADATA_KEYS)
 
     @staticmethod
-    def _get_item(loss_map, lon, lat, datum):
+    def _get_item(loss_map, lon, lat, asset_ref, value, std_dev):
         """
         Returns the data for a point in the loss map
 
@@ -309,13 +340,13 @@ class LossMapDBReader(object):
         The format for loss and asset documented in :class:`LossMapDBWriter`.
         """
         site = shapes.Site(lon, lat)
-        asset = {'assetID': datum.asset_ref}
+        asset = {'assetID': asset_ref}
 
         if loss_map.deterministic:
-            loss = {'mean_loss': datum.value,
-                    'stddev_loss': datum.std_dev}
+            loss = {'mean_loss': value,
+                    'stddev_loss': std_dev}
         else:
-            loss = {'value': datum.value}
+            loss = {'value': value}
 
         return site, (loss, asset)
 
@@ -484,7 +515,7 @@ def create_loss_map_writer(job_id, serialize_to, nrml_path, deterministic):
 
     if 'xml' in serialize_to:
         if deterministic:
-            writers.append(LossMapXMLWriter(nrml_path))
+            writers.append(LossMapXMLWriter(nrml_path, incremental=True))
         else:
             # No XML schema for non-deterministic maps yet (see bug 805434)
             pass
@@ -496,7 +527,8 @@ class CurveXMLWriter(BaseXMLWriter):
     """This class serializes a set of loss or loss ratio curves to NRML.
     Since the curves have to be collected under several different asset
     objects, we have to build the whole tree before serializing
-    (uses base class BaseXMLWriter).
+    (uses base class BaseXMLWriter), unless in incremental mode, where the
+    curves of each asset must be written one after the other.
     """
 
     # these tag names have to be redefined in the derived classes
@@ -507,11 +539,12 @@ class CurveXMLWriter(BaseXMLWriter):
 
     CONTAINER_DEFAULT_ID = 'c1'
 
-    def __init__(self, path):
-        super(CurveXMLWriter, self).__init__(path)
+    def __init__(self, path, incremental=False):
+        super(CurveXMLWriter, self).__init__(path, incremental)
 
         self.curve_list_el = None
         self.assets_per_id = {}
+        self.last_asset_id = None
 
     def write(self, point, values):
         """Writes an asset element with loss map ratio information.
@@ -552,12 +585,24 @@ class CurveXMLWriter(BaseXMLWriter):
         try:
             asset_el = self.assets_per_id[asset_id]
         except KeyError:
+            if self.tree_writer is not None and self.assets_per_id:
+                # the curves and the asset element of the previous asset
+                # are complete
+                self.tree_writer.close()
+                self.tree_writer.close()
+                self.assets_per_id[self.last_asset_id] = None
 
             # nrml:asset, needs gml:id
             asset_el = etree.SubElement(self.curve_list_el,
                 xml.RISK_ASSET_TAG)
             nrml.set_gml_id(asset_el, asset_id)
             self.assets_per_id[asset_id] = asset_el
+            self.last_asset_id = asset_id
+
+        if asset_el is None:
+            error_msg = "in incremental mode the curves of asset %s have " \
+                        "to be written one after the other" % asset_id
+            raise ValueError(error_msg)
 
         # check if nrml:site is already existing
         site_el = asset_el.find(xml.RISK_SITE_TAG)
@@ -580,6 +625,10 @@ class CurveXMLWriter(BaseXMLWriter):
         if curves_el is None:
             curves_el = etree.SubElement(asset_el, self.curves_tag)
 
+        if (self.tree_writer is not None
+            and not self.tree_writer.is_open(curves_el)):
+            self.tree_writer.open(curves_el)
+
         curve_el = etree.SubElement(curves_el, self.curve_tag)
 
         # attribute for endBranchLabel (optional)
@@ -593,6 +642,9 @@ class CurveXMLWriter(BaseXMLWriter):
         poe_el = etree.SubElement(curve_el, xml.RISK_POE_TAG)
         poe_el.text = _curve_poe_as_gmldoublelist(curve_object)
 
+        if self.tree_writer is not None:
+            self.tree_writer.write(curve_el)
+
 
 class LossCurveXMLWriter(CurveXMLWriter):
     """NRML serialization of loss curves"""
@@ -625,26 +677,40 @@ class LossCurveDBReader(object):
         The structure of the result is documented in
         :class:`LossCurveDBWriter`.
         """
+        return list(LossCurveDBReader.stream(output_id))
+
+    @staticmethod
+    def stream(output_id, fetch_size=None):
+        """
+        Read the given loss curve from the database `fetch_size` rows at a
+        time (see :py:func:`openquake.utils.db.iter_rows`).
+
+        :returns: an iterator on the items of the list returned by
+            :py:meth:`deserialize`
+        """
         loss_curve = models.LossCurve.objects.get(output=output_id)
-        loss_curve_data = loss_curve.losscurvedata_set.all()
 
-        curves = []
+        # pylint: disable=W0212
+        loss_curve_data = db.iter_rows(
+            router.db_for_read(models.LossCurveData),
+            "SELECT ST_X(location), ST_Y(location), asset_ref, losses, poes "
+            "FROM \"%s\" WHERE loss_curve_id = %%s"
+            % models.LossCurveData._meta.db_table, [loss_curve.id],
+            fetch_size)
+
         asset = {
             'assetValueUnit': loss_curve.unit,
             'endBranchLabel': loss_curve.end_branch_label,
             'lossCategory': loss_curve.category,
         }
 
-        for datum in loss_curve_data:
-            curve = shapes.Curve(zip(datum.losses, datum.poes))
+        for lon, lat, asset_ref, losses, poes in loss_curve_data:
+            curve = shapes.Curve(zip(losses, poes))
 
             asset_object = asset.copy()
-            asset_object['assetID'] = datum.asset_ref
-
-            loc = datum.location
-            curves.append((shapes.Site(loc.x, loc.y), (curve, asset_object)))
+            asset_object['assetID'] = asset_ref
 
-        return curves
+            yield shapes.Site(lon, lat), (curve, asset_object)
 
 
 class LossCurveDBWriter(writer.DBWriter):
@@ -792,6 +858,6 @@ def create_loss_curve_writer(job_id, serialize_to, nrml_path, curve_mode):
         elif curve_mode == 'loss_ratio':
             writer_class = LossRatioCurveXMLWriter
 
-        writers.append(writer_class(nrml_path))
+        writers.append(writer_class(nrml_path, incremental=True))
 
     return writer.compose_writers(writers)
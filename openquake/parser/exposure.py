@@ -27,7 +27,7 @@ from lxml import etree
 from openquake import producer
 from openquake import shapes
 from openquake import xml
-from openquake.xml import NRML, GML, nrml_schema_file
+from openquake.xml import NRML, GML
 
 # do not use namespace for now
 RISKML_NS = ''
@@ -88,8 +88,15 @@ class ExposurePortfolioFile(producer.FileProducer):
     Note: assetDescription is optional.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, validate=None):
+        """
+        :param path: the path of the exposure portfolio file
+        :param validate: whether the file has to be validated against the
+            NRML schema, by default as set by
+            :py:func:`openquake.xml.validate_schema`
+        """
         super(ExposurePortfolioFile, self).__init__(path)
+        self._validate = validate
 
     def _parse(self):
         try:
@@ -102,7 +109,7 @@ class ExposurePortfolioFile(producer.FileProducer):
 
     def _do_parse(self):
         """_parse implementation"""
-        nrml_schema = etree.XMLSchema(etree.parse(nrml_schema_file()))
+        nrml_schema = xml.SCHEMAS.parser_schema(self._validate)
         level = 0
         for event, element in etree.iterparse(
                 self.file, events=('start', 'end'), schema=nrml_schema):
@@ -31,20 +31,22 @@ from openquake import logs
 from openquake import producer
 from openquake import shapes
 
-from openquake.xml import NRML_NS, GML_NS, NRML
+from openquake.xml import NRML_NS, GML_NS, NRML, GML
 
 LOG = logs.LOG
 
 NAMESPACES = {'gml': GML_NS, 'nrml': NRML_NS}
 
+SITE_POS_PATH = '%ssite/%sPoint/%spos' % (NRML, GML, GML)
+POE_PATH = '%shazardCurve/%spoE' % (NRML, NRML)
+
 
 def _to_site(element):
     """Extract site information from an HCNode or GMFNode
     and return a Site object"""
     # lon/lat are in XML attributes 'Longitude' and 'Latitude'
     # consider them as mandatory
-    pos_el = element.xpath("./nrml:site/gml:Point/gml:pos",
-                           namespaces=NAMESPACES)
+    pos_el = element.findall(SITE_POS_PATH)
     assert len(pos_el) == 1
 
     try:
@@ -73,6 +75,16 @@ def _to_gmf_site_data(element):
     return (_to_site(element), attributes)
 
 
+def _discard(element):
+    """Free the memory used by an element that has been fully processed by
+    `etree.iterparse`, so that memory stays flat on large files."""
+    element.clear()
+
+    parent = element.getparent()
+    if parent is not None:
+        parent.remove(element)
+
+
 class NrmlFile(producer.FileProducer):
     """ This class parses a NRML hazard curve file. The contents of a NRML
     file is meant to be used as input for the risk engine. The class is
@@ -120,8 +132,8 @@ class NrmlFile(producer.FileProducer):
                 self._hazard_curve_meta(element)
             elif event == 'end' and element.tag == NRML + 'HCNode':
                 site_data = (_to_site(element), self._to_attributes(element))
-                del element
                 yield site_data
+                _discard(element)
 
     def _hazard_curve_meta(self, element):
         """ Hazard curve metadata from the element """
@@ -143,17 +155,25 @@ class NrmlFile(producer.FileProducer):
 
         invalid_value_error = 'invalid or missing %s value'
 
-        float_strip = lambda x: [float(o) for o in x[0].text.strip().split()]
-        get_imt = lambda x: x[0].get('IMT').strip()
-        get_ebl = lambda x: x[0].get('endBranchLabel').strip()
+        float_strip = lambda x: [float(o) for o in x.text.strip().split()]
+        get_imt = lambda x: x.get('IMT').strip()
+        get_ebl = lambda x: x.get('endBranchLabel').strip()
+
+        # the IML of the hazardCurveField containing the node, and the
+        # first hazardCurveField of the hazardResult for the end branch
+        # label (processed nodes are discarded, the fields are kept)
+        parent = element.getparent()
+        grandparent = parent.getparent() if parent is not None else None
+
+        iml = parent.find(NRML + 'IML') if parent is not None else None
+        field = grandparent.find(NRML + 'hazardCurveField') \
+            if grandparent is not None else None
 
-        for (child_el, child_key, etl) in (
-            ('./nrml:hazardCurve/nrml:poE', 'PoEValues', float_strip),
-            ('../nrml:IML', 'IMLValues', float_strip),
-            ('../nrml:IML', 'IMT', get_imt),
-            ('../../nrml:hazardCurveField', 'endBranchLabel', get_ebl)):
-            child_node = element.xpath(child_el,
-                namespaces=NAMESPACES)
+        for (child_node, child_key, etl) in (
+            (element.find(POE_PATH), 'PoEValues', float_strip),
+            (iml, 'IMLValues', float_strip),
+            (iml, 'IMT', get_imt),
+            (field, 'endBranchLabel', get_ebl)):
 
             try:
                 attributes[child_key] = etl(child_node)
@@ -187,6 +207,7 @@ class GMFReader(producer.FileProducer):
                 self.file, events=('start', 'end')):
             if event == 'end' and element.tag == NRML + 'GMFNode':
                 yield (_to_gmf_site_data(element))
+                _discard(element)
 
 
 class HazardConstraint(object):
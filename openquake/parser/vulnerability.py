@@ -30,7 +30,7 @@ from lxml import etree
 
 from openquake import kvs
 from openquake import shapes
-from openquake.xml import NRML, nrml_schema_file
+from openquake.xml import NRML
 from openquake import producer
 from openquake import xml
 
@@ -66,13 +66,19 @@ class VulnerabilityModelFile(producer.FileProducer):
     with all the data defined for that function.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, validate=None):
+        """
+        :param path: the path of the vulnerability model file
+        :param validate: whether the file has to be validated against the
+            NRML schema, by default as set by
+            :py:func:`openquake.xml.validate_schema`
+        """
         producer.FileProducer.__init__(self, path)
-        nrml_schema = etree.XMLSchema(etree.parse(nrml_schema_file()))
         self.vuln_model = etree.parse(self.path).getroot()
-        if not nrml_schema.validate(self.vuln_model):
-            raise xml.XMLValidationError(
-                nrml_schema.error_log.last_error, path)
+        if validate is None:
+            validate = xml.validate_schema()
+        if validate:
+            xml.SCHEMAS.assert_valid(self.vuln_model, path)
         model_el = self.vuln_model.getchildren()[0]
         if model_el.tag != "%svulnerabilityModel" % NRML:
             raise xml.XMLMismatchError(
@@ -25,14 +25,19 @@ using the classical psha based approach.
 from scipy import sqrt, stats, log, exp
 from numpy import empty, linspace
 from numpy import array, concatenate
-from numpy import subtract, mean
+from numpy import subtract, mean, newaxis
 
 from openquake import shapes
 from openquake.risk.common import loop, collect
-from openquake.utils.general import MemoizeMutable
+from openquake.utils.general import MemoizeLRU
 
 STEPS_PER_INTERVAL = 5
 
+# the number of vulnerability functions whose LREM (and loss ratios and
+# IMLs) is cached by each process, the LREM of a vulnerability function
+# with 100 IMLs takes ~400KB
+LREM_CACHE_SIZE = 100
+
 
 def compute_loss_ratio_curve(vuln_function, hazard_curve):
     """Compute a loss ratio curve for a specific hazard curve (e.g., site),
@@ -75,12 +80,21 @@ def _compute_lrem_po(vuln_function, lrem, hazard_curve):
 
     if hazard_curve:
         pos = _convert_pes_to_pos(hazard_curve, imls)
-        for idx, po in enumerate(pos):
-            lrem_po[:, idx] = lrem[:, idx] * po
+        lrem_po[:] = lrem * array(pos)
 
     return lrem_po
 
 
+def _vuln_function_key(vuln_function, distribution=None):
+    """The key of a vulnerability function in the caches of the values
+    computed from it."""
+
+    # pylint: disable=W0212
+    return (tuple(vuln_function._imls), tuple(vuln_function._loss_ratios),
+            tuple(vuln_function._covs), distribution, STEPS_PER_INTERVAL)
+
+
+@MemoizeLRU(LREM_CACHE_SIZE, _vuln_function_key)
 def _generate_loss_ratios(vuln_function):
     """Generate the set of loss ratios used to compute the LREM
     (Loss Ratio Exceedance Matrix).
@@ -97,7 +111,7 @@ def _generate_loss_ratios(vuln_function):
     return _split_loss_ratios(loss_ratios)
 
 
-@MemoizeMutable
+@MemoizeLRU(LREM_CACHE_SIZE, _vuln_function_key)
 def _compute_lrem(vuln_function, distribution=None):
     """Compute the LREM (Loss Ratio Exceedance Matrix).
 
@@ -111,23 +125,17 @@ def _compute_lrem(vuln_function, distribution=None):
         distribution = stats.lognorm
 
     loss_ratios = _generate_loss_ratios(vuln_function)
-    # LREM has number of rows equal to the number of loss ratios
-    # and number of columns equal to the number if imls
-    lrem = empty((loss_ratios.size, vuln_function.imls.size), float)
-
-    for idx, value in enumerate(vuln_function):
-        mean_val, cov = value[1:]
-
-        stddev = cov * mean_val
-        variance = stddev ** 2.0
-        mu = log(mean_val ** 2.0 / sqrt(variance + mean_val ** 2.0))
-        sigma = sqrt(log((variance / mean_val ** 2.0) + 1.0))
+    mean_vals = vuln_function.loss_ratios
+    covs = vuln_function.covs
 
-        for row, value in enumerate(lrem):
-            lrem[row][idx] = distribution.sf(loss_ratios[row],
-                    sigma, scale=exp(mu))
+    stddevs = covs * mean_vals
+    variances = stddevs ** 2.0
+    mus = log(mean_vals ** 2.0 / sqrt(variances + mean_vals ** 2.0))
+    sigmas = sqrt(log((variances / mean_vals ** 2.0) + 1.0))
 
-    return lrem
+    # LREM has number of rows equal to the number of loss ratios
+    # and number of columns equal to the number if imls
+    return distribution.sf(loss_ratios[:, newaxis], sigmas, scale=exp(mus))
 
 
 def _split_loss_ratios(loss_ratios, steps=None):
@@ -155,6 +163,7 @@ def _split_loss_ratios(loss_ratios, steps=None):
     return array(sorted(splitted_ratios))
 
 
+@MemoizeLRU(LREM_CACHE_SIZE, _vuln_function_key)
 def _compute_imls(vuln_function):
     """Compute the mean IMLs (Intensity Measure Level)
     for the given vulnerability function.
@@ -71,7 +71,8 @@ def compute_mean_loss(vuln_function, ground_motion_field_set,
         **IMLs** - tuple of ground motion fields (float)
     :param epsilon_provider: service used to get the epsilon when
         using the sampled based algorithm.
-    :type epsilon_provider: object that defines an :py:meth:`epsilon` method
+    :type epsilon_provider: object that defines an :py:meth:`epsilons`
+        method
     :param asset: the asset used to compute the loss ratios and losses.
     :type asset: :py:class:`dict` as provided by
         :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
@@ -98,7 +99,8 @@ def compute_stddev_loss(vuln_function, ground_motion_field_set,
         **IMLs** - tuple of ground motion fields (float)
     :param epsilon_provider: service used to get the epsilon when
         using the sampled based algorithm.
-    :type epsilon_provider: object that defines an :py:meth:`epsilon` method
+    :type epsilon_provider: object that defines an :py:meth:`epsilons`
+        method
     :param asset: the asset used to compute the loss ratios and losses.
     :type asset: :py:class:`dict` as provided by
         :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
@@ -125,7 +127,7 @@ class SumPerGroundMotionField(object):
         :param epsilon_provider: service used to get the epsilon when
             using the sampled based algorithm.
         :type epsilon_provider: object that defines
-            an :py:method:`epsilon` method
+            an :py:method:`epsilons` method
         :param lr_calculator: service used to compute the loss ratios.
             For the list of parameters, see
     :py:function:`openquake.risk.probabilistic_event_based.compute_loss_ratios`
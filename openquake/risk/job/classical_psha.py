@@ -19,18 +19,13 @@
 
 """ Mixin for Classical PSHA Risk Calculation """
 
-import geohash
-
 from celery.exceptions import TimeoutError
 
 from openquake import kvs
 from openquake import logs
 
-from openquake.db import models
-
 from openquake.parser import vulnerability
 from openquake.risk import classical_psha_based as cpsha_based
-from openquake.shapes import Curve
 
 from openquake.risk.common import  compute_loss_curve
 from openquake.risk.job import general
@@ -65,14 +60,7 @@ class ClassicalPSHABasedMixin:
 
     def _get_db_curve(self, site):
         """Read hazard curve data from the DB"""
-        gh = geohash.encode(site.latitude, site.longitude, precision=12)
-        job = models.OqJob.objects.get(id=self.job_id)
-        hc = models.HazardCurveData.objects.filter(
-            hazard_curve__output__oq_job=job,
-            hazard_curve__statistic_type='mean').extra(
-            where=["ST_GeoHash(location, 12) = %s"], params=[gh]).get()
-
-        return Curve(zip(job.oq_params.imls, hc.poes))
+        return general.read_hazard_curves(self.job_id, [site])[site]
 
     def compute_risk(self, block_id, **kwargs):  # pylint: disable=W0613
         """This task computes risk for a block of sites. It requires to have
@@ -83,18 +71,20 @@ class ClassicalPSHABasedMixin:
 
         """
 
-        block = general.Block.from_kvs(block_id)
+        block_assets = general.BlockAssets.from_kvs(self.job_id, block_id)
 
         #pylint: disable=W0201
         self.vuln_curves = \
                 vulnerability.load_vuln_model_from_kvs(self.job_id)
 
-        for point in block.grid(self.region):
-            hazard_curve = self._get_db_curve(point.site)
+        points = list(block_assets.points(self.region.grid))
+        hazard_curves = general.read_hazard_curves(
+            self.job_id, [point.site for point, _ in points])
+
+        for point, assets in points:
+            hazard_curve = hazard_curves[point.site]
 
-            asset_key = kvs.tokens.asset_key(self.job_id,
-                            point.row, point.column)
-            for asset in kvs.get_list_json_decoded(asset_key):
+            for asset in assets:
                 LOGGER.debug("processing asset %s" % (asset))
                 loss_ratio_curve = self.compute_loss_ratio_curve(
                     point, asset, hazard_curve)
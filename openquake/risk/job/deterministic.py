@@ -180,22 +180,23 @@ class DeterministicEventBasedMixin:
         vuln_model = kwargs['vuln_model']
         epsilon_provider = kwargs['epsilon_provider']
 
-        block = general.Block.from_kvs(block_id)
+        block_assets = general.BlockAssets.from_kvs(self.job_id, block_id)
 
         block_losses = self._compute_loss_for_block(
-            block, vuln_model, epsilon_provider)
+            block_assets, vuln_model, epsilon_provider)
 
         asset_losses = self._compute_asset_losses_for_block(
-            block, vuln_model, epsilon_provider)
+            block_assets, vuln_model, epsilon_provider)
 
         return block_losses, asset_losses
 
-    def _compute_loss_for_block(self, block, vuln_model, epsilon_provider):
+    def _compute_loss_for_block(
+        self, block_assets, vuln_model, epsilon_provider):
         """
         Compute the sum of all asset losses for the given region block.
 
-        :param block: a block of sites represented by a
-            :py:class:`openquake.job.Block` object
+        :param block_assets: the assets of the block, represented by a
+            :py:class:`openquake.risk.job.general.BlockAssets` object
         :param vuln_model:
             dict of :py:class:`openquake.shapes.VulnerabilityFunction` objects,
             keyed by the vulnerability function name as a string
@@ -208,9 +209,8 @@ class DeterministicEventBasedMixin:
 
         """
         sum_per_gmf = det.SumPerGroundMotionField(vuln_model, epsilon_provider)
-        for point in block.grid(self.region):
+        for point, assets in block_assets.points(self.region.grid):
             gmvs = load_gmvs_for_point(self.job_id, point)
-            assets = load_assets_for_point(self.job_id, point)
             for asset in assets:
                 # the SumPerGroundMotionField add() method expects a dict
                 # with a single key ('IMLs') and value set to the sequence of
@@ -219,13 +219,13 @@ class DeterministicEventBasedMixin:
         return sum_per_gmf.losses
 
     def _compute_asset_losses_for_block(
-        self, block, vuln_model, epsilon_provider):
+        self, block_assets, vuln_model, epsilon_provider):
         """
         Compute the mean & standard deviation loss values for each asset in the
         given block.
 
-        :param block: a block of sites represented by a
-            :py:class:`openquake.job.Block` object
+        :param block_assets: the assets of the block, represented by a
+            :py:class:`openquake.risk.job.general.BlockAssets` object
         :param vuln_model:
             dict of :py:class:`openquake.shapes.VulnerabilityFunction` objects,
             keyed by the vulnerability function name as a string
@@ -259,12 +259,11 @@ class DeterministicEventBasedMixin:
         """
         loss_data = {}
 
-        for point in block.grid(self.region):
+        for point, assets in block_assets.points(self.region.grid):
             # the mean and stddev calculation functions used below
             # require the gmvs to be wrapped in a dict with a single key:
             # 'IMLs'
             gmvs = {'IMLs': load_gmvs_for_point(self.job_id, point)}
-            assets = load_assets_for_point(self.job_id, point)
             for asset in assets:
                 vuln_function = \
                     vuln_model[asset['vulnerabilityFunctionReference']]
@@ -305,20 +304,6 @@ def load_gmvs_for_point(job_id, point):
     return [float(x['mag']) for x in kvs.get_list_json_decoded(gmfs_key)]
 
 
-def load_assets_for_point(job_id, point):
-    """
-    From the KVS, load all assets for the given point.
-
-    :param point: :py:class:`openquake.shapes.GridPoint` object
-
-    :returns: List of asset dicts at the given location (point) in the
-        following form::
-            {u'assetValue': 124.27, u'vulnerabilityFunctionReference': u'ID'}
-    """
-    assets_key = kvs.tokens.asset_key(job_id, point.row, point.column)
-    return kvs.get_list_json_decoded(assets_key)
-
-
 def collect_region_data(block_loss_map_data, region_loss_map_data):
     """Collect the loss map data for all the region."""
     for site, data in block_loss_map_data.iteritems():
@@ -22,12 +22,15 @@ from collections import defaultdict
 import json
 import os
 
+import geohash
+import numpy
 from scipy.stats import norm
 
 from openquake import job
 from openquake import kvs
 from openquake import logs
 from openquake import shapes
+from openquake.db import models
 from openquake.job import config as job_config
 from openquake.job import mixins
 from openquake.output import curve
@@ -49,12 +52,11 @@ def preload(fn):
         """Define some preliminary steps needed before starting
         the risk processing. The decorator:
 
-        * reads and stores in KVS the assets
         * reads and stores in KVS the vulnerability model
-        * splits into blocks and stores in KVS the exposure sites
+        * splits into blocks and stores in KVS the exposure sites and
+          assets
         """
 
-        self.store_exposure_assets()
         self.store_vulnerability_model()
         self.partition()
 
@@ -92,7 +94,7 @@ def output(fn):
                     [metadata]
                     + self.asset_losses_per_site(
                         loss_poe,
-                        self.grid_assets_iterator(self.region.grid)))
+                        self.block_assets_iterator(self.blocks_keys)))
 
     return output_writer
 
@@ -122,18 +124,18 @@ def compute_risk(job_id, block_id, **kwargs):
         return mixed.compute_risk(block_id, **kwargs)
 
 
-def read_sites_from_exposure(a_job):
+def read_exposure(a_job):
     """
-    Given the exposure model specified in the job config, read all sites which
-    are located within the region of interest.
+    Given the exposure model specified in the job config, read in a single
+    pass all sites and assets which are located within the region of
+    interest.
 
     :param a_job: a Job object with an EXPOSURE parameter defined
     :type a_job: :py:class:`openquake.job.Job`
 
-    :returns: a list of :py:class:`openquake.shapes.Site` objects
+    :returns: the same as :py:func:`group_assets_by_site`
     """
 
-    sites = []
     path = os.path.join(a_job.base_path, a_job.params[job_config.EXPOSURE])
 
     reader = exposure.ExposurePortfolioFile(path)
@@ -142,55 +144,140 @@ def read_sites_from_exposure(a_job):
     LOG.debug(
         "Constraining exposure parsing to %s" % constraint)
 
-    for site, _asset_data in reader.filter(constraint):
+    return group_assets_by_site(reader.filter(constraint))
+
+
+def group_assets_by_site(site_assets):
+    """
+    Group the assets of an exposure model by site.
+
+    Sites are de-duplicated (bug 812395) with a dict, in linear time.
+
+    :param site_assets: the (site, asset) pairs of the exposure model, as
+        generated by
+        :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
+    :returns: a pair (sites, assets), where sites is the list of the
+        distinct :py:class:`openquake.shapes.Site` objects, in the order they
+        are first found, and assets is a dict mapping each site to the list
+        of its assets. The "lon" and "lat" keys are added to each asset.
+    """
+
+    sites = []
+    assets = {}
+
+    for site, asset in site_assets:
+        asset["lon"], asset["lat"] = site.coords
 
-        # we don't want duplicates (bug 812395):
-        if not site in sites:
+        assets_at_site = assets.get(site)
+        if assets_at_site is None:
             sites.append(site)
+            assets_at_site = assets[site] = []
+        assets_at_site.append(asset)
+
+    return sites, assets
+
+
+def read_sites_from_exposure(a_job):
+    """
+    Given the exposure model specified in the job config, read all sites which
+    are located within the region of interest.
+
+    :param a_job: a Job object with an EXPOSURE parameter defined
+    :type a_job: :py:class:`openquake.job.Job`
+
+    :returns: a list of :py:class:`openquake.shapes.Site` objects
+    """
+
+    sites, _assets = read_exposure(a_job)
 
     return sites
 
 
+def read_hazard_curves(job_id, sites):
+    """
+    Read from the DB the mean hazard curves of the given sites, with a
+    single query.
+
+    The sites are matched with the curve locations by their 12 characters
+    geohash, the query is restricted to the bounding box of the sites so
+    that the spatial index on the curve locations is used.
+
+    :param job_id: the id of the job that computed the hazard curves
+    :type job_id: int
+    :param sites: the sites of interest
+    :type sites: list of :py:class:`openquake.shapes.Site` objects
+
+    :returns: a dict mapping each site with a hazard curve to its
+        :py:class:`openquake.shapes.Curve`
+    """
+
+    sites_by_geohash = defaultdict(list)
+    for site in sites:
+        sites_by_geohash[geohash.encode(
+            site.latitude, site.longitude, precision=12)].append(site)
+
+    if not sites_by_geohash:
+        return {}
+
+    # a 12 characters geohash cell is smaller than this
+    margin = 1e-6
+    bounding_box = [
+        min(site.longitude for site in sites) - margin,
+        min(site.latitude for site in sites) - margin,
+        max(site.longitude for site in sites) + margin,
+        max(site.latitude for site in sites) + margin]
+
+    job = models.OqJob.objects.get(id=job_id)
+    curves = models.HazardCurveData.objects.filter(
+        hazard_curve__output__oq_job=job,
+        hazard_curve__statistic_type='mean').extra(
+        select={"geohash": "ST_GeoHash(location, 12)"},
+        where=["location && ST_SetSRID(ST_MakeBox2D("
+               "ST_MakePoint(%s, %s), ST_MakePoint(%s, %s)), 4326)",
+               "ST_GeoHash(location, 12) IN (%s)" % ", ".join(
+                   ["%s"] * len(sites_by_geohash))],
+        params=bounding_box + sites_by_geohash.keys())
+
+    imls = job.oq_params.imls
+    result = {}
+
+    for hc in curves:
+        for site in sites_by_geohash[hc.geohash]:
+            result[site] = shapes.Curve(zip(imls, hc.poes))
+
+    return result
+
+
 class RiskJobMixin(mixins.Mixin):
     """A mixin proxy for Risk jobs."""
     mixins = {}
 
     def partition(self):
-        """Split the sites to compute in blocks and store
-        them in the underlying KVS system."""
+        """Split the sites to compute in blocks and store them, together
+        with the assets of each block, in the underlying KVS system."""
 
-        sites = []
         self.blocks_keys = []  # pylint: disable=W0201
-        sites = read_sites_from_exposure(self)
+        sites, assets = read_exposure(self)
 
         block_count = 0
 
-        for block in split_into_blocks(sites):
-            self.blocks_keys.append(block.id)
-            block.to_kvs()
+        with kvs.BulkWriter() as writer:
+            for block in split_into_blocks(sites):
+                self.blocks_keys.append(block.id)
+                block.to_kvs()
+
+                block_assets = BlockAssets(self.job_id, block.id)
+                for site in block.sites:
+                    point = self.region.grid.point_at(site)
+                    for asset in assets.get(site, ()):
+                        block_assets.add(point, asset)
+                block_assets.to_kvs(writer)
 
-            block_count += 1
+                block_count += 1
 
         LOG.debug("Job has partitioned %s sites into %s blocks" % (
                 len(sites), block_count))
 
-    def store_exposure_assets(self):
-        """Load exposure assets and write them to KVS."""
-
-        exposure_parser = exposure.ExposurePortfolioFile("%s/%s" %
-            (self.base_path, self.params[job_config.EXPOSURE]))
-
-        for site, asset in exposure_parser.filter(self.region):
-# TODO(ac): This is kludgey (?)
-            asset["lat"] = site.latitude
-            asset["lon"] = site.longitude
-            gridpoint = self.region.grid.point_at(site)
-
-            asset_key = kvs.tokens.asset_key(
-                self.job_id, gridpoint.row, gridpoint.column)
-
-            kvs.get_client().rpush(asset_key, json.JSONEncoder().encode(asset))
-
     def store_vulnerability_model(self):
         """ load vulnerability and write to kvs """
         vulnerability.load_vulnerability_model(self.job_id,
@@ -227,10 +314,13 @@ class RiskJobMixin(mixins.Mixin):
         else:
             return []
 
-    def grid_assets_iterator(self, grid):
+    def block_assets_iterator(self, block_ids):
         """
-        Generates the tuples (point, asset) for all assets known to this job
-        that are contained in grid.
+        Generates the tuples (point, asset) for all assets of the given
+        blocks, reading the assets of each block with a single KVS access.
+
+        :param block_ids: the ids of the blocks
+        :type block_ids: list of strings
 
         :returns: tuples (point, asset) where:
             * point is a :py:class:`openquake.shapes.GridPoint` on the grid
@@ -238,19 +328,17 @@ class RiskJobMixin(mixins.Mixin):
             * asset is a :py:class:`dict` representing an asset
         """
 
-        for point in grid:
-            asset_key = kvs.tokens.asset_key(
-                self.job_id, point.row, point.column)
-            for asset in kvs.get_list_json_decoded(asset_key):
-                yield point, asset
+        for block_id in block_ids:
+            block_assets = BlockAssets.from_kvs(self.job_id, block_id)
+            for point, assets in block_assets.points(self.region.grid):
+                for asset in assets:
+                    yield point, asset
 
     def _write_output_for_block(self, job_id, block_id):
         """ Given a job and a block, write out a plotted curve """
         loss_ratio_curves = []
         loss_curves = []
-        block = Block.from_kvs(block_id)
-        for point, asset in self.grid_assets_iterator(
-                block.grid(self.region)):
+        for point, asset in self.block_assets_iterator([block_id]):
             site = shapes.Site(asset['lon'], asset['lat'])
 
             loss_curve = kvs.get(
@@ -292,7 +380,7 @@ class RiskJobMixin(mixins.Mixin):
         :type:loss_poe: float
         :param:assets_iterator: an iterator over the assets, returning (point,
             asset) tuples. See
-            :py:class:`openquake.risk.job.general.grid_assets_iterator`.
+            :py:class:`openquake.risk.job.general.block_assets_iterator`.
 
         :returns: A list of tuples in the form expected by the
         :py:class:`LossMapWriter.serialize` method:
@@ -352,27 +440,55 @@ class EpsilonProvider(object):
         only needed for correlated jobs and unlikely to be available for
         uncorrelated ones.
         """
-        correlation = getattr(self, "ASSET_CORRELATION", None)
-        if not correlation:
+        if not self._correlated():
             # Sample per asset
             return norm.rvs(loc=0, scale=1)
+        else:
+            return self._category_sample(asset)
+
+    def epsilons(self, asset, size):
+        """Sample `size` values from the standard normal distribution for
+        the given asset, in a single call.
+
+        The samples are drawn in the same order :py:meth:`epsilon` would
+        draw them when called `size` times, so a seeded job gives the same
+        results with both methods. For perfectly correlated jobs all the
+        samples are the one of the asset's building typology.
+
+        :returns: :py:class:`numpy.ndarray` of `size` samples
+        """
+        if not self._correlated():
+            return norm.rvs(loc=0, scale=1, size=size)
+        else:
+            return numpy.repeat(self._category_sample(asset), size)
+
+    def _correlated(self):
+        """Return True if the assets are perfectly correlated, raise
+        ValueError for an invalid "ASSET_CORRELATION" setting."""
+        correlation = getattr(self, "ASSET_CORRELATION", None)
+        if not correlation:
+            return False
         elif correlation != "perfect":
             raise ValueError('Invalid "ASSET_CORRELATION": %s' % correlation)
         else:
-            # Sample per building typology
-            samples = getattr(self, "samples", None)
-            if samples is None:
-                # These are two references for the same dictionary.
-                samples = self.samples = dict()
+            return True
 
-            category = asset.get("structureCategory")
-            if category is None:
-                raise ValueError(
-                    "Asset %s has no structure category" % asset["assetID"])
+    def _category_sample(self, asset):
+        """Return the sample of the building typology of the given asset,
+        drawing it the first time the typology is seen."""
+        samples = getattr(self, "samples", None)
+        if samples is None:
+            # These are two references for the same dictionary.
+            samples = self.samples = dict()
 
-            if category not in samples:
-                samples[category] = norm.rvs(loc=0, scale=1)
-            return samples[category]
+        category = asset.get("structureCategory")
+        if category is None:
+            raise ValueError(
+                "Asset %s has no structure category" % asset["assetID"])
+
+        if category not in samples:
+            samples[category] = norm.rvs(loc=0, scale=1)
+        return samples[category]
 
 
 mixins.Mixin.register("Risk", RiskJobMixin, order=2)
@@ -393,11 +509,11 @@ class Block(object):
         """Provide an iterator across the unique grid points within a region,
          corresponding to the sites within this block."""
 
-        used_points = []
+        used_points = set()
         for site in self.sites:
             point = region.grid.point_at(site)
             if point not in used_points:
-                used_points.append(point)
+                used_points.add(point)
                 yield point
 
     def __eq__(self, other):
@@ -432,6 +548,98 @@ class Block(object):
         return self.block_id
 
 
+class BlockAssets(object):
+    """
+    The assets of a block, grouped by grid point.
+
+    All the assets of a block are stored in the KVS as a single columnar
+    record, with a list of grid rows, a list of grid columns and a list for
+    each asset attribute (id, coordinates, value, vulnerability function
+    and so on), so that risk tasks read the assets of their block with a
+    single KVS access.
+    """
+
+    def __init__(self, job_id, block_id):
+        self.job_id = job_id
+        self.block_id = block_id
+        self.assets = []
+
+    def add(self, point, asset):
+        """Add an asset located at the given grid point."""
+        self.assets.append(((point.row, point.column), asset))
+
+    def points(self, grid):
+        """
+        Generate the `(point, assets)` pairs for the grid points of this
+        block, in the order they were first added. Points without assets
+        are not generated at all.
+
+        :param grid: the grid of the region of the job
+        :type grid: :py:class:`openquake.shapes.Grid`
+        """
+        assets = defaultdict(list)
+        keys = []
+
+        for key, asset in self.assets:
+            if key not in assets:
+                keys.append(key)
+            assets[key].append(asset)
+
+        for row, column in keys:
+            yield shapes.GridPoint(grid, column, row), assets[(row, column)]
+
+    def __len__(self):
+        return len(self.assets)
+
+    @property
+    def key(self):
+        """The KVS key of the assets of this block."""
+        return kvs.tokens.block_assets_key(self.job_id, self.block_id)
+
+    def to_kvs(self, writer=None):
+        """
+        Store the assets of this block into the underlying KVS system.
+
+        :param writer: an optional :py:class:`openquake.kvs.BulkWriter` used
+            to queue the write
+        """
+        attributes = set()
+        for _, asset in self.assets:
+            attributes.update(asset)
+
+        # missing attributes are stored as nulls
+        record = {
+            "rows": [row for (row, _), _ in self.assets],
+            "columns": [column for (_, column), _ in self.assets],
+            "attributes": dict(
+                (attribute, [asset.get(attribute)
+                             for _, asset in self.assets])
+                for attribute in attributes)}
+
+        (writer or kvs).set_value_json_encoded(self.key, record)
+
+    @classmethod
+    def from_kvs(cls, job_id, block_id):
+        """Return the assets of the given block, as stored in the KVS."""
+        block_assets = cls(job_id, block_id)
+        raw_record = kvs.get(block_assets.key)
+
+        if not raw_record:
+            return block_assets
+
+        record = json.loads(raw_record)
+
+        attributes = record["attributes"].items()
+
+        for i, key in enumerate(zip(record["rows"], record["columns"])):
+            asset = dict((attribute, values[i])
+                         for attribute, values in attributes
+                         if values[i] is not None)
+            block_assets.assets.append((key, asset))
+
+        return block_assets
+
+
 def split_into_blocks(sites, block_size=BLOCK_SIZE):
     """Split the set of sites into blocks. Provide an iterator
     to the blocks.
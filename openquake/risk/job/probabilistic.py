@@ -54,6 +54,8 @@ class ProbabilisticEventMixin():  # pylint: disable=W0232,W0201
 
         aggregate_curve = prob.AggregateLossCurve()
 
+        self.store_gmfs()
+
         tasks = []
         for block_id in self.blocks_keys:
             LOGGER.debug("Starting task block, block_id = %s of %s"
@@ -96,79 +98,69 @@ class ProbabilisticEventMixin():  # pylint: disable=W0232,W0201
 
         return list(ids)
 
-    def _get_db_gmf(self, gmf_id):
-        """Returns a field for the given GMF"""
+    def _get_db_fields(self, job_id, points):
+        """Return the values of all the GMFs of the job at the given grid
+        points, loaded from the DB with a single query.
+
+        :param job_id: the id of the job
+        :type job_id: integer
+        :param points: the grid points of the sites
+        :type points: iterable of :py:class:`openquake.shapes.GridPoint`
+        :returns: a tuple (fields, index): fields is a
+            :py:class:`numpy.ndarray` of shape (number of GMFs, number of
+            sites), the GMFs are in the order returned by
+            :py:meth:`_gmf_db_list`; index maps the (row, column) of each
+            grid point to its column in fields
+        """
         grid = self.region.grid
-        field = zeros((grid.rows, grid.columns))
-
-        gmf_sites = models.GmfData.objects.filter(output=gmf_id)
-
-        for gmf_site in gmf_sites:
-            loc = gmf_site.location
-            site = shapes.Site(loc.x, loc.y)
-            grid_point = grid.point_at(site)
-
-            field[grid_point.row][grid_point.column] = gmf_site.ground_motion
-
-        return shapes.Field(field)
+        gmf_ids = self._gmf_db_list(job_id)
 
-    def _sites_to_gmf_keys(self, sites):
-        """Returns the GMF keys "row!col" for the given site list"""
-        keys = []
+        index = {}
+        for point in points:
+            index.setdefault((point.row, point.column), len(index))
 
-        for site in sites:
-            risk_point = self.region.grid.point_at(site)
-            key = "%s!%s" % (risk_point.row, risk_point.column)
-            keys.append(key)
+        fields = zeros((len(gmf_ids), len(index)))
 
-        return keys
+        indexes = dict((gmf_id, i) for i, gmf_id in enumerate(gmf_ids))
+        gmf_sites = models.GmfData.objects.filter(output__in=gmf_ids)
 
-    def _get_db_gmfs(self, sites, job_id):
-        """Aggregates GMF data from the DB by site"""
-        all_gmfs = self._gmf_db_list(job_id)
-        gmf_keys = self._sites_to_gmf_keys(sites)
-        gmfs = dict((k, []) for k in gmf_keys)
-
-        for gmf_id in all_gmfs:
-            field = self._get_db_gmf(gmf_id)
+        for gmf_site in gmf_sites.iterator():
+            loc = gmf_site.location
+            grid_point = grid.point_at(shapes.Site(loc.x, loc.y))
+            column = index.get((grid_point.row, grid_point.column))
 
-            for key in gmfs.keys():
-                (row, col) = key.split("!")
-                gmfs[key].append(field.get(int(row), int(col)))
+            if column is not None:
+                fields[indexes[gmf_site.output_id], column] = \
+                    gmf_site.ground_motion
 
-        return gmfs
+        return fields, index
 
-    def _get_kvs_gmfs(self, sites, histories, realizations):
-        """Aggregates GMF data from the KVS by site"""
-        gmf_keys = self._sites_to_gmf_keys(sites)
-        gmfs = dict((k, []) for k in gmf_keys)
+    def store_gmfs(self):
+        """Store the GMF values of all the sites of the job in the KVS,
+        one key per site.
 
-        for i in range(0, histories):
-            for j in range(0, realizations):
-                key = kvs.tokens.stochastic_set_key(self.job_id, i, j)
-                fieldset = shapes.FieldSet.from_json(kvs.get(key),
-                    self.region.grid)
+        The GMFs are loaded from the DB once per job, for the sites of the
+        job's blocks only, each block then reads the values of its own
+        sites."""
+        points = []
+        for block_id in self.blocks_keys:
+            points.extend(general.Block.from_kvs(block_id).grid(self.region))
 
-                for field in fieldset:
-                    for key in gmfs.keys():
-                        (row, col) = key.split("!")
-                        gmfs[key].append(field.get(int(row), int(col)))
+        fields, index = self._get_db_fields(self.job_id, points)
 
-        return gmfs
+        with kvs.BulkWriter(ttl=self.intermediate_key_ttl()) as writer:
+            for (row, column), site_column in index.iteritems():
+                key_gmf = kvs.tokens.gmf_set_key(self.job_id, column, row)
+                writer.set_value_array(key_gmf, fields[:, site_column])
 
-    def slice_gmfs(self, block_id):
-        """Load and collate GMF values for all sites in this block. """
-        block = general.Block.from_kvs(block_id)
-        gmfs = self._get_db_gmfs(block.sites, self.job_id)
+    def _get_gmf_slice(self, point):
+        """Return the GMF slice stored by :py:meth:`store_gmfs` for the
+        given grid point, in the format expected by the probabilistic event
+        based risk functions."""
+        key = kvs.tokens.gmf_set_key(self.job_id, point.column, point.row)
 
-        for key, gmf_slice in gmfs.items():
-            (row, col) = key.split("!")
-            key_gmf = kvs.tokens.gmf_set_key(self.job_id, col, row)
-            LOGGER.debug("GMF_SLICE for %s X %s : \n\t%s" % (
-                    col, row, gmf_slice))
-            gmf = {"IMLs": gmf_slice, "TSES": self._tses(),
-                    "TimeSpan": self._time_span()}
-            kvs.set_value_json_encoded(key_gmf, gmf)
+        return {"IMLs": kvs.get_value_array(key), "TSES": self._tses(),
+                "TimeSpan": self._time_span()}
 
     def compute_risk(self, block_id, **kwargs):  # pylint: disable=W0613
         """Compute risk for a block of sites, that means:
@@ -179,29 +171,28 @@ class ProbabilisticEventMixin():  # pylint: disable=W0232,W0201
         * (partial) aggregate loss curve
         """
 
-        self.slice_gmfs(block_id)
-
         self.vuln_curves = vulnerability.load_vuln_model_from_kvs(
             self.job_id)
 
-        block = general.Block.from_kvs(block_id)
+        block_assets = general.BlockAssets.from_kvs(self.job_id, block_id)
 
         # aggregate the losses for this block
         aggregate_curve = prob.AggregateLossCurve()
 
-        for point in block.grid(self.region):
-            key = kvs.tokens.gmf_set_key(self.job_id, point.column, point.row)
-            gmf_slice = kvs.get_value_json_decoded(key)
+        # shared by all the assets of the block, so that correlated
+        # assets share their samples
+        epsilon_provider = general.EpsilonProvider(self.params)
 
-            asset_key = kvs.tokens.asset_key(
-                self.job_id, point.row, point.column)
+        for point, assets in block_assets.points(self.region.grid):
+            gmf_slice = self._get_gmf_slice(point)
 
-            for asset in kvs.get_list_json_decoded(asset_key):
+            for asset in assets:
                 LOGGER.debug("Processing asset %s" % (asset))
 
                 # loss ratios, used both to produce the curve
                 # and to aggregate the losses
-                loss_ratios = self.compute_loss_ratios(asset, gmf_slice)
+                loss_ratios = self.compute_loss_ratios(
+                    asset, gmf_slice, epsilon_provider)
 
                 loss_ratio_curve = self.compute_loss_ratio_curve(
                     point.column, point.row, asset, gmf_slice, loss_ratios)
@@ -225,12 +216,16 @@ class ProbabilisticEventMixin():  # pylint: disable=W0232,W0201
         return [float(x) for x in self.params.get(
             "CONDITIONAL_LOSS_POE", "0.01").split()]
 
-    def compute_loss_ratios(self, asset, gmf_slice):
+    def compute_loss_ratios(self, asset, gmf_slice, epsilon_provider=None):
         """For a given asset and ground motion field, computes
         the loss ratios used to obtain the related loss ratio curve
-        and aggregate loss curve."""
+        and aggregate loss curve.
 
-        epsilon_provider = general.EpsilonProvider(self.params)
+        A new :py:class:`openquake.risk.job.general.EpsilonProvider` is
+        used when `epsilon_provider` is not given."""
+
+        if epsilon_provider is None:
+            epsilon_provider = general.EpsilonProvider(self.params)
 
         vuln_function = self.vuln_curves.get(
             asset["vulnerabilityFunctionReference"], None)
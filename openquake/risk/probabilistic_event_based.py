@@ -24,7 +24,7 @@ using the probabilistic event based approach.
 
 import math
 
-from numpy import zeros, array, linspace
+from numpy import zeros, array, linspace, sqrt, log, exp
 from numpy import histogram, where, mean
 
 from openquake import shapes
@@ -50,7 +50,8 @@ def compute_loss_ratios(vuln_function, ground_motion_field_set,
         **TSES** - time representative of the Stochastic Event Set (float)
     :param epsilon_provider: service used to get the epsilon when
         using the sampled based algorithm.
-    :type epsilon_provider: object that defines an :py:meth:`epsilon` method
+    :type epsilon_provider: object that defines an :py:meth:`epsilons`
+        method
     :param asset: the asset used to compute the loss ratios.
     :type asset: :py:class:`dict` as provided by
         :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
@@ -86,33 +87,32 @@ def _sampled_based(vuln_function, ground_motion_field_set,
         **TSES** - time representative of the Stochastic Event Set (float)
     :param epsilon_provider: service used to get the epsilon when
         using the sampled based algorithm.
-    :type epsilon_provider: object that defines an :py:meth:`epsilon` method
+    :type epsilon_provider: object that defines an :py:meth:`epsilons`
+        method
     :param asset: the asset used to compute the loss ratios.
     :type asset: :py:class:`dict` as provided by
         :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
     """
 
-    loss_ratios = []
-
     means = vuln_function.loss_ratio_for(ground_motion_field_set["IMLs"])
     covs = vuln_function.cov_for(ground_motion_field_set["IMLs"])
 
-    for mean_ratio, cov in zip(means, covs):
-        if mean_ratio <= 0.0:
-            loss_ratios.append(0.0)
-        else:
-            variance = (mean_ratio * cov) ** 2.0
+    # when the mean loss ratio is zero, the loss ratio is zero too and
+    # no epsilon is sampled
+    loss_ratios = zeros(means.size)
+    sampled = means > 0.0
 
-            epsilon = epsilon_provider.epsilon(asset)
-            sigma = math.sqrt(
-                        math.log((variance / mean_ratio ** 2.0) + 1.0))
+    if sampled.any():
+        means, covs = means[sampled], covs[sampled]
+        epsilons = epsilon_provider.epsilons(asset, means.size)
 
-            mu = math.log(mean_ratio ** 2.0 / math.sqrt(
-                    variance + mean_ratio ** 2.0))
+        variance = (means * covs) ** 2.0
+        sigmas = sqrt(log((variance / means ** 2.0) + 1.0))
+        mus = log(means ** 2.0 / sqrt(variance + means ** 2.0))
 
-            loss_ratios.append(math.exp(mu + (epsilon * sigma)))
+        loss_ratios[sampled] = exp(mus + (epsilons * sigmas))
 
-    return array(loss_ratios)
+    return loss_ratios
 
 
 def _mean_based(vuln_function, ground_motion_field_set):
@@ -232,7 +232,8 @@ def compute_loss_ratio_curve(vuln_function, ground_motion_field_set,
         **TSES** - Time representative of the Stochastic Event Set (float)
     :param epsilon_provider: service used to get the epsilon when
         using the sampled based algorithm.
-    :type epsilon_provider: object that defines an :py:meth:`epsilon` method
+    :type epsilon_provider: object that defines an :py:meth:`epsilons`
+        method
     :param asset: the asset used to compute the loss ratios.
     :type asset: :py:class:`dict` as provided by
         :py:class:`openquake.parser.exposure.ExposurePortfolioFile`
@@ -243,7 +244,7 @@ def compute_loss_ratio_curve(vuln_function, ground_motion_field_set,
     """
 
     # with no gmfs (no earthquakes), an empty curve is enough
-    if not ground_motion_field_set["IMLs"]:
+    if not len(ground_motion_field_set["IMLs"]):
         return shapes.EMPTY_CURVE
 
     if loss_ratios is None:
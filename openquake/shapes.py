@@ -41,6 +41,9 @@ FLAGS = flags.FLAGS
 LineString = geometry.LineString  # pylint: disable=C0103
 Point = geometry.Point            # pylint: disable=C0103
 
+# approximate number of sites in each chunk returned by Grid.site_arrays()
+GRID_CHUNK_SIZE = 10000
+
 
 class Region(object):
     """A container of polygons, used for bounds checking"""
@@ -153,8 +156,9 @@ class Region(object):
         """ Returns a list of sites created from iterating over self """
         sites = []
 
-        for site in self:
-            sites.append(site)
+        for lons, lats in self.grid.site_arrays():
+            sites.extend(Site(lon, lat)
+                         for lon, lat in izip(lons.tolist(), lats.tolist()))
 
         return sites
 
@@ -228,6 +232,7 @@ class Grid(object):
     def __init__(self, region, cell_size):
         self.region = region
         self.cell_size = cell_size
+        self._mask = None
         self.lower_left_corner = self.region.lower_left_corner
         self.columns = self._longitude_to_column(
                     self.region.upper_right_corner.longitude) + 1
@@ -283,17 +288,170 @@ class Grid(object):
         return Site(self._column_to_longitude(gridpoint.column),
                              self._row_to_latitude(gridpoint.row))
 
+    def longitudes(self):
+        """The longitudes of the grid columns, as a numpy array"""
+        return (self.lower_left_corner.longitude
+                + numpy.arange(self.columns) * self.cell_size)
+
+    def latitudes(self):
+        """The latitudes of the grid rows, as a numpy array"""
+        return (self.lower_left_corner.latitude
+                + numpy.arange(self.rows) * self.cell_size)
+
+    def mask(self):
+        """
+        Compute which grid points are contained by the region.
+
+        :returns: a boolean numpy array with one row for each grid row and
+            one column for each grid column, `True` where
+            :py:meth:`check_gridpoint` would accept the point
+        """
+        if self._mask is None:
+            mask = zeros((self.rows, self.columns), dtype=bool)
+            for row, row_mask in self._row_masks():
+                mask[row] = row_mask
+            self._mask = mask
+        return self._mask
+
+    def site_arrays(self, chunk_size=GRID_CHUNK_SIZE):
+        """
+        Lazily iterate over the coordinates of the grid points contained by
+        the region, in the same order as :py:meth:`__iter__`.
+
+        :param int chunk_size: the (approximate) number of grid points
+            covered by each chunk
+        :returns: a generator of `(longitudes, latitudes)` numpy array pairs
+        """
+        longitudes = self.longitudes()
+        chunk_lons, chunk_lats = [], []
+        count = 0
+
+        for row, row_mask in self._row_masks():
+            lons = longitudes[row_mask]
+            chunk_lons.append(lons)
+            chunk_lats.append(
+                numpy.repeat(self._row_to_latitude(row), len(lons)))
+            count += len(lons)
+
+            if count >= chunk_size:
+                yield numpy.concatenate(chunk_lons), \
+                    numpy.concatenate(chunk_lats)
+                chunk_lons, chunk_lats = [], []
+                count = 0
+
+        if count:
+            yield numpy.concatenate(chunk_lons), numpy.concatenate(chunk_lats)
+
+    def _row_masks(self):
+        """
+        Generate `(row, mask)` pairs for all the rows of the grid, where
+        mask tells which columns of the row are contained by the region.
+
+        This uses the cached :py:meth:`mask` when available and
+        :class:`GridMask` otherwise.
+        """
+        if self._mask is not None:
+            for row in xrange(self.rows):
+                yield row, self._mask[row]
+        else:
+            grid_mask = GridMask(self.region.polygon, self.longitudes())
+            for row in xrange(self.rows):
+                yield row, grid_mask.row(self._row_to_latitude(row))
+
     def __iter__(self):
-        for row in range(0, self.rows):
-            for col in range(0, self.columns):
-                try:
-                    point = GridPoint(self, col, row)
-                    self.check_gridpoint(point)
-                    yield point
-                except BoundsException:
-                    print "GACK! at col %s row %s" % (col, row)
-                    print "Point at %s %s isnt on grid" % \
-                        (point.site.longitude, point.site.latitude)
+        for row, row_mask in self._row_masks():
+            for col in numpy.flatnonzero(row_mask):
+                yield GridPoint(self, int(col), row)
+
+
+class GridMask(object):
+    """
+    Compute, one grid row at a time, which points of a regular grid are
+    contained by (or touch) a polygon, giving the same answer of the
+    shapely `contains` and `touches` predicates used by
+    :py:meth:`Grid.check_point`.
+
+    Points outside the polygon bounding box are discarded right away; the
+    others are classified by counting the polygon edges crossed by the
+    horizontal ray going east from each point (even-odd rule). Only the
+    points within :py:attr:`TOLERANCE` from an edge, and the whole rows
+    within :py:attr:`TOLERANCE` from a vertex, where floating point errors
+    could make the crossing count wrong, are checked with shapely.
+    """
+
+    TOLERANCE = 1e-7
+
+    def __init__(self, polygon, longitudes):
+        """
+        :param polygon: the polygon to check the grid points against
+        :type polygon: :py:class:`shapely.geometry.Polygon`
+        :param longitudes: the longitudes of the grid columns
+        :type longitudes: numpy array
+        """
+        self.polygon = polygon
+        self.longitudes = numpy.asarray(longitudes, dtype=float)
+
+        (self.min_x, self.min_y, self.max_x, self.max_y) = polygon.bounds
+        self.in_bounds = ((self.longitudes >= self.min_x)
+                          & (self.longitudes <= self.max_x))
+
+        starts, ends = [], []
+        for ring in [polygon.exterior] + list(polygon.interiors):
+            coords = numpy.array(ring.coords, dtype=float)[:, :2]
+            starts.append(coords[:-1])
+            ends.append(coords[1:])
+
+        starts = numpy.concatenate(starts)
+        ends = numpy.concatenate(ends)
+
+        (self.x1, self.y1) = starts[:, 0], starts[:, 1]
+        (self.x2, self.y2) = ends[:, 0], ends[:, 1]
+
+    def row(self, latitude):
+        """
+        Compute which grid points at the given latitude are contained by
+        the polygon.
+
+        :returns: a boolean numpy array with an item for each longitude
+        """
+        mask = zeros(len(self.longitudes), dtype=bool)
+
+        if latitude < self.min_y or latitude > self.max_y:
+            return mask
+
+        if (numpy.abs(self.y1 - latitude) <= self.TOLERANCE).any():
+            # the ray goes through (or very near) a vertex, check the
+            # whole row the slow way
+            return self._check(mask, self.in_bounds, latitude)
+
+        crossing = (self.y1 > latitude) != (self.y2 > latitude)
+        (x1, y1) = self.x1[crossing], self.y1[crossing]
+        (x2, y2) = self.x2[crossing], self.y2[crossing]
+        crossings = numpy.sort(x1 + (latitude - y1) * (x2 - x1) / (y2 - y1))
+
+        # number of crossings west of each point
+        west = numpy.searchsorted(crossings, self.longitudes, side="right")
+        mask[:] = ((len(crossings) - west) % 2 == 1) & self.in_bounds
+
+        if len(crossings):
+            last = len(crossings) - 1
+            nearest = numpy.minimum(
+                numpy.abs(self.longitudes
+                          - crossings[numpy.maximum(west - 1, 0)]),
+                numpy.abs(self.longitudes
+                          - crossings[numpy.minimum(west, last)]))
+            self._check(
+                mask, self.in_bounds & (nearest <= self.TOLERANCE), latitude)
+
+        return mask
+
+    def _check(self, mask, candidates, latitude):
+        """Set the mask of the candidate points using shapely."""
+        for col in numpy.flatnonzero(candidates):
+            point = Point(self.longitudes[col], latitude)
+            mask[col] = (self.polygon.contains(point)
+                         or self.polygon.touches(point))
+        return mask
 
 
 def c_mul(val_a, val_b):
@@ -310,20 +468,24 @@ class Site(object):
         latitude = round_float(latitude)
         self.point = geometry.Point(longitude, latitude)
 
+        # reading the coordinates of a shapely point is slow, and sites
+        # are hashed and compared a lot
+        self._coords = (self.point.x, self.point.y)
+
     @property
     def coords(self):
         """Return a tuple with the coordinates of this point"""
-        return (self.longitude, self.latitude)
+        return self._coords
 
     @property
     def longitude(self):
         """Point x value is longitude"""
-        return self.point.x
+        return self._coords[0]
 
     @property
     def latitude(self):
         """Point y value is latitude"""
-        return self.point.y
+        return self._coords[1]
 
     def __eq__(self, other):
         """
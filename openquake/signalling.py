@@ -107,7 +107,7 @@ def connect():
     return conn, chn
 
 
-def declare_and_bind_queue(job_id, levels, name=''):
+def declare_and_bind_queue(job_id, levels, name='', auto_delete=False):
     """
     Create an amqp queue for sending/receiving messages and binds it to the
     exchange of specific job and levels.
@@ -122,6 +122,8 @@ def declare_and_bind_queue(job_id, levels, name=''):
     :param name: the name for the queue, '' (empty string) to give the queue an
                  automatically generated name
     :type name: string
+    :param auto_delete: delete the queue when its last consumer goes away
+    :type auto_delete: bool
     :return: the name of the created queue
     :rtype: string
     """
@@ -129,7 +131,7 @@ def declare_and_bind_queue(job_id, levels, name=''):
 
     conn, chn = connect()
 
-    name, _, _ = chn.queue_declare(queue=name, auto_delete=False)
+    name, _, _ = chn.queue_declare(queue=name, auto_delete=auto_delete)
 
     for level in levels:
         chn.queue_bind(name, cfg['exchange'],
@@ -154,6 +156,10 @@ class LogMessageConsumer(object):
         with MyConsumer(job_id) as mc:
             mc.run()
     """
+
+    # delete the queue when the consumer goes away
+    AUTO_DELETE = False
+
     def __init__(self, job_id, levels=None, timeout=None):
         """
         :param job_id: the id of the job whose logging messages we are
@@ -177,7 +183,8 @@ class LogMessageConsumer(object):
             levels = ('*',)
 
         self.qname = declare_and_bind_queue(self.job_id, levels,
-                                            self.get_queue_name())
+                                            self.get_queue_name(),
+                                            self.AUTO_DELETE)
 
     def get_queue_name(self):  # pylint: disable=R0201
         """
@@ -298,3 +305,32 @@ class Collector(LogMessageConsumer):
         else:
             if level in ('debug', 'info', 'warn', 'error', 'fatal'):
                 self.logger.log(getattr(logging, level.upper()), msg.body)
+
+
+class JobOutcomeMonitor(LogMessageConsumer):
+    """
+    Keep track of the jobs whose outcome has been published with
+    :py:func:`signal_job_outcome`, for any job.
+
+    The ids of the completed jobs are added to :py:attr:`completed` while
+    :py:meth:`run` is running; the signals sent before the monitor is
+    created are not seen.
+    """
+
+    AUTO_DELETE = True
+
+    def __init__(self):
+        super(JobOutcomeMonitor, self).__init__(
+            '*', levels=('failed', 'succeeded'))
+
+        self.completed = set()
+
+    def message_callback(self, msg):
+        self.chn.basic_ack(msg.delivery_tag)
+
+        try:
+            job_id, _ = parse_routing_key(msg.delivery_info['routing_key'])
+        except ValueError:
+            pass
+        else:
+            self.completed.add(job_id)
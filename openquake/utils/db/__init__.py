@@ -22,3 +22,89 @@
 This module contains constants and some basic utilities and scaffolding to
 assist with database interactions.
 """
+
+import itertools
+
+from cStringIO import StringIO
+
+from django.db import connections
+
+# the number of rows fetched at a time by :py:func:`iter_rows`
+DEFAULT_FETCH_SIZE = 10000
+
+# used to give a unique name to each server-side cursor
+_CURSOR_IDS = itertools.count()
+
+
+def copy_value(value):
+    """Format a value in the PostgreSQL COPY text format.
+
+    Lists and tuples of numbers are formatted as arrays."""
+    if value is None:
+        return r'\N'
+    elif isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, (list, tuple)):
+        return "{%s}" % ",".join(copy_value(item) for item in value)
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into a table with a single ``COPY FROM STDIN`` command.
+
+    :param cursor: a cursor of a psycopg2 connection
+    :param str table: the (schema qualified) table name
+    :param columns: the names of the columns to fill
+    :type columns: sequence of strings
+    :param rows: the rows to load, each with a value for each column;
+        geometries are given as EWKT strings
+    :type rows: sequence of tuples
+    """
+    data = StringIO("".join(
+        "\t".join(copy_value(value) for value in row) + "\n"
+        for row in rows))
+
+    cursor.copy_expert(
+        "COPY %s (%s) FROM STDIN" % (table, ", ".join(columns)), data)
+
+
+def iter_rows(alias, sql, params=None, fetch_size=None):
+    """Run a query with a named (server-side) cursor and yield its rows.
+
+    Unlike with a normal cursor, the rows are not all sent to the client
+    when the query is run, only `fetch_size` of them are kept in memory at
+    a time.
+
+    :param str alias: the alias of the database connection to use
+    :param str sql: the query
+    :param params: the query parameters
+    :param int fetch_size: the number of rows fetched from the server at a
+        time, defaults to :py:data:`DEFAULT_FETCH_SIZE`
+    """
+    fetch_size = fetch_size or DEFAULT_FETCH_SIZE
+    connection = connections[alias]
+
+    # make sure the connection is open
+    connection.cursor()
+
+    cursor = connection.connection.cursor("oq_rows_%s" % _CURSOR_IDS.next())
+
+    try:
+        cursor.execute(sql, params)
+
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+    finally:
+        cursor.close()
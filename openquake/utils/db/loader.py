@@ -32,14 +32,29 @@ import datetime
 
 import numpy
 
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.contrib.gis.db import models as gis_models
+
 from openquake import java, xml
 from openquake.db import models
+from openquake.utils.db import copy_rows
 
 SRC_DATA_PKG = 'org.opensha.sha.earthquake.rupForecastImpl.GEM1.SourceData'
 MFD_PACKAGE = 'org.opensha.sha.magdist'
 
 DEFAULT_GRID_SPACING = 1.0  # kilometers
 
+# the number of sources written at a time by :py:class:`SourceModelLoader`
+SOURCE_BATCH_SIZE = 1000
+
+# the number of CSV rows loaded at a time by :py:class:`CsvModelLoader`
+CSV_BATCH_SIZE = 10000
+
+CSV_MAGNITUDES = ('mb_val', 'mb_val_error', 'ml_val', 'ml_val_error',
+                  'ms_val', 'ms_val_error', 'mw_val', 'mw_val_error')
+
 # Keys: Common names for tectonic regions
 # Values: A shortened version of this name to be stored in the database
 # TODO: This is incomplete.
@@ -245,6 +260,44 @@ def _table_name(model):
     return '.'.join(model._meta.db_table.split('"."'))  # pylint: disable=W0212
 
 
+def _next_ids(cursor, model, count):
+    """Take `count` ids from the sequence of the primary key of the table
+    of the given model."""
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+        "FROM generate_series(1, %s)", [_table_name(model), count])
+
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _copy_models(cursor, instances):
+    """Insert model instances of the same type with a single COPY command.
+
+    All the columns are copied, including the primary key, which must be
+    already set."""
+    if not instances:
+        return
+
+    fields = instances[0]._meta.fields  # pylint: disable=W0212
+    rows = []
+
+    for instance in instances:
+        row = []
+        for field in fields:
+            value = getattr(instance, field.attname)
+
+            if (value is not None
+                and isinstance(field, gis_models.GeometryField)):
+                # unlike WKT, EWKB keeps the z coordinates
+                value = value.hexewkb
+
+            row.append(value)
+        rows.append(row)
+
+    copy_rows(cursor, _table_name(type(instances[0])),
+              [field.column for field in fields], rows)
+
+
 def write_simple_fault(simple_data, owner_id, input_id):
     """
     Perform an insert of the given data.
@@ -314,6 +367,69 @@ def write_simple_fault(simple_data, owner_id, input_id):
         {_table_name(source): source.id}]
 
 
+def write_simple_faults(simple_data, owner_id, input_id):
+    """
+    Insert the given simple faults with one COPY command per table.
+
+    The ids of the new records are taken from the sequences of the tables
+    beforehand, so that the records can refer to each other.
+
+    :param simple_data: a list of 3-tuples `(mfd, simple_fault, source)`, as
+        described in :py:func:`write_simple_fault`
+    :param owner_id: the id of the owner of the new records, see
+        :py:func:`write_simple_fault`
+    :type owner_id: int
+    :param int input_id: The database key of the uploaded input file from which
+        these sources were extracted, see :py:func:`write_simple_fault`
+
+    :returns: List of dicts of table/record id pairs, three for each simple
+        fault, in the same order as :py:func:`write_simple_fault`
+    """
+
+    assert owner_id is not None, "owner_id should not be None"
+    assert isinstance(owner_id, int), "owner_id should be an integer"
+
+    alias = router.db_for_write(models.Source)
+    cursor = connections[alias].cursor()
+
+    mfds = dict((model, [data[0] for data in simple_data
+                         if isinstance(data[0], model)])
+                for model in (models.MfdEvd, models.MfdTgr))
+    faults = [data[1] for data in simple_data]
+    sources = [data[2] for data in simple_data]
+
+    for instances in mfds.values() + [faults, sources]:
+        if instances:
+            ids = _next_ids(cursor, type(instances[0]), len(instances))
+
+            for instance, instance_id in zip(instances, ids):
+                instance.id = instance_id
+                instance.owner_id = owner_id
+
+    results = []
+
+    for mfd, simple_fault, source in simple_data:
+        if isinstance(mfd, models.MfdEvd):
+            simple_fault.mfd_evd = mfd
+        elif isinstance(mfd, models.MfdTgr):
+            simple_fault.mfd_tgr = mfd
+
+        source.simple_fault = simple_fault
+        source.input_id = input_id
+
+        results.extend([
+            {_table_name(mfd): mfd.id},
+            {_table_name(simple_fault): simple_fault.id},
+            {_table_name(source): source.id}])
+
+    for instances in mfds.values() + [faults, sources]:
+        _copy_models(cursor, instances)
+
+    transaction.set_dirty(using=alias)
+
+    return results
+
+
 class SourceModelLoader(object):
     """
     Uses parsers (written in Java) to read a source model data from a file and
@@ -333,10 +449,10 @@ class SourceModelLoader(object):
         '%s.GEMPointSourceData' % SRC_DATA_PKG: {
             'fn': None}}
 
-    # Functions for writing sources to the db.
+    # Functions for writing lists of sources to the db.
     SRC_DATA_WRITE_FN_MAP = {
         '%s.GEMFaultSourceData' % SRC_DATA_PKG: {
-            'fn': write_simple_fault},
+            'fn': write_simple_faults},
         '%s.GEMSubductionFaultSourceData' % SRC_DATA_PKG: {
             'fn': None},
         '%s.GEMAreaSourceData' % SRC_DATA_PKG: {
@@ -345,7 +461,8 @@ class SourceModelLoader(object):
             'fn': None}}
 
     def __init__(self, src_model_path,
-        mfd_bin_width=DEFAULT_MFD_BIN_WIDTH, owner_id=1, input_id=None):
+        mfd_bin_width=DEFAULT_MFD_BIN_WIDTH, owner_id=1, input_id=None,
+        batch_size=None):
         """
         :param src_model_path: path to a source model file
         :type src_model_path: str
@@ -362,11 +479,15 @@ class SourceModelLoader(object):
             which this source was extracted. Please note that the `input_id`
             will only be supplied when uploading source model files via the
             GUI.
+
+        :param int batch_size: the number of sources written to the DB at a
+            time, defaults to :py:data:`SOURCE_BATCH_SIZE`
         """
         self.src_model_path = src_model_path
         self.mfd_bin_width = mfd_bin_width
         self.owner_id = owner_id
         self.input_id = input_id
+        self.batch_size = batch_size or SOURCE_BATCH_SIZE
 
         # Java SourceModelReader object
         java.jvm().java.lang.System.setProperty(
@@ -374,13 +495,21 @@ class SourceModelLoader(object):
         self.src_reader = java.jclass('SourceModelReader')(
             self.src_model_path, self.mfd_bin_width)
 
+    @transaction.commit_on_success(router.db_for_write(models.Source))
     def serialize(self):
         """
         Read the source model data and serialize to the DB.
+
+        Consecutive sources of the same type are written `batch_size` at a
+        time.
         """
 
         results = []
 
+        # the sources waiting to be written with the same function
+        pending = []
+        pending_write = None
+
         source_data = self.src_reader.read()  # ArrayList of source data types
         for src in source_data:
 
@@ -402,26 +531,40 @@ class SourceModelLoader(object):
                 # for now, just skip this object
                 continue
 
-            results.extend(
-                write(read(src),
-                      owner_id=self.owner_id,
-                      input_id=self.input_id))
+            if pending and (write is not pending_write
+                            or len(pending) >= self.batch_size):
+                results.extend(self._write(pending_write, pending))
+                pending = []
+
+            pending_write = write
+            pending.append(read(src))
+
+        if pending:
+            results.extend(self._write(pending_write, pending))
 
         return results
 
+    def _write(self, write, data):
+        """Write a list of sources to the DB with the given function."""
+        return write(data, owner_id=self.owner_id, input_id=self.input_id)
+
 
 class CsvModelLoader(object):
     """
         Csv Model Loader which gets data from a particular CSV source and
         "serializes" the data to the database
     """
-    def __init__(self, src_model_path):
+    def __init__(self, src_model_path, batch_size=None):
         """
             :param src_model_path: path to a source model file
             :type src_model_path: str
+            :param batch_size: the number of CSV rows loaded at a time,
+                defaults to :py:data:`CSV_BATCH_SIZE`
+            :type batch_size: int
         """
 
         self.src_model_path = src_model_path
+        self.batch_size = batch_size or CSV_BATCH_SIZE
         self.csv_reader = None
         self.csv_fd = open(self.src_model_path, 'r')
 
@@ -431,6 +574,7 @@ class CsvModelLoader(object):
         """
         self.csv_reader = csv.DictReader(self.csv_fd, delimiter=',')
 
+    @transaction.commit_on_success(router.db_for_write(models.Catalog))
     def serialize(self):
         """
             Reads the model
@@ -451,53 +595,85 @@ class CsvModelLoader(object):
 
     def _write_to_db(self, csv_reader):
         """
+            Load the rows in batches of `batch_size` rows, so that the
+            memory used does not depend on the size of the CSV file.
+
             :param csv_reader: DictReader instance
             :type csv_reader: DictReader object `csv.DictReader`
         """
 
-        mags = ['mb_val', 'mb_val_error',
-            'ml_val', 'ml_val_error',
-            'ms_val', 'ms_val_error',
-            'mw_val', 'mw_val_error']
+        rows = []
 
         for row in csv_reader:
+            rows.append(row)
+
+            if len(rows) >= self.batch_size:
+                self._write_batch(rows)
+                rows = []
+
+        if rows:
+            self._write_batch(rows)
+
+    def _write_batch(self, rows):
+        """
+            Load a batch of CSV rows with one COPY command per table.
+
+            The ids of the new surfaces and magnitudes are taken from their
+            sequences beforehand, so that the catalog rows can refer to
+            them.
+
+            :param rows: the CSV rows, as returned by `csv.DictReader`
+            :type rows: list of dicts
+        """
+
+        alias = router.db_for_write(models.Catalog)
+        cursor = connections[alias].cursor()
+
+        surface_ids = _next_ids(cursor, models.Surface, len(rows))
+        magnitude_ids = _next_ids(cursor, models.Magnitude, len(rows))
+
+        surfaces = []
+        magnitudes = []
+        catalogs = []
+
+        for surface_id, magnitude_id, row in zip(
+            surface_ids, magnitude_ids, rows):
 
             timestamp = self._date_to_timestamp(int(row['year']),
                 int(row['month']), int(row['day']), int(row['hour']),
                 int(row['minute']), int(row['second']))
 
-            surface = models.Surface(semi_minor=row['semi_minor'],
-                semi_major=row['semi_major'],
-                strike=row['strike'])
-            surface.save()
+            surfaces.append((surface_id, float(row['semi_minor']),
+                float(row['semi_major']), float(row['strike'])))
 
-            for mag in mags:
-                row[mag] = row[mag].strip()
+            magnitude = [magnitude_id]
+            for mag in CSV_MAGNITUDES:
+                value = row[mag].strip()
 
                 # if m*val* are empty or a series of blank spaces, we assume
                 # that the val is -999 for convention (ask Graeme if we want to
                 # change this)
-                if len(row[mag]) == 0:
-                    row[mag] = None
+                if len(value) == 0:
+                    magnitude.append(None)
                 else:
-                    row[mag] = float(row[mag])
-
-            magnitude = models.Magnitude(mb_val=row['mb_val'],
-                                mb_val_error=row['mb_val_error'],
-                                ml_val=row['ml_val'],
-                                ml_val_error=row['ml_val_error'],
-                                ms_val=row['ms_val'],
-                                ms_val_error=row['ms_val_error'],
-                                mw_val=row['mw_val'],
-                                mw_val_error=row['mw_val_error'])
-            magnitude.save()
+                    magnitude.append(float(value))
+            magnitudes.append(magnitude)
 
             wkt = 'SRID=4326;POINT(%s %s)' % (
                 row['longitude'], row['latitude'])
-            catalog = models.Catalog(owner_id=1, time=timestamp,
-                surface=surface, eventid=row['eventid'],
-                agency=row['agency'], identifier=row['identifier'],
-                time_error=row['time_error'], depth=row['depth'],
-                depth_error=row['depth_error'], magnitude=magnitude,
-                point=wkt)
-            catalog.save()
+            catalogs.append((1, timestamp, surface_id, int(row['eventid']),
+                row['agency'], row['identifier'], float(row['time_error']),
+                float(row['depth']), float(row['depth_error']), magnitude_id,
+                wkt))
+
+        copy_rows(cursor, _table_name(models.Surface),
+            ('id', 'semi_minor', 'semi_major', 'strike'), surfaces)
+        copy_rows(cursor, _table_name(models.Magnitude),
+            ('id',) + CSV_MAGNITUDES, magnitudes)
+        copy_rows(cursor, _table_name(models.Catalog),
+            ('owner_id', 'time', 'surface_id', 'eventid', 'agency',
+             'identifier', 'time_error', 'depth', 'depth_error',
+             'magnitude_id', 'point'), catalogs)
+
+        transaction.set_dirty(using=alias)
+
@@ -52,3 +52,46 @@ class MemoizeMutable:
             self.memo[key] = self.fun(*args, **kwds)
 
         return self.memo[key]
+
+
+class MemoizeLRU(object):
+    """
+    This decorator caches the results of the `size` most recently used
+    arguments.
+
+    The arguments are mapped to a cache key by the `key` function (which
+    takes the same parameters of the decorated function and returns a
+    hashable value) so that, unlike :py:class:`MemoizeMutable`, they don't
+    need to be pickled at each call.
+    """
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        # cache key -> [last use, result]
+        self.memo = {}
+        self.uses = 0
+
+    def __call__(self, fun):
+        def memoized(*args, **kwds):
+            """Return the cached result, or compute it."""
+            key = self.key(*args, **kwds)
+            self.uses += 1
+
+            if key in self.memo:
+                entry = self.memo[key]
+                entry[0] = self.uses
+            else:
+                if len(self.memo) >= self.size:
+                    lru = min(self.memo, key=lambda k: self.memo[k][0])
+                    del self.memo[lru]
+
+                entry = self.memo[key] = [self.uses, fun(*args, **kwds)]
+
+            return entry[1]
+
+        memoized.__name__ = fun.__name__
+        memoized.__doc__ = fun.__doc__
+        memoized.memo = self.memo
+
+        return memoized
@@ -23,11 +23,33 @@ Utility functions related to splitting work into tasks.
 """
 
 import itertools
+import json
+import math
+import os
+import threading
 import time
 
+from celery import signals
 from celery.task.sets import TaskSet
 
+from openquake import kvs
+from openquake import logs
+from openquake import signalling
 from openquake.job import Job
+from openquake.kvs import cache
+from openquake.kvs import tokens
+
+# seconds between checks of the state of the running task sets when no
+# subtask completion is pushed, e.g. because a worker died
+COMPLETION_CHECK_INTERVAL = 1
+
+# seconds the completions of a task set are kept in the KVS, for the task
+# sets nobody waits for any more (e.g. after one of their subtasks failed)
+COMPLETION_TTL = 24 * 3600
+
+# the run time in seconds aimed at for each subtask, when the data is
+# distributed dynamically (see :py:class:`DataChunker`)
+CHUNK_TARGET_TIME = 10.0
 
 
 class WrongTaskParameters(Exception):
@@ -65,8 +87,236 @@ def distribute(cardinality, the_task, (name, data), other_args=None,
         know.
     :raises TaskFailed: When at least one subtask fails (raises an exception).
     """
-    # Too many local variables (18/15)
-    # pylint: disable=R0914
+    subtasks = _prepare_subtasks(cardinality, the_task, (name, data),
+                                 other_args)
+
+    # At this point we have created all the subtasks and each one got a
+    # portion of the data that is to be processed. Now we will create and run
+    # the task set.
+    the_results = _handle_subtasks(subtasks, flatten_results)
+    return the_results
+
+
+def distribute_dynamically(cardinality, the_task, (name, data),
+                           other_args=None, flatten_results=False):
+    """Runs `the_task` over `data`, like :py:func:`distribute`, keeping
+    `cardinality` subtasks in flight.
+
+    Instead of being cut in `cardinality` equal portions up front, the data
+    is handed out in chunks whose size is adapted to the run time of the
+    chunks already completed (see :py:class:`DataChunker`): a new subtask is
+    started as soon as one completes, so that the workers which are done
+    take on the remaining data while the slow chunks are still running.
+
+    The parameters are the same as for :py:func:`distribute`.
+
+    :returns: A list where each element is a result returned by a subtask,
+        in the order of the data; the number of subtasks depends on the run
+        time of the chunks, so `flatten_results` is usually wanted.
+    :raises WrongTaskParameters: When a task receives a parameter it does not
+        know.
+    :raises TaskFailed: When at least one subtask fails (raises an exception).
+    """
+    the_results = []
+
+    distribute_many(cardinality, the_task, (name, data), [other_args or {}],
+                    1, finish=lambda _, results: the_results.append(results),
+                    flatten_results=flatten_results, dynamic=True)
+
+    return the_results[0]
+
+
+def distribute_many(cardinality, the_task, (name, data), runs, concurrency,
+                    start=None, finish=None, flatten_results=False,
+                    dynamic=False):
+    """Runs `the_task` over the same `data` once for each element of `runs`,
+    keeping up to `concurrency` task sets in flight.
+
+    Each run is portioned across `cardinality` subtasks as in
+    :py:func:`distribute`, or as in :py:func:`distribute_dynamically` when
+    `dynamic` is set. As soon as the task set of a run completes the next
+    pending run is started, so that the workers don't sit idle while the
+    slowest subtasks of a run finish.
+
+    :param int cardinality: The size of the task set of each run.
+    :param the_task: A `celery` task callable.
+    :param str name: The parameter name under which the portioned `data` is to
+        be passed to `the_task`.
+    :param data: The `data` that is to be portioned and passed to the subtasks
+        for processing.
+    :param runs: The remaining (keyword) parameters of each run.
+    :type runs: list of dict
+    :param int concurrency: The maximum number of runs in flight.
+    :param start: Called with the index of a run right before its task set is
+        started, runs are started in the order given.
+    :type start: function(int)
+    :param finish: Called with the index of a run and its results as soon as
+        its task set completes.
+    :type finish: function(int, list)
+    :param bool flatten_results: If set, the results passed to `finish` will
+        be a single list (as opposed to [[results1], [results2], ..]).
+    :param bool dynamic: If set, the data of each run is handed out in
+        chunks sized while the run goes on.
+    :raises WrongTaskParameters: When a task receives a parameter it does not
+        know.
+    :raises TaskFailed: When at least one subtask fails (raises an exception).
+    """
+    if dynamic:
+        _distribute_many_dynamically(
+            cardinality, the_task, (name, data), runs, concurrency, start,
+            finish, flatten_results)
+        return
+
+    pending = list(enumerate(runs))
+    pending.reverse()
+    running = {}
+
+    while pending or running:
+        while pending and len(running) < concurrency:
+            index, other_args = pending.pop()
+
+            if start:
+                start(index)
+
+            subtasks = _prepare_subtasks(cardinality, the_task, (name, data),
+                                         other_args)
+            running[index] = TaskSetMonitor(
+                TaskSet(tasks=subtasks).apply_async())
+
+        completed = sorted(index for index, monitor in running.iteritems()
+                           if monitor.done())
+
+        if not completed:
+            _wait_for_any(running.values())
+            continue
+
+        for index in completed:
+            the_results = _collect_results(running.pop(index).result,
+                                           flatten_results)
+
+            if finish:
+                finish(index, the_results)
+
+
+class DataChunker(object):
+    """
+    Hand out the data of a dynamically distributed run in chunks (see
+    :py:func:`distribute_dynamically`).
+
+    Each chunk is at most 1 / (2 * `cardinality`) of the data not yet handed
+    out, so that the chunks get smaller towards the end of the run and the
+    last ones complete at about the same time, and at most the number of
+    items which, at the average run time per item observed so far, take
+    :py:data:`CHUNK_TARGET_TIME` seconds.
+    """
+
+    def __init__(self, data, cardinality):
+        self.data = data
+        self.cardinality = cardinality
+        self.offset = 0
+        self.chunks = 0
+        # the items processed by the completed chunks and their run time
+        self.items = 0
+        self.time = 0.0
+
+    def exhausted(self):
+        """Return ``True`` when all the data has been handed out."""
+        # at least one chunk is handed out, even when there is no data
+        return self.chunks > 0 and self.offset >= len(self.data)
+
+    def next_chunk(self):
+        """Return the offset of the next chunk and the chunk itself."""
+        remaining = len(self.data) - self.offset
+        size = int(math.ceil(remaining / (2.0 * self.cardinality)))
+
+        if self.time > 0:
+            size = min(size, int(CHUNK_TARGET_TIME * self.items / self.time))
+
+        offset = self.offset
+        self.offset += max(1, size)
+        self.chunks += 1
+
+        return offset, self.data[offset:self.offset]
+
+    def record(self, items, seconds):
+        """Record the run time of a completed chunk."""
+        self.items += items
+        self.time += seconds
+
+
+def _distribute_many_dynamically(cardinality, the_task, (name, data), runs,
+                                 concurrency, start, finish,
+                                 flatten_results):
+    """Implement :py:func:`distribute_many` with `dynamic` set, the
+    parameters are the same."""
+    pending = list(enumerate(runs))
+    pending.reverse()
+    # index -> the chunker, the other args and the results by chunk offset
+    running = {}
+    # monitor of a chunk -> the index of its run, its offset and size
+    chunks = {}
+
+    while pending or running:
+        while pending and len(running) < concurrency:
+            index, other_args = pending.pop()
+
+            if start:
+                start(index)
+
+            running[index] = (DataChunker(data, cardinality), other_args, [])
+
+        for index in sorted(running):
+            chunker, other_args, _ = running[index]
+            in_flight = sum(1 for run, _, _ in chunks.itervalues()
+                            if run == index)
+
+            while in_flight < cardinality and not chunker.exhausted():
+                offset, portion = chunker.next_chunk()
+                params = {name: portion}
+                params.update(other_args)
+
+                monitor = TaskSetMonitor(TaskSet(
+                    tasks=[the_task.subtask(**params)]).apply_async())
+                chunks[monitor] = (index, offset, len(portion))
+                in_flight += 1
+
+        completed = [monitor for monitor in chunks if monitor.done()]
+
+        if not completed:
+            _wait_for_any(chunks.keys())
+            continue
+
+        for monitor in completed:
+            index, offset, size = chunks.pop(monitor)
+            chunker, _, results = running[index]
+
+            results.append(
+                (offset, _collect_results(monitor.result, False)[0]))
+
+            if monitor.timings:
+                chunker.record(size, sum(monitor.timings.values()))
+
+            if chunker.exhausted() and not any(
+                run == index for run, _, _ in chunks.itervalues()):
+                del running[index]
+
+                the_results = [result for _, result in
+                               sorted(results, key=lambda item: item[0])]
+
+                if flatten_results:
+                    the_results = list(itertools.chain(*the_results))
+
+                if finish:
+                    finish(index, the_results)
+
+
+def _prepare_subtasks(cardinality, the_task, (name, data), other_args):
+    """Portion `data` across `cardinality` subtasks of `the_task`.
+
+    See :py:func:`distribute` for the meaning of the parameters.
+
+    :returns: The subtasks, ready to be run in a task set.
+    """
 
     def kwargs(data_portion):
         """
@@ -100,11 +350,7 @@ def distribute(cardinality, the_task, (name, data), other_args=None,
     subtask = the_task.subtask(**kwargs(data_portion))
     subtasks.append(subtask)
 
-    # At this point we have created all the subtasks and each one got a
-    # portion of the data that is to be processed. Now we will create and run
-    # the task set.
-    the_results = _handle_subtasks(subtasks, flatten_results)
-    return the_results
+    return subtasks
 
 
 def parallelize(
@@ -155,25 +401,177 @@ def _handle_subtasks(subtasks, flatten_results):
         know.
     :raises TaskFailed: When at least one subtask fails (raises an exception).
     """
-    result = TaskSet(tasks=subtasks).apply_async()
+    monitor = TaskSetMonitor(TaskSet(tasks=subtasks).apply_async())
 
     # Wait for all subtasks to complete.
-    while not result.ready():
-        time.sleep(0.25)
+    while not monitor.done():
+        _wait_for_any([monitor])
+
+    return _collect_results(monitor.result, flatten_results)
+
+
+def _collect_results(result, flatten_results):
+    """Return the results of a completed `TaskSet`.
+
+    :param result: The result of the task set.
+    :type result: :py:class:`celery.result.TaskSetResult`
+    :param bool flatten_results: If set, the results will be returned as a
+        single list (as opposed to [[results1], [results2], ..]).
+    :raises WrongTaskParameters: When a task receives a parameter it does not
+        know.
+    :raises TaskFailed: When at least one subtask fails (raises an exception).
+    """
+    the_results = _get_results(result.join)
+
+    if flatten_results:
+        if the_results:
+            if isinstance(the_results, list) or isinstance(the_results, tuple):
+                the_results = list(itertools.chain(*the_results))
+
+    return the_results
+
+
+def _get_results(get):
+    """Return the results fetched by `get`, raising :py:exc:`TaskFailed` or
+    :py:exc:`WrongTaskParameters` if a subtask failed."""
     try:
-        the_results = result.join()
+        return get()
     except TypeError, exc:
         raise WrongTaskParameters(exc.args[0])
     except Exception, exc:
         # At least one subtask failed.
         raise TaskFailed(exc.args[0])
 
-    if flatten_results:
-        if the_results:
-            if isinstance(the_results, list) or isinstance(the_results, tuple):
-                the_results = list(itertools.chain(*the_results))
 
-    return the_results
+class TaskSetMonitor(object):
+    """
+    Keep track of the subtasks of a running task set.
+
+    The workers push the completion of each subtask to a KVS list (see
+    :py:func:`_subtask_finished`), so that waiting for a task set doesn't
+    need polling the result backend.
+
+    :ivar result: the result of the task set
+    :ivar pending: the ids of the subtasks which haven't completed yet
+    :ivar timings: the run time in seconds of the completed subtasks, by
+        task id
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.key = tokens.taskset_done_key(result.taskset_id)
+        self.subtasks = dict(
+            (subtask.task_id, subtask) for subtask in result.subtasks)
+        self.pending = set(self.subtasks)
+        self.timings = {}
+
+        # e.g. when the tasks are run eagerly
+        self.check()
+
+    def done(self):
+        """Return ``True`` when all the subtasks have completed."""
+        return not self.pending
+
+    def update(self, completion):
+        """
+        Record the completion of a subtask, as pushed by a worker.
+
+        :raises WrongTaskParameters: When the subtask received a parameter it
+            does not know.
+        :raises TaskFailed: When the subtask failed, without waiting for the
+            other subtasks to complete.
+        """
+        task_id = completion['task_id']
+
+        if task_id not in self.pending:
+            return
+
+        self.pending.remove(task_id)
+        self.timings[task_id] = completion['time']
+
+        if completion['failed']:
+            _get_results(self.subtasks[task_id].get)
+
+        if not self.pending:
+            logs.LOG.debug(
+                "task set %s: %s subtasks, %.2f s max, %.2f s total"
+                % (self.result.taskset_id, len(self.timings),
+                   max(self.timings.values()), sum(self.timings.values())))
+
+    def check(self):
+        """
+        Check the state of the task set with the result backend, in case a
+        completion was not pushed.
+        """
+        if self.result.ready():
+            self.pending.clear()
+
+
+def _wait_for_any(monitors):
+    """
+    Wait for the completion of a subtask of any of the given task sets, at
+    most :py:data:`COMPLETION_CHECK_INTERVAL` seconds, after which the task
+    sets are checked with the result backend.
+
+    :param monitors: the task sets, not yet completed
+    :type monitors: list of :py:class:`TaskSetMonitor`
+    """
+    item = kvs.get_client().blpop([monitor.key for monitor in monitors],
+                                  COMPLETION_CHECK_INTERVAL)
+
+    if item is None:
+        for monitor in monitors:
+            monitor.check()
+    else:
+        key, value = item
+
+        for monitor in monitors:
+            if monitor.key == key:
+                monitor.update(json.loads(value))
+
+
+# the task set, start time and failure of the tasks running in this worker
+# process, by task id
+_RUNNING = {}
+
+
+def _subtask_started(task_id=None, task=None, **kwargs):
+    """Record the start of a task, connected to ``task_prerun``."""
+    taskset_id = getattr(task.request, "taskset", None)
+
+    if taskset_id:
+        _RUNNING[task_id] = dict(
+            taskset_id=taskset_id, start=time.time(), failed=False)
+
+
+def _subtask_failed(task_id=None, **kwargs):
+    """Record the failure of a task, connected to ``task_failure``."""
+    if task_id in _RUNNING:
+        _RUNNING[task_id]['failed'] = True
+
+
+def _subtask_finished(task_id=None, **kwargs):
+    """
+    Push the completion of a task to the KVS list of its task set (see
+    :py:class:`TaskSetMonitor`), connected to ``task_postrun``.
+    """
+    running = _RUNNING.pop(task_id, None)
+
+    if running is None:
+        return
+
+    key = tokens.taskset_done_key(running['taskset_id'])
+    completion = json.dumps(dict(
+        task_id=task_id, time=time.time() - running['start'],
+        failed=running['failed']))
+
+    kvs.get_client().pipeline().rpush(key, completion).expire(
+        key, COMPLETION_TTL).execute()
+
+
+signals.task_prerun.connect(_subtask_started)
+signals.task_failure.connect(_subtask_failed)
+signals.task_postrun.connect(_subtask_finished)
 
 
 class JobCompletedError(Exception):
@@ -183,13 +581,89 @@ class JobCompletedError(Exception):
     """
 
 
+class JobStatusCache(object):
+    """
+    Worker-local record of the completed jobs.
+
+    A :py:class:`~openquake.signalling.JobOutcomeMonitor` is run in a
+    background thread, so that the outcome of a job is pushed to the worker
+    as soon as it is signalled; the database is queried only the first time
+    a job is seen, for the jobs completed before the monitor was started.
+
+    If the monitor can't be started, or stops, every check goes to the
+    database.
+    """
+
+    def __init__(self):
+        self.pid = None
+        self.monitor = None
+        self.thread = None
+        self.checked = set()
+        self.lock = threading.Lock()
+
+    def is_job_completed(self, job_id):
+        """
+        Return ``True`` if the job ``job_id`` has succeeded or failed.
+        """
+        if not self._listening():
+            return Job.is_job_completed(job_id)
+
+        if job_id in self.monitor.completed:
+            return True
+
+        if job_id not in self.checked:
+            self.checked.add(job_id)
+
+            if Job.is_job_completed(job_id):
+                self.monitor.completed.add(job_id)
+
+        return job_id in self.monitor.completed
+
+    def _listening(self):
+        """
+        Start the monitor the first time it's called in a process, return
+        ``True`` if the monitor is running.
+        """
+        with self.lock:
+            # the monitor thread of the parent doesn't survive a fork
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = None
+                self.checked = set()
+
+            if self.thread is None:
+                try:
+                    self.monitor = signalling.JobOutcomeMonitor()
+                # pylint: disable=W0703
+                except Exception, exc:
+                    logs.LOG.warn(
+                        "Can't listen to the job outcome signals (%s), "
+                        "the job status will be read from the database"
+                        % exc)
+                    self.thread = False
+                else:
+                    self.thread = threading.Thread(target=self.monitor.run)
+                    self.thread.daemon = True
+                    self.thread.start()
+
+        return bool(self.thread) and self.thread.is_alive()
+
+
+# the job status record of this worker process
+JOB_STATUS = JobStatusCache()
+
+
 def check_job_status(job_id):
     """
     Helper function which is intended to be run by celery task functions.
 
+    The artifacts of a completed job are dropped from the worker-local
+    :data:`~openquake.kvs.cache.JOB_CACHE`.
+
     :raises JobCompletedError:
-        If :meth:`~openquake.job.Job.is_job_completed` returns ``True``
-        for ``job_id``.
+        If the job ``job_id`` is completed, according to
+        :data:`JOB_STATUS`.
     """
-    if Job.is_job_completed(job_id):
+    if JOB_STATUS.is_job_completed(job_id):
+        cache.JOB_CACHE.invalidate(job_id)
         raise JobCompletedError(job_id)
@@ -21,6 +21,8 @@ Base classes for the output methods of the various codecs.
 """
 
 import logging
+import re
+import struct
 from os.path import basename
 
 from django.db import transaction
@@ -29,10 +31,24 @@ from django.db import router
 from django.contrib.gis.db import models as gis_models
 
 from openquake.db import models
+from openquake.utils import config
+from openquake.utils.db import copy_rows
 
 LOGGER = logging.getLogger('serializer')
 LOGGER.setLevel(logging.DEBUG)
 
+# the ways a BulkInserter can send its rows to the database, see
+# :py:meth:`BulkInserter.flush`
+BULK_INSERT_BACKENDS = ("copy", "insert")
+DEFAULT_BULK_INSERT_BACKEND = "copy"
+DEFAULT_BULK_INSERT_CHUNK_SIZE = 10000
+
+# the points written by the DB writers, e.g. "POINT(-117.5 38.25)"
+POINT_RE = re.compile(r"^\s*POINT\s*\(\s*(\S+)\s+(\S+)\s*\)\s*$", re.I)
+
+# the EWKB type of a point with an SRID
+EWKB_POINT = 0x20000001
+
 
 class FileWriter(object):
     """Simple output half of the codec process."""
@@ -154,7 +170,6 @@ class DBWriter(object):
         each item of the iterable will be serialized in turn to the database.
         """
         LOGGER.info("> serialize")
-        LOGGER.info("serializing %s points" % len(iterable))
 
         if not self.output:
             self.insert_output(self.get_output_type())
@@ -165,16 +180,35 @@ class DBWriter(object):
         else:
             items = iterable
 
+        # the iterable can be a generator, count the points as they go
+        points = 0
+
         for key, values in items:
             self.insert_datum(key, values)
+            points += 1
 
         if self.bulk_inserter:
             self.bulk_inserter.flush()
 
-        LOGGER.info("serialized %s points" % len(iterable))
+        LOGGER.info("serialized %s points" % points)
         LOGGER.info("< serialize")
 
 
+class Reiterable(object):
+    """
+    An iterable whose items are produced by a generator function each time
+    it is iterated, so that it can be read by more than one writer (see
+    :py:class:`CompositeWriter`) without keeping the items in memory.
+    """
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __iter__(self):
+        return iter(self.function(*self.args))
+
+
 class CompositeWriter(object):
     """A writer that outputs to multiple writers"""
 
@@ -182,7 +216,15 @@ class CompositeWriter(object):
         self.writers = writers
 
     def serialize(self, iterable):
-        """Implementation of the "serialize" interface."""
+        """Implementation of the "serialize" interface.
+
+        Each writer reads the whole iterable in turn, so an iterator (e.g.
+        a generator) is turned into a list first; pass a
+        :py:class:`Reiterable` to have each writer read the items as they
+        are produced instead."""
+
+        if iter(iterable) is iterable:
+            iterable = list(iterable)
 
         for writer in self.writers:
             if writer:
@@ -203,17 +245,69 @@ def compose_writers(writers):
         return CompositeWriter(*writers)
 
 
+def bulk_insert_backend():
+    """
+    Return the name of the backend used by :py:class:`BulkInserter`, as set
+    by the `bulk_insert_backend` parameter in the `database` section of the
+    configuration.
+    """
+    backend = config.get("database", "bulk_insert_backend") \
+        or DEFAULT_BULK_INSERT_BACKEND
+
+    if backend not in BULK_INSERT_BACKENDS:
+        raise ValueError(
+            "unknown bulk insert backend '%s', valid backends are: %s"
+            % (backend, ", ".join(BULK_INSERT_BACKENDS)))
+
+    return backend
+
+
+def bulk_insert_chunk_size():
+    """
+    Return the maximum number of rows sent to the database by a
+    :py:class:`BulkInserter` at a time, as set by the
+    `bulk_insert_chunk_size` parameter in the `database` section of the
+    configuration.
+    """
+    value = config.get("database", "bulk_insert_chunk_size")
+    return int(value) if value else DEFAULT_BULK_INSERT_CHUNK_SIZE
+
+
+def ewkb(value, srid):
+    """
+    Return the hex encoded EWKB of a geometry given as WKT.
+
+    Points are encoded directly, any other geometry is passed on as EWKT,
+    which PostGIS accepts as well.
+    """
+    match = POINT_RE.match(value)
+
+    if match is None:
+        return "SRID=%d;%s" % (srid, value)
+
+    return struct.pack("<BIIdd", 1, EWKB_POINT, srid,
+                       float(match.group(1)),
+                       float(match.group(2))).encode("hex").upper()
+
+
 class BulkInserter(object):
     """Handle bulk object insertion"""
 
-    def __init__(self, dj_model):
+    def __init__(self, dj_model, max_cache_size=None, backend=None):
         """
         Create a new bulk inserter for a Django model class
 
         :param dj_model: Django model
         :type dj_model: :class:`django.db.models.Model`
+        :param int max_cache_size: the entries are flushed automatically
+            when this many are pending, defaults to
+            :py:func:`bulk_insert_chunk_size`
+        :param str backend: "copy" or "insert", defaults to
+            :py:func:`bulk_insert_backend`
         """
         self.table = dj_model
+        self.max_cache_size = max_cache_size or bulk_insert_chunk_size()
+        self.backend = backend or bulk_insert_backend()
         self.fields = None
         self.values = []
         self.count = 0
@@ -235,21 +329,46 @@ class BulkInserter(object):
             self.values.append(kwargs[k])
         self.count += 1
 
+        if self.count >= self.max_cache_size:
+            self.flush()
+
     def flush(self):
-        """Inserts the entries in the database using a bulk insert query"""
+        """
+        Inserts the entries in the database.
+
+        With the "copy" backend the entries are streamed with a ``COPY FROM
+        STDIN`` command, with the geometries encoded as EWKB; with the
+        "insert" backend, or when the connection does not support COPY, a
+        single multi-row INSERT query is used.
+        """
         if not self.values:
             return
 
         alias = router.db_for_write(self.table)
         cursor = connections[alias].cursor()
-        value_args = []
 
         field_map = dict()
         for f in self.table._meta.fields:  # pylint: disable=W0212
             field_map[f.column] = f
 
-        for f in self.fields:
-            col = field_map[f]
+        columns = [field_map[f] for f in self.fields]
+
+        if self.backend == "copy" and hasattr(cursor, "copy_expert"):
+            self._copy(cursor, columns)
+        else:
+            self._insert(cursor, columns)
+
+        transaction.set_dirty(using=alias)
+
+        self.fields = None
+        self.values = []
+        self.count = 0
+
+    def _insert(self, cursor, columns):
+        """Insert the entries with a multi-row INSERT query."""
+        value_args = []
+
+        for col in columns:
             if isinstance(col, gis_models.GeometryField):
                 value_args.append('GeomFromText(%%s, %d)' % col.srid)
             else:
@@ -260,8 +379,19 @@ class BulkInserter(object):
             self.table._meta.db_table, ", ".join(self.fields)) + \
             ", ".join(["(" + ", ".join(value_args) + ")"] * self.count)
         cursor.execute(sql, self.values)
-        transaction.set_dirty(using=alias)
 
-        self.fields = None
-        self.values = []
-        self.count = 0
+    def _copy(self, cursor, columns):
+        """Insert the entries with a ``COPY FROM STDIN`` command."""
+        values = list(self.values)
+        width = len(columns)
+
+        for i, col in enumerate(columns):
+            if isinstance(col, gis_models.GeometryField):
+                values[i::width] = [
+                    ewkb(value, col.srid) for value in values[i::width]]
+
+        rows = [values[i:i + width] for i in xrange(0, len(values), width)]
+
+        # pylint: disable=W0212
+        copy_rows(cursor, '"%s"' % self.table._meta.db_table, self.fields,
+                  rows)
@@ -24,12 +24,18 @@ including namespaces, and namespace maps.
 """
 
 import os
+import threading
+import time
 
 from lxml import etree
 
+from openquake import logs
 from openquake import shapes
+from openquake.utils import config
 
 
+LOG = logs.LOG
+
 NRML_SCHEMA_FILE = 'nrml.xsd'
 
 NRML_NS = 'http://openquake.org/xmlns/nrml/0.2'
@@ -131,6 +137,156 @@ def nrml_schema_file():
         'schema', NRML_SCHEMA_FILE)
 
 
+def validate_schema():
+    """
+    Return `True` if the NRML input files have to be validated against the
+    schema when parsed, as set by the `validate_schema` parameter in the
+    `nrml` section of the configuration (`true` by default).
+    """
+    value = (config.get("nrml", "validate_schema") or "true").lower()
+
+    if value not in ("true", "false"):
+        raise ValueError(
+            "invalid validate_schema value '%s', valid values are: "
+            "true, false" % value)
+
+    return value == "true"
+
+
+class SchemaRegistry(object):
+    """
+    A process-wide cache of compiled XML schemas.
+
+    Compiling the NRML schema set takes a noticeable fraction of a second,
+    so each schema is compiled the first time it is needed and then shared
+    by all the parsers of the process. The seconds spent compiling and
+    validating are accumulated separately in :py:attr:`compile_time` and
+    :py:attr:`validate_time`.
+
+    A compiled schema must not validate documents in several threads at
+    the same time: :py:meth:`validate` and :py:meth:`assert_valid` share
+    one schema and take a lock, while :py:meth:`parser_schema` gives each
+    thread its own schema, since a parser uses it for the whole parse.
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        # the schemas of the parsers, one set per thread
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self.compile_time = 0.0
+        self.validate_time = 0.0
+
+    def schema(self, schema_path=None):
+        """
+        Return the compiled schema.
+
+        :param schema_path: the path of the schema, the NRML schema by
+            default
+        :type schema_path: string
+        :returns: :py:class:`lxml.etree.XMLSchema`
+        """
+        schema_path = os.path.abspath(schema_path or nrml_schema_file())
+
+        with self._lock:
+            schema = self._schemas.get(schema_path)
+
+            if schema is None:
+                schema = self._compile(schema_path)
+                self._schemas[schema_path] = schema
+
+        return schema
+
+    def _compile(self, schema_path):
+        """Compile the schema, keeping track of the time it takes."""
+        start = time.time()
+        schema = etree.XMLSchema(etree.parse(schema_path))
+        elapsed = time.time() - start
+
+        with self._lock:
+            self.compile_time += elapsed
+
+        LOG.debug("Compiled XML schema %s in %.3f sec"
+                  % (schema_path, elapsed))
+
+        return schema
+
+    def validate(self, document, schema_path=None):
+        """
+        Check whether a parsed document validates against a schema.
+
+        :param document: the document
+        :type document: :py:class:`lxml.etree._ElementTree` or element
+        :param schema_path: the path of the schema, the NRML schema by
+            default
+        :returns: boolean success value
+        """
+        return self._validate(document, schema_path)[0]
+
+    def assert_valid(self, document, file_name, schema_path=None):
+        """
+        Like :py:meth:`validate`, but raise :py:exc:`XMLValidationError`
+        when the document is not valid.
+        """
+        valid, error = self._validate(document, schema_path)
+
+        if not valid:
+            raise XMLValidationError(error, file_name)
+
+    def _validate(self, document, schema_path):
+        """Validate the document, return the outcome and the last error."""
+        schema = self.schema(schema_path)
+
+        with self._lock:
+            start = time.time()
+            try:
+                valid = schema.validate(document)
+                return valid, None if valid else schema.error_log.last_error
+            finally:
+                self.validate_time += time.time() - start
+
+    def parser_schema(self, validate=None, schema_path=None):
+        """
+        Return the compiled schema to be passed to the lxml parsers
+        (e.g. `etree.iterparse`), or `None` for non validating parsing.
+
+        The schema is compiled once per thread, and must not be used by
+        other threads.
+
+        :param validate: whether the documents have to be validated, by
+            default as set by :py:func:`validate_schema`
+        :type validate: boolean
+        """
+        if validate is None:
+            validate = validate_schema()
+
+        if not validate:
+            return None
+
+        schema_path = os.path.abspath(schema_path or nrml_schema_file())
+        schemas = getattr(self._local, "schemas", None)
+
+        if schemas is None:
+            schemas = self._local.schemas = {}
+
+        if schema_path not in schemas:
+            schemas[schema_path] = self._compile(schema_path)
+
+        return schemas[schema_path]
+
+    def clear(self):
+        """Forget the compiled schemas and the collected times."""
+        with self._lock:
+            self._schemas.clear()
+            self._local = threading.local()
+            self.compile_time = 0.0
+            self.validate_time = 0.0
+
+
+# the schemas compiled by this process
+SCHEMAS = SchemaRegistry()
+
+
 def validates_against_xml_schema(xml_instance_path, schema_path):
     """
     Checks whether an XML file validates against an XML Schema
@@ -140,8 +296,7 @@ def validates_against_xml_schema(xml_instance_path, schema_path):
     :returns: boolean success value
     """
     xml_doc = etree.parse(xml_instance_path)
-    xmlschema = etree.XMLSchema(etree.parse(schema_path))
-    return xmlschema.validate(xml_doc)
+    return SCHEMAS.validate(xml_doc, schema_path)
 
 
 def element_equal_to_site(element, site):
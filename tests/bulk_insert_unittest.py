@@ -45,6 +45,12 @@ class DummyConnection(object):
         self.values = values
 
 
+class DummyCopyConnection(DummyConnection):
+    def copy_expert(self, sql, data):
+        self.sql = sql
+        self.data = data.read()
+
+
 class BulkInserterTestCase(unittest.TestCase):
     """
     Unit tests for the BulkInserter class, which simplifies database
@@ -138,3 +144,67 @@ class BulkInserterTestCase(unittest.TestCase):
 
         self.assertEquals('INSERT INTO "hzrdr"."gmf_data" (%s) VALUES (%s)' %
                           (", ".join(fields), values), connection.sql)
+
+    @transaction.commit_on_success('admin')
+    def test_flush_when_full(self):
+        inserter = BulkInserter(OqUser, max_cache_size=2)
+        connection = writer.connections['admin']
+
+        inserter.add_entry(user_name='user1', full_name='An user')
+        self.assertEquals(1, inserter.count)
+
+        inserter.add_entry(user_name='user2', full_name='Another user')
+        self.assertEquals(0, inserter.count)
+        self.assertEquals(
+            sorted(['user1', 'An user', 'user2', 'Another user']),
+            sorted(connection.values))
+
+    def test_flush_copy(self):
+        inserter = BulkInserter(GmfData)
+        connection = DummyCopyConnection()
+        writer.connections['reslt_writer'] = connection
+
+        inserter.add_entry(location='POINT(1 1)', output_id=1,
+                           ground_motion=0.5)
+        inserter.add_entry(location='POINT(2.5 -1)', output_id=1,
+                           ground_motion=None)
+        fields = inserter.fields
+        inserter.flush()
+
+        self.assertEquals('COPY "hzrdr"."gmf_data" (%s) FROM STDIN' %
+                          ", ".join(fields), connection.sql)
+
+        rows = [dict(zip(fields, line.split('\t')))
+                for line in connection.data.splitlines()]
+
+        self.assertEquals(
+            [{'location': writer.ewkb('POINT(1 1)', 4326),
+              'output_id': '1', 'ground_motion': '0.5'},
+             {'location': writer.ewkb('POINT(2.5 -1)', 4326),
+              'output_id': '1', 'ground_motion': '\\N'}], rows)
+        self.assertEquals(0, inserter.count)
+
+    def test_flush_insert_backend(self):
+        inserter = BulkInserter(GmfData, backend='insert')
+        connection = DummyCopyConnection()
+        writer.connections['reslt_writer'] = connection
+
+        inserter.add_entry(location='POINT(1 1)', output_id=1)
+        inserter.flush()
+
+        self.assertTrue(connection.sql.startswith('INSERT INTO'))
+
+
+class EWKBTestCase(unittest.TestCase):
+    """Tests for the encoding of the geometries sent with COPY"""
+
+    def test_point(self):
+        self.assertEquals(
+            '0101000020E6100000000000000000F03F0000000000000040',
+            writer.ewkb('POINT(1 2)', 4326))
+        self.assertEquals(writer.ewkb('POINT(1 2)', 4326),
+                          writer.ewkb(' point ( 1.0  2.0 ) ', 4326))
+
+    def test_other_geometries(self):
+        self.assertEquals('SRID=4326;LINESTRING(1 2, 3 4)',
+                          writer.ewkb('LINESTRING(1 2, 3 4)', 4326))
@@ -26,6 +26,7 @@ import unittest
 from openquake import java
 from openquake import xml
 from openquake.db import models
+from openquake.utils import db
 from openquake.utils.db import loader as db_loader
 
 from tests.utils import helpers
@@ -307,6 +308,34 @@ class NrmlModelLoaderTestCase(unittest.TestCase):
             ['hzrdi.mfd_tgr', 'hzrdi.simple_fault', 'hzrdi.source']
         self._serialize_test_helper(TGR_MFD_TEST_FILE, expected_tables)
 
+    def test_write_simple_faults(self):
+        """
+        Several simple faults are written at once, each source refers to
+        its own simple fault, each simple fault to its own MFD.
+        """
+        simple_data = [db_loader.parse_simple_fault_src(self.simple)
+                       for _ in xrange(3)]
+
+        results = db_loader.write_simple_faults(simple_data, 1, None)
+
+        self.assertEqual(
+            ['hzrdi.mfd_evd', 'hzrdi.simple_fault', 'hzrdi.source'] * 3,
+            [x.keys()[0] for x in results])
+
+        for i in xrange(3):
+            mfd_id, fault_id, source_id = [
+                x.values()[0] for x in results[i * 3:i * 3 + 3]]
+
+            source = models.Source.objects.get(id=source_id)
+            self.assertEqual(fault_id, source.simple_fault.id)
+            self.assertEqual(mfd_id, source.simple_fault.mfd_evd.id)
+            self.assertEqual('Mount Diablo Thrust', source.name)
+            self.assertEqual(38.0, source.simple_fault.dip)
+
+            # the depths of the geometries are kept
+            self.assertTrue(source.simple_fault.edge.hasz)
+            self.assertTrue(source.simple_fault.outline.hasz)
+
 
 class CsvLoaderTestCase(unittest.TestCase):
     """
@@ -436,3 +465,43 @@ class CsvLoaderTestCase(unittest.TestCase):
         csv_loader.csv_fd.seek(0)
 
         self._verify_db_data(csv_loader, db_rows)
+
+    def test_csv_to_db_loader_in_batches(self):
+        """
+            The rows are loaded in batches, the last one may be smaller
+            than the others.
+        """
+
+        csv_loader = db_loader.CsvModelLoader(self.csv_path, batch_size=7)
+        csv_loader.serialize()
+        db_rows = self._retrieve_db_data()
+
+        self.assertEqual(100, len(db_rows))
+
+        # rewind the file
+        csv_loader.csv_fd.seek(0)
+
+        self._verify_db_data(csv_loader, db_rows)
+
+
+class CopyValueTestCase(unittest.TestCase):
+    """
+        Tests for the formatting of values in the COPY text format
+    """
+
+    def test_null(self):
+        self.assertEqual(r'\N', db.copy_value(None))
+
+    def test_float_keeps_its_precision(self):
+        self.assertEqual(0.1, float(db.copy_value(0.1)))
+        self.assertEqual('1e-07', db.copy_value(1e-7))
+
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(r'a\tb\nc\rd\\e',
+                         db.copy_value('a\tb\nc\rd\\e'))
+
+    def test_list_is_an_array(self):
+        self.assertEqual('{0.5,1.5,\\N}', db.copy_value([0.5, 1.5, None]))
+
+    def test_unicode_is_utf8_encoded(self):
+        self.assertEqual('\xc3\xa8', db.copy_value(u'\xe8'))
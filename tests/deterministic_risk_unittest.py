@@ -85,60 +85,6 @@ class DeterministicRiskTestCase(unittest.TestCase):
 
         self.assertEqual(expected_gmvs, actual_gmvs)
 
-    def test_load_assets_for_point(self):
-        """
-        Exercises the function
-        :py:func:`openquake.risk.job.deterministic.load_assets_for_point`.
-        """
-
-        kvs.flush()
-
-        # Fabricate some test data.
-        test_assets = [
-            {'assetValue': 2129.5,
-             'assetID': '104',
-             'listDescription': 'fake_description',
-             'structureCategory': 'S4L_MC',
-             'lon': 0.11,
-             'assetDescription': 'LA building',
-             'vulnerabilityFunctionReference': 'HAZUS_S4L_MC',
-             'listID': 'LA01',
-             'assetValueUnit': 'EUR',
-             'lat': 0.11},
-            {'assetValue': 2229.5,
-             'assetID': '105',
-             'listDescription': 'fake_description',
-             'structureCategory': 'S4L_MC',
-             'lon': 0.11,
-             'assetDescription': 'LA building',
-             'vulnerabilityFunctionReference': 'HAZUS_S4L_MC',
-             'listID': 'LA02',
-             'assetValueUnit': 'EUR',
-             'lat': 0.12}]
-
-        test_site = shapes.Site(0.1, 0.1)
-        test_point = TEST_REGION.grid.point_at(test_site)
-
-        encoder = json.JSONEncoder()
-
-        assets_key = kvs.tokens.asset_key(
-            TEST_JOB_ID, test_point.row, test_point.column)
-
-        # Throw the test data into the KVS.
-        for asset in test_assets:
-            kvs.get_client().rpush(assets_key, encoder.encode(asset))
-
-        # The data should now be in the KVS.
-        # Now verify that the load_assets_for_point function returns
-        # the appropriate data.
-        actual_assets = \
-            risk_job_det.load_assets_for_point(TEST_JOB_ID, test_point)
-
-        kvs.flush()
-
-        # They should come out exactly the way they went in.
-        self.assertEqual(test_assets, actual_assets)
-
     def test_deterministic_job_completes(self):
         """
         Exercise the deterministic risk job and make sure it runs end-to-end.
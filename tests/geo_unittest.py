@@ -100,6 +100,59 @@ class GridTestCase(unittest.TestCase):
             print "Point at %s and %s" % (point.row, point.column)
             # TODO(JMC): assert the sequence is correct
 
+    def _region(self):
+        """An irregular region with a hole, some of its vertices and edges
+        lie on the grid."""
+        polygon = shapes.geometry.Polygon(
+            [(1.0, 1.0), (1.0, 3.0), (2.05, 3.33), (3.5, 2.5), (3.0, 1.0)],
+            [[(1.5, 1.5), (1.5, 2.0), (2.0, 2.0), (2.0, 1.5)]])
+        region = shapes.Region(polygon)
+        region.cell_size = 0.1
+        return region
+
+    def _expected_points(self, grid):
+        """The grid points contained by the region, checked one by one."""
+        expected = []
+        for row in range(grid.rows):
+            for col in range(grid.columns):
+                point = shapes.GridPoint(grid, col, row)
+                try:
+                    grid.check_gridpoint(point)
+                    expected.append(point)
+                except shapes.BoundsException:
+                    pass
+        return expected
+
+    def test_mask_matches_the_check_of_each_point(self):
+        grid = self._region().grid
+        expected = self._expected_points(grid)
+        mask = grid.mask()
+
+        self.assertEqual((grid.rows, grid.columns), mask.shape)
+        self.assertEqual(len(expected), mask.sum())
+        for point in expected:
+            self.assertTrue(mask[point.row, point.column])
+
+    def test_grid_iterates_the_contained_points_in_order(self):
+        grid = self._region().grid
+        points = list(grid)
+
+        self.assertEqual(self._expected_points(grid), points)
+        # the same points are generated when the mask is already there
+        grid.mask()
+        self.assertEqual(points, list(grid))
+
+    def test_site_arrays(self):
+        region = self._region()
+        expected = [point.site for point in region.grid]
+        chunks = list(region.grid.site_arrays(chunk_size=100))
+
+        self.assertTrue(len(chunks) > 1)
+        sites = [shapes.Site(lon, lat) for lons, lats in chunks
+                 for lon, lat in zip(lons, lats)]
+        self.assertEqual(expected, sites)
+        self.assertEqual(expected, region.sites)
+
 
 class GeoCurveTestCase(unittest.TestCase):
 
@@ -24,6 +24,7 @@ Unit tests for classic PSHA hazard computations with the hazard engine.
 import multiprocessing
 import unittest
 
+from openquake import kvs
 from openquake import logs
 from openquake import shapes
 
@@ -104,6 +105,31 @@ class DoCurvesTestCase(helpers.TestMixin, unittest.TestCase):
                              the_task=test_compute_hazard_curve)
         self.assertEqual(2, fake_serializer.number_of_calls)
 
+    def test_concurrent_realizations_are_all_serialized(self):
+        """With concurrent realizations each one is still serialized once and
+        gets its own logic tree samples."""
+        stored = []
+        serialized = []
+
+        def fake_store(key):
+            """Record the key of the stored logic tree sample."""
+            stored.append(key)
+
+        self.mixin.calc.sampleAndSaveERFTree = (
+            lambda cache, key, seed: fake_store(key))
+        self.mixin.params["CONCURRENT_REALIZATIONS"] = "2"
+
+        self.mixin.do_curves(
+            self.sites, 2,
+            serializer=lambda sites, realization: serialized.append(
+                realization),
+            the_task=test_compute_hazard_curve)
+
+        self.assertEqual([0, 1], sorted(serialized))
+        self.assertEqual(
+            [kvs.tokens.source_model_key(self.mixin.job_id, 0),
+             kvs.tokens.source_model_key(self.mixin.job_id, 1)], stored)
+
 
 class DoMeansTestCase(helpers.TestMixin, unittest.TestCase):
     """Tests the behaviour of ClassicalMixin.do_means()."""
@@ -414,3 +440,60 @@ class NumberOfTasksTestCase(helpers.TestMixin, unittest.TestCase):
         """
         self.mixin.params = dict(HAZARD_TASKS=" 	")
         self.assertRaises(ValueError, self.mixin.number_of_tasks)
+
+
+class ConcurrentRealizationsTestCase(helpers.TestMixin, unittest.TestCase):
+    """Tests the behaviour of ClassicalMixin.concurrent_realizations()."""
+
+    def setUp(self):
+        params = {'CALCULATION_MODE': 'Hazard'}
+
+        self.mixin = self.create_job_with_mixin(params, opensha.ClassicalMixin)
+
+    def tearDown(self):
+        self.unload_job_mixin()
+
+    def test_concurrent_realizations_with_param_not_set(self):
+        """By default realizations are computed one at a time."""
+        self.mixin.params = dict()
+        self.assertEqual(1, self.mixin.concurrent_realizations())
+
+    def test_concurrent_realizations_with_param_set(self):
+        """The `CONCURRENT_REALIZATIONS` parameter is used when set."""
+        self.mixin.params = dict(CONCURRENT_REALIZATIONS=" 4 ")
+        self.assertEqual(4, self.mixin.concurrent_realizations())
+
+    def test_concurrent_realizations_is_at_least_one(self):
+        """At least one realization is computed at a time."""
+        self.mixin.params = dict(CONCURRENT_REALIZATIONS="0")
+        self.assertEqual(1, self.mixin.concurrent_realizations())
+
+
+class DynamicDistributionTestCase(helpers.TestMixin, unittest.TestCase):
+    """Tests the behaviour of ClassicalMixin.dynamic_distribution()."""
+
+    def setUp(self):
+        params = {'CALCULATION_MODE': 'Hazard'}
+
+        self.mixin = self.create_job_with_mixin(params, opensha.ClassicalMixin)
+
+    def tearDown(self):
+        self.unload_job_mixin()
+
+    def test_dynamic_distribution_with_param_not_set(self):
+        """By default the sites are cut in equal portions."""
+        self.mixin.params = dict()
+        self.assertFalse(self.mixin.dynamic_distribution())
+
+    def test_dynamic_distribution_with_param_set(self):
+        """The `TASK_DISTRIBUTION` parameter is used when set."""
+        self.mixin.params = dict(TASK_DISTRIBUTION=" Dynamic ")
+        self.assertTrue(self.mixin.dynamic_distribution())
+
+        self.mixin.params = dict(TASK_DISTRIBUTION="static")
+        self.assertFalse(self.mixin.dynamic_distribution())
+
+    def test_dynamic_distribution_with_param_set_but_invalid(self):
+        """An invalid `TASK_DISTRIBUTION` raises a `ValueError`."""
+        self.mixin.params = dict(TASK_DISTRIBUTION="adaptive")
+        self.assertRaises(ValueError, self.mixin.dynamic_distribution)
@@ -18,6 +18,7 @@
 # <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
 
 
+import mock
 import os
 import unittest
 
@@ -28,6 +29,7 @@ from openquake import shapes
 from openquake import xml
 
 from openquake.output import hazard as hazard_output
+from openquake.output import nrml
 from openquake.parser import hazard as hazard_parser
 
 TEST_FILE = "hazard-curves.xml"
@@ -282,3 +284,90 @@ class HazardCurveXMLWriterTestCase(unittest.TestCase):
             return result.read()
         finally:
             result.close()
+
+
+def _hazard_curve(site, label, imls):
+    """A hazard curve as expected by HazardCurveXMLWriter."""
+    return (site,
+            {"IDmodel": "MMI_3_1",
+             "investigationTimeSpan": 50.0,
+             "endBranchLabel": label,
+             "IMLValues": imls,
+             "saPeriod": 0.1,
+             "saDamping": 1.0,
+             "IMT": "PGA",
+             "PoEValues": [0.1, 0.2, 0.3]})
+
+
+class IncrementalXMLWriterTestCase(unittest.TestCase):
+    """The incremental mode of the hazard XML writers produces the same
+    documents written when the whole tree is kept in memory."""
+
+    def _serialize(self, writer_class, data, incremental):
+        path = helpers.get_output_path("hazard-incremental.xml")
+        writer_class(path, incremental=incremental).serialize(data)
+
+        try:
+            return open(path).read()
+        finally:
+            os.remove(path)
+
+    def _assert_same_output(self, writer_class, data):
+        self.assertEqual(self._serialize(writer_class, data, False),
+                         self._serialize(writer_class, data, True))
+
+    def test_hazard_curves(self):
+        data = [
+            _hazard_curve(shapes.Site(-122.5, 37.5), "3_1", [5.0, 6.0, 7.0]),
+            _hazard_curve(shapes.Site(-122.4, 37.5), "3_1", [5.0, 6.0, 7.0]),
+            _hazard_curve(shapes.Site(-122.5, 37.5), "3_2", [5.0, 6.0, 7.0]),
+            _hazard_curve(shapes.Site(-122.4, 37.5), "3_2", [8.0, 9.0, 10.0])]
+
+        self._assert_same_output(hazard_output.HazardCurveXMLWriter, data)
+
+    def test_hazard_curves_of_a_label_have_to_be_consecutive(self):
+        data = [
+            _hazard_curve(shapes.Site(-122.5, 37.5), "3_1", [5.0, 6.0, 7.0]),
+            _hazard_curve(shapes.Site(-122.5, 37.5), "3_2", [5.0, 6.0, 7.0]),
+            _hazard_curve(shapes.Site(-122.4, 37.5), "3_1", [5.0, 6.0, 7.0])]
+
+        path = helpers.get_output_path("hazard-incremental.xml")
+        writer = hazard_output.HazardCurveXMLWriter(path, incremental=True)
+
+        self.assertRaises(ValueError, writer.serialize, data)
+
+    def test_the_skeleton_is_not_serialized_for_each_node(self):
+        serialize = nrml.IncrementalTreeWriter._serialize
+        calls = []
+
+        def counting_serialize(tree_writer):
+            calls.append(tree_writer)
+
+            return serialize(tree_writer)
+
+        for nodes in (2, 10):
+            data = [_hazard_curve(shapes.Site(-122.5 + 0.1 * i, 37.5), "3_1",
+                                  [5.0, 6.0, 7.0]) for i in xrange(nodes)]
+
+            with mock.patch.object(nrml.IncrementalTreeWriter, '_serialize',
+                                   counting_serialize):
+                self._serialize(hazard_output.HazardCurveXMLWriter, data,
+                                True)
+
+        # the same number of calls for 2 and 10 nodes
+        self.assertEqual(len(calls) / 2, calls.count(calls[0]))
+
+    def test_hazard_map(self):
+        data = [(shapes.Site(-121.7 + 0.1 * i, 37.6),
+                 {'IML': 1.9 + 0.01 * i,
+                  'IMT': 'PGA',
+                  'investigationTimeSpan': '50.0',
+                  'poE': 0.01,
+                  'statistics': 'mean',
+                  'vs30': 760.0}) for i in xrange(3)]
+
+        self._assert_same_output(hazard_output.HazardMapXMLWriter, data)
+
+    def test_gmf(self):
+        self._assert_same_output(hazard_output.GMFXMLWriter,
+                                 GMF_NORUPTURE_TEST_DATA)
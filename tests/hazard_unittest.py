@@ -26,6 +26,7 @@ Includes:
 """
 
 import json
+import mock
 import numpy
 import os
 import unittest
@@ -758,6 +759,89 @@ class QuantileHazardCurveComputationTestCase(helpers.TestMixin,
             self.job_id, site, value)))
 
 
+class BlockCurvesComputationTestCase(unittest.TestCase):
+    """Tests for the mean and quantile curves computed over a block of
+    sites, which must match the curves computed one site at a time."""
+
+    def setUp(self):
+        random = numpy.random.RandomState(42)
+        # 5 sites, 37 realizations, 19 IMLs
+        self.block = random.random_sample((5, 37, 19))
+
+    def test_mean_curves_match_the_single_site_ones(self):
+        curves = classical_psha.compute_mean_curves(self.block)
+
+        for site in xrange(len(self.block)):
+            self.assertTrue(numpy.array_equal(
+                classical_psha.compute_mean_curve(list(self.block[site])),
+                curves[site]))
+
+    def test_quantile_curves_match_the_single_site_ones(self):
+        quantiles = [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0]
+
+        for block in (self.block, self.block[:, :2, :], self.block[:, :1, :]):
+            curves = classical_psha.compute_quantile_curves(block, quantiles)
+
+            for i, quantile in enumerate(quantiles):
+                for site in xrange(len(block)):
+                    self.assertTrue(numpy.array_equal(
+                        classical_psha.compute_quantile_curve(
+                            list(block[site]), quantile),
+                        curves[i, site]))
+
+    def test_empty_curves_produce_empty_quantile_curves(self):
+        curves = classical_psha.compute_quantile_curves(
+            numpy.zeros((2, 1, 0)), [0.25, 0.75])
+
+        self.assertEqual((2, 2, 0), curves.shape)
+
+
+class BlockHazardCurvesTestCase(unittest.TestCase):
+    """Tests for the mean and quantile curves of sites spanning more than
+    one block."""
+
+    def setUp(self):
+        self.job_id = helpers.create_job({}).job_id
+        self.sites = [shapes.Site(1.0, 1.0), shapes.Site(1.5, 1.0),
+                      shapes.Site(2.0, 1.0)]
+        self.curves = numpy.random.RandomState(7).random_sample((3, 4, 19))
+
+        kvs.flush()
+
+        for site, site_curves in zip(self.sites, self.curves):
+            for realization, curve in enumerate(site_curves):
+                kvs.set_value_array(kvs.tokens.hazard_curve_poes_key(
+                    self.job_id, realization, site), curve)
+
+    def test_hazard_curves_block(self):
+        block = classical_psha.hazard_curves_block(
+            self.job_id, self.sites, 4)
+
+        self.assertTrue(numpy.array_equal(self.curves, block))
+
+    def test_missing_curves_are_detected(self):
+        self.assertRaises(ValueError, classical_psha.hazard_curves_block,
+                          self.job_id, self.sites, 5)
+
+    def test_all_the_blocks_are_processed(self):
+        with mock.patch("openquake.hazard.classical_psha.CURVE_BLOCK_SIZE",
+                        2):
+            classical_psha.compute_mean_hazard_curves(
+                self.job_id, self.sites, 4)
+            classical_psha.compute_quantile_hazard_curves(
+                self.job_id, self.sites, 4, [0.5])
+
+        for site, site_curves in zip(self.sites, self.curves):
+            self.assertTrue(numpy.array_equal(
+                classical_psha.compute_mean_curve(list(site_curves)),
+                kvs.get_value_array(kvs.tokens.mean_hazard_curve_key(
+                    self.job_id, site))))
+            self.assertTrue(numpy.array_equal(
+                classical_psha.compute_quantile_curve(list(site_curves), 0.5),
+                kvs.get_value_array(kvs.tokens.quantile_hazard_curve_key(
+                    self.job_id, site, 0.5))))
+
+
 class MeanQuantileHazardMapsComputationTestCase(helpers.TestMixin,
                                                 unittest.TestCase):
 
@@ -21,12 +21,14 @@
 import unittest
 import os
 
+from openquake import kvs
 from openquake.job import Job
 from openquake.job.mixins import Mixin
 from openquake.output.hazard import *
 from openquake.input.exposure import ExposureDBWriter
 from openquake.parser.exposure import ExposurePortfolioFile
 from openquake.risk.job.classical_psha import ClassicalPSHABasedMixin
+from openquake.risk.job.general import Block, read_hazard_curves
 from openquake.risk.job.probabilistic import ProbabilisticEventMixin
 from openquake.shapes import Site, Region
 
@@ -134,6 +136,20 @@ class HazardCurveDBReadTestCase(unittest.TestCase, helpers.DbTestMixin):
             self.assertEquals(list(curve2.ordinates),
                               [0.454, 0.214, 0.123, 0.102])
 
+    def test_read_curves(self):
+        """Verify read_hazard_curves."""
+        sites = [Site(-122.2, 37.5), Site(-122.1, 37.5), Site(-122.0, 37.5)]
+        curves = read_hazard_curves(self.job.id, sites)
+
+        # there is no curve for the last site
+        self.assertEquals(set(sites[:2]), set(curves.keys()))
+        self.assertEquals(list(curves[sites[0]].ordinates),
+                          [0.354, 0.114, 0.023, 0.002])
+        self.assertEquals(list(curves[sites[1]].ordinates),
+                          [0.454, 0.214, 0.123, 0.102])
+
+        self.assertEquals({}, read_hazard_curves(self.job.id, []))
+
 
 class GmfDBReadTestCase(unittest.TestCase, helpers.DbTestMixin):
     """
@@ -152,46 +168,56 @@ class GmfDBReadTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    def test_site_keys(self):
-        """Verify _sites_to_gmf_keys"""
+    def test_read_fields_of_the_given_sites_only(self):
+        """The GMFs are loaded in a (GMFs x sites) array, indexed by the
+        grid points of the given sites."""
         params = {
             'REGION_VERTEX': '40,-117, 42,-117, 42,-116, 40,-116',
             'REGION_GRID_SPACING': '1.0'}
         with Mixin(helpers.create_job(params, job_id=self.job.id),
                    ProbabilisticEventMixin) as mixin:
-            keys = mixin._sites_to_gmf_keys([Site(-117, 40), Site(-116, 42)])
-
-            self.assertEquals(["0!0", "2!1"], keys)
-
-    def test_read_gmfs(self):
-        """Verify _get_db_gmfs."""
+            grid = mixin.region.grid
+            points = [grid.point_at(Site(-116, 41)),
+                      grid.point_at(Site(-117, 40)),
+                      grid.point_at(Site(-116, 41))]
+
+            fields, index = mixin._get_db_fields(self.job.id, points)
+
+            self.assertEquals((3, 2), fields.shape)
+            self.assertEquals({(1, 1): 0, (0, 0): 1}, index)
+            self.assertEquals([0.3, 0.7, 1.2],
+                              [round(i, 1) for i in fields[:, 0]])
+            self.assertEquals([0.1, 0.5, 0.0],
+                              [round(i, 1) for i in fields[:, 1]])
+
+    def test_store_gmfs(self):
+        """The GMF values of the sites of each block are stored in the KVS,
+        the other sites are not."""
         params = {
             'REGION_VERTEX': '40,-117, 42,-117, 42,-116, 40,-116',
             'REGION_GRID_SPACING': '1.0'}
+        block = Block([Site(-117, 40), Site(-116, 41)])
+        block.to_kvs()
+
         with Mixin(helpers.create_job(params, job_id=self.job.id),
                    ProbabilisticEventMixin) as mixin:
-            self.assertEquals(3, len(mixin._gmf_db_list(self.job.id)))
+            mixin.blocks_keys = [block.block_id]
+            mixin.store_gmfs()
 
-            # only the keys in gmfs are used
-            gmfs = mixin._get_db_gmfs([], self.job.id)
-            self.assertEquals({}, gmfs)
+            gmfs = {}
+            for row in xrange(3):
+                for column in xrange(2):
+                    values = kvs.get_value_array(kvs.tokens.gmf_set_key(
+                        self.job.id, column, row))
 
-            # only the keys in gmfs are used
-            sites = [Site(lon, lat)
-                            for lon in xrange(-117, -115)
-                            for lat in xrange(40, 43)]
-            gmfs = mixin._get_db_gmfs(sites, self.job.id)
-            # avoid rounding errors
-            for k, v in gmfs.items():
-                gmfs[k] = [round(i, 1) for i in v]
+                    if values is not None:
+                        # avoid rounding errors
+                        gmfs["%s!%s" % (row, column)] = [
+                            round(i, 1) for i in values]
 
             self.assertEquals({
                     '0!0': [0.1, 0.5, 0.0],
-                    '0!1': [0.2, 0.6, 0.0],
-                    '1!0': [0.4, 0.8, 1.3],
                     '1!1': [0.3, 0.7, 1.2],
-                    '2!0': [0.0, 0.0, 1.0],
-                    '2!1': [0.0, 0.0, 1.1],
                     }, gmfs)
 
 
@@ -250,3 +276,16 @@ class ExposureDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         self.assertEquals('RC-LR-PC', assets[2].structure_type)
         self.assertEquals(shapes.Site(9.14777, 45.17999),
                           _to_site(assets[2].site))
+
+    def test_read_exposure_in_batches(self):
+        """The assets are loaded in batches of `batch_size` assets."""
+        path = os.path.join(helpers.SCHEMA_EXAMPLES_DIR, TEST_FILE)
+        writer = ExposureDBWriter(self.default_user(), batch_size=2)
+
+        writer.serialize(ExposurePortfolioFile(path))
+
+        self.assertEquals(3, writer.count)
+        self.assertEquals(
+            ['asset_01', 'asset_02', 'asset_03'],
+            sorted(writer.model.exposuredata_set.values_list(
+                'asset_ref', flat=True)))
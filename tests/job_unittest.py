@@ -18,6 +18,7 @@
 
 import mock
 import os
+import socket
 import unittest
 
 from django.contrib.gis.geos.polygon import Polygon
@@ -191,6 +192,17 @@ class JobTestCase(unittest.TestCase):
         self.assertEqual(self.job, Job.from_kvs(self.job.job_id))
         helpers.cleanup_loggers()
 
+    def test_intermediate_key_ttl(self):
+        self.job.params["KVS_INTERMEDIATE_KEY_TTL"] = " 3600 "
+        self.assertEqual(3600, self.job.intermediate_key_ttl())
+
+    def test_intermediate_key_ttl_when_not_set(self):
+        self.job.params.pop("KVS_INTERMEDIATE_KEY_TTL", None)
+        self.assertTrue(self.job.intermediate_key_ttl() is None)
+
+        self.job.params["KVS_INTERMEDIATE_KEY_TTL"] = ""
+        self.assertTrue(self.job.intermediate_key_ttl() is None)
+
 
 class JobDbRecordTestCase(unittest.TestCase):
 
@@ -621,6 +633,35 @@ class RunJobTestCase(unittest.TestCase):
         self.assertEquals(1, self.job.launch.call_count)
         self.assertEquals('failed', self._job_status())
 
+    def test_signalling_errors_keep_the_job_outcome(self):
+        """When the job is not supervised and its outcome can't be
+        signalled the job still succeeds, or fails with its own error."""
+        # the first job succeeds, the second one fails
+        launch_effects = [None, ValueError('OMG!')]
+
+        with patch('openquake.job.Job.from_file') as from_file:
+
+            def patch_job_launch(*args, **kwargs):
+                self.job = self.job_from_file(*args, **kwargs)
+                self.job.launch = mock.Mock(side_effect=launch_effects.pop(0))
+
+                return self.job
+
+            from_file.side_effect = patch_job_launch
+
+            with mock.patch('openquake.job.spawn_job_supervisor') as spawn:
+                spawn.return_value = None
+
+                with mock.patch('openquake.signalling.signal_job_outcome',
+                                side_effect=socket.error('no broker')):
+                    run_job(helpers.get_data_path(CONFIG_FILE), 'db')
+                    self.assertEquals('succeeded', self._job_status())
+
+                    self.assertRaises(ValueError, run_job,
+                                      helpers.get_data_path(CONFIG_FILE),
+                                      'db')
+                    self.assertEquals('failed', self._job_status())
+
     def test_invalid_job_lifecycle(self):
         with patch('openquake.job.Job.from_file') as from_file:
 
@@ -660,6 +701,25 @@ class RunJobTestCase(unittest.TestCase):
 
         self.assertEquals(expected_sites, engine.sites_to_compute())
 
+    def test_region_is_cached(self):
+        """The region is built again only when the parameters it depends
+        on change."""
+        sections = [config.HAZARD_SECTION, config.GENERAL_SECTION]
+        input_region = "2.0, 1.0, 2.0, 2.0, 1.0, 2.0, 1.0, 1.0"
+
+        params = {config.INPUT_REGION: input_region,
+                config.REGION_GRID_SPACING: 1.0}
+
+        engine = helpers.create_job(params, sections=sections)
+        region = engine.region
+
+        self.assertTrue(region is engine.region)
+
+        engine.params[config.REGION_GRID_SPACING] = 0.5
+
+        self.assertFalse(region is engine.region)
+        self.assertEqual(0.5, engine.region.cell_size)
+
     def test_computes_specific_sites_when_specified(self):
         """When we have hazard jobs only, and we specify a list of sites
         (SITES parameter in the configuration file) we trigger the
@@ -19,6 +19,7 @@
 
 
 import json
+import mock
 import numpy
 import os
 
@@ -27,6 +28,8 @@ import unittest
 from openquake import java
 from openquake import kvs
 from openquake import logs
+from openquake.kvs import cache
+from openquake.kvs import memory
 from openquake.utils import config
 from tests.utils import helpers
 from tests.utils.helpers import patch
@@ -64,6 +67,206 @@ class JSONEncoderTestCase(unittest.TestCase):
                          encoder.encode(numpy.array([1.0, 2.0, 3.0])))
 
 
+class ArrayCodecTestCase(unittest.TestCase):
+    """
+    Tests for the binary array format used to store numeric values.
+    """
+
+    def test_encode_decode_round_trip(self):
+        values = numpy.array([0.98161, 0.00022489, 4.2696e-07])
+        decoded = kvs.decode_array(kvs.encode_array(values))
+
+        self.assertEqual(values.dtype, decoded.dtype)
+        self.assertTrue(numpy.array_equal(values, decoded))
+
+    def test_encode_decode_lists_and_empty_arrays(self):
+        self.assertEqual([1.0, 2.0], kvs.decode_array(
+            kvs.encode_array([1, 2])).tolist())
+        self.assertEqual((0, ), kvs.decode_array(kvs.encode_array([])).shape)
+
+    def test_encode_decode_keeps_the_shape(self):
+        values = numpy.arange(6.0).reshape((2, 3))
+
+        self.assertTrue(numpy.array_equal(
+            values, kvs.decode_array(kvs.encode_array(values))))
+
+    def test_json_is_not_an_encoded_array(self):
+        self.assertTrue(kvs.is_encoded_array(kvs.encode_array([1.0])))
+        self.assertFalse(kvs.is_encoded_array('[1.0, 2.0]'))
+        self.assertFalse(kvs.is_encoded_array(None))
+        self.assertRaises(ValueError, kvs.decode_array, '[1.0, 2.0]')
+
+    def test_unsupported_version_is_rejected(self):
+        value = kvs.encode_array([1.0])
+        value = value[:4] + chr(kvs.ARRAY_FORMAT_VERSION + 1) + value[5:]
+
+        self.assertRaises(ValueError, kvs.decode_array, value)
+
+
+class JobCacheTestCase(unittest.TestCase):
+    """
+    Tests for the worker-local cache of job artifacts.
+    """
+
+    def setUp(self):
+        self.cache = cache.JobCache(size=2)
+        self.loads = []
+
+    def _loader(self, value):
+        def load():
+            self.loads.append(value)
+            return value
+
+        return load
+
+    def test_values_are_loaded_only_once(self):
+        self.assertEqual("ERF", self.cache.get(1, "erf", self._loader("ERF")))
+        self.assertEqual("ERF", self.cache.get(1, "erf", self._loader("ERF")))
+
+        self.assertEqual(["ERF"], self.loads)
+        self.assertEqual(dict(hits=1, misses=1, entries=1),
+                         self.cache.stats())
+
+    def test_values_are_keyed_by_job(self):
+        self.cache.get(1, "erf", self._loader("ERF 1"))
+
+        self.assertEqual("ERF 2", self.cache.get(
+            2, "erf", self._loader("ERF 2")))
+
+    def test_the_least_recently_used_value_is_evicted(self):
+        self.cache.get(1, "erf", self._loader("ERF"))
+        self.cache.get(1, "gmpe", self._loader("GMPE"))
+        # "erf" is now the most recently used entry
+        self.cache.get(1, "erf", self._loader("ERF"))
+        self.cache.get(1, "other", self._loader("OTHER"))
+
+        self.assertEqual(2, self.cache.stats()["entries"])
+        self.cache.get(1, "erf", self._loader("ERF"))
+        self.cache.get(1, "gmpe", self._loader("GMPE"))
+
+        self.assertEqual(["ERF", "GMPE", "OTHER", "GMPE"], self.loads)
+
+    def test_invalidate_drops_the_entries_of_a_job(self):
+        self.cache.get(1, "erf", self._loader("ERF 1"))
+        self.cache.get(2, "erf", self._loader("ERF 2"))
+
+        self.cache.invalidate(1)
+
+        self.assertEqual(1, self.cache.stats()["entries"])
+        self.cache.get(1, "erf", self._loader("ERF 1"))
+        self.cache.get(2, "erf", self._loader("ERF 2"))
+        self.assertEqual(["ERF 1", "ERF 2", "ERF 1"], self.loads)
+
+
+class MemoryKVSTestCase(unittest.TestCase):
+    """
+    Tests for the in-process KVS backend.
+    """
+
+    def setUp(self):
+        self.client = memory.MemoryKVS()
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_instances_share_the_data(self):
+        self.client.set("KEY", "VALUE")
+
+        self.assertEqual("VALUE", memory.MemoryKVS().get("KEY"))
+
+    def test_values_are_stored_as_strings(self):
+        self.client.set("KEY", 1.5)
+        self.client.mset({"A": 1, "B": u"\xe0"})
+
+        self.assertEqual("1.5", self.client.get("KEY"))
+        self.assertEqual(["1", "\xc3\xa0", None],
+                         self.client.mget(["A", "B", "C"]))
+
+    def test_lists(self):
+        for value in (1, 2, 3):
+            self.client.rpush("LIST", value)
+
+        self.assertEqual(["1", "2", "3"], self.client.lrange("LIST", 0, -1))
+        self.assertEqual(["2", "3"], self.client.lrange("LIST", 1, 2))
+        self.assertEqual(3, self.client.llen("LIST"))
+        self.assertEqual([], self.client.lrange("MISSING", 0, -1))
+
+    def test_blpop(self):
+        self.client.rpush("B", 1)
+        self.client.rpush("B", 2)
+
+        self.assertEqual(("B", "1"), self.client.blpop(["A", "B"], 1))
+        self.assertEqual(("B", "2"), self.client.blpop("B", 1))
+        self.assertEqual(None, self.client.blpop(["A", "B"], 0.01))
+
+    def test_sets(self):
+        self.assertTrue(self.client.sadd("SET", "A"))
+        self.assertFalse(self.client.sadd("SET", "A"))
+        self.client.sadd("SET", "B")
+
+        self.assertEqual(set(["A", "B"]), self.client.smembers("SET"))
+        self.assertTrue(self.client.sismember("SET", "B"))
+
+        self.client.spop("SET")
+        self.client.spop("SET")
+        self.assertFalse(self.client.exists("SET"))
+
+    def test_wrong_type(self):
+        self.client.rpush("LIST", 1)
+
+        self.assertRaises(ValueError, self.client.get, "LIST")
+        self.assertRaises(ValueError, self.client.sadd, "LIST", 1)
+
+    def test_keys_and_delete(self):
+        self.client.mset({"::JOB::1::A": 1, "::JOB::1::B": 2, "OTHER": 3})
+
+        self.assertEqual(["::JOB::1::A", "::JOB::1::B"],
+                         sorted(self.client.keys("::JOB::1::*")))
+        self.assertEqual(2, self.client.delete("::JOB::1::A", "::JOB::1::B",
+                                               "MISSING"))
+        self.assertEqual(["OTHER"], self.client.keys())
+
+    def test_expired_keys_are_dropped(self):
+        self.client.set("KEY", "VALUE")
+        self.assertEqual(None, self.client.ttl("KEY"))
+
+        self.client.expire("KEY", 60)
+        self.assertEqual(60, self.client.ttl("KEY"))
+
+        self.client.expire("KEY", 0)
+        self.assertEqual(None, self.client.get("KEY"))
+        self.assertEqual([], self.client.keys())
+
+    def test_pipeline(self):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set("KEY", "VALUE")
+        pipe.rpush("LIST", 1)
+        pipe.get("KEY")
+
+        self.assertEqual(None, self.client.get("KEY"))
+        self.assertEqual([True, 1, "VALUE"], pipe.execute())
+
+    def test_info_counts_the_commands(self):
+        before = self.client.info()["total_commands_processed"]
+        self.client.set("KEY", "VALUE")
+        self.client.get("KEY")
+
+        self.assertEqual(
+            before + 2, self.client.info()["total_commands_processed"])
+
+    def test_get_client_honours_the_backend_setting(self):
+        with patch("openquake.utils.config.get") as get:
+            get.return_value = "memory"
+            self.assertTrue(isinstance(kvs.get_client(), memory.MemoryKVS))
+
+            get.return_value = "redis"
+            self.assertTrue(isinstance(kvs.get_client(), kvs.Redis))
+
+            get.return_value = "unknown"
+            self.assertRaises(ValueError, kvs.get_client)
+
+
 class KVSTestCase(unittest.TestCase):
     """
     Tests for various KVS storage operations.
@@ -114,6 +317,92 @@ class KVSTestCase(unittest.TestCase):
 
         self.assertEqual(data, kvs.get_list_json_decoded(TEST_KEY))
 
+    def test_set_and_get_value_array(self):
+        kvs.set_value_array(TEST_KEY, numpy.array([0.1, 0.2, 0.3]))
+
+        self.assertTrue(numpy.array_equal(
+            numpy.array([0.1, 0.2, 0.3]), kvs.get_value_array(TEST_KEY)))
+        self.assertEqual([0.1, 0.2, 0.3],
+                         kvs.get_value_json_decoded(TEST_KEY))
+
+    def test_get_value_array_understands_json(self):
+        kvs.set_value_json_encoded(TEST_KEY, [0.1, 0.2, 0.3])
+
+        self.assertTrue(numpy.array_equal(
+            numpy.array([0.1, 0.2, 0.3]), kvs.get_value_array(TEST_KEY)))
+
+    def test_mget_decoded_understands_both_formats(self):
+        kvs.set_value_json_encoded("%s-json" % TEST_KEY, [0.1, 0.2])
+        kvs.set_value_array("%s-binary" % TEST_KEY, [0.3, 0.4])
+
+        self.assertEqual([[0.1, 0.2], [0.3, 0.4]], kvs.mget_decoded(
+            ["%s-json" % TEST_KEY, "%s-binary" % TEST_KEY]))
+
+
+class BulkWriterTestCase(unittest.TestCase):
+    """
+    Tests for the batching of KVS writes.
+    """
+
+    def setUp(self):
+        self.client = kvs.get_client()
+        self.client.flushdb()
+
+    def tearDown(self):
+        self.client.flushdb()
+
+    def test_values_are_written_on_flush(self):
+        writer = kvs.BulkWriter(chunk_size=10)
+        writer.set("%s-1" % TEST_KEY, "VALUE")
+        writer.set_value_json_encoded("%s-2" % TEST_KEY, [1.0, 2.0])
+
+        self.assertFalse(self.client.exists("%s-1" % TEST_KEY))
+
+        writer.flush()
+
+        self.assertEqual("VALUE", self.client.get("%s-1" % TEST_KEY))
+        self.assertEqual([1.0, 2.0],
+                         kvs.get_value_json_decoded("%s-2" % TEST_KEY))
+        self.assertEqual(1, writer.round_trips)
+
+    def test_values_are_written_in_chunks(self):
+        writer = kvs.BulkWriter(chunk_size=2)
+
+        for i in xrange(5):
+            writer.set_value_array("%s-%s" % (TEST_KEY, i), [float(i)])
+
+        # two full chunks were sent, one value is still pending
+        self.assertEqual(2, writer.round_trips)
+        self.assertEqual(1, len(writer.pending))
+
+        writer.flush()
+
+        self.assertEqual(3, writer.round_trips)
+
+        for i in xrange(5):
+            self.assertEqual([float(i)], kvs.get_value_array(
+                "%s-%s" % (TEST_KEY, i)).tolist())
+
+    def test_the_last_write_to_a_key_wins(self):
+        with kvs.BulkWriter(chunk_size=10) as writer:
+            writer.set(TEST_KEY, "FIRST")
+            writer.set(TEST_KEY, "SECOND")
+
+        self.assertEqual("SECOND", self.client.get(TEST_KEY))
+
+    def test_leaving_the_with_block_flushes(self):
+        with kvs.BulkWriter(chunk_size=10) as writer:
+            writer.set(TEST_KEY, "VALUE")
+
+        self.assertEqual("VALUE", self.client.get(TEST_KEY))
+        self.assertEqual([], writer.pending)
+
+    def test_the_default_chunk_size_comes_from_the_config(self):
+        with patch('openquake.utils.config.get') as get_mock:
+            get_mock.return_value = "7"
+
+            self.assertEqual(7, kvs.BulkWriter().chunk_size)
+
 
 class TokensTestCase(unittest.TestCase):
     """
@@ -143,6 +432,24 @@ class TokensTestCase(unittest.TestCase):
              % kvs.tokens.generate_job_key(self.job_id)
         self.assertEqual(key, ev)
 
+    def test_job_id_from_key(self):
+        key = kvs.tokens._generate_key(
+            self.job_id, self.product, self.block_id, self.site)
+
+        self.assertEqual(str(self.job_id), kvs.tokens.job_id_from_key(key))
+        self.assertEqual(str(self.job_id), kvs.tokens.job_id_from_key(
+            kvs.tokens.generate_job_key(self.job_id)))
+        self.assertTrue(kvs.tokens.job_id_from_key("BLOCK:1") is None)
+
+    def test_logic_tree_sample_keys_of_realizations(self):
+        for key_func in (kvs.tokens.source_model_key, kvs.tokens.gmpe_key):
+            keys = set([key_func(self.job_id), key_func(self.job_id, 0),
+                        key_func(self.job_id, 1)])
+
+            self.assertEqual(3, len(keys))
+            self.assertTrue(key_func(self.job_id, 1).startswith(
+                key_func(self.job_id)))
+
     def test_generate_job_key(self):
         """
         Exercise the creation/formatting of job keys.
@@ -222,9 +529,9 @@ class GarbageCollectionTestCase(unittest.TestCase):
         self.vuln_key = kvs.tokens.vuln_key(self.test_job)
 
         # now create the fake data for test_job
-        self.client.set(self.gmf1_key, 'fake gmf data 1')
-        self.client.set(self.gmf2_key, 'fake gmf data 2')
-        self.client.set(self.vuln_key, 'fake vuln curve data')
+        kvs.set(self.gmf1_key, 'fake gmf data 1')
+        kvs.set(self.gmf2_key, 'fake gmf data 2')
+        kvs.set(self.vuln_key, 'fake vuln curve data')
 
         # this job will have no data
         self.dataless_job = 2
@@ -251,6 +558,78 @@ class GarbageCollectionTestCase(unittest.TestCase):
         self.assertFalse(
             self.client.sismember(kvs.tokens.CURRENT_JOBS, self.test_job))
 
+    def test_gc_deletes_in_batches(self):
+        """
+        Test that all job data is cleared when there are more keys than
+        fit in a single batch.
+        """
+        delete = mock.Mock(wraps=self.client.delete)
+
+        with mock.patch('openquake.kvs.GC_BATCH_SIZE', 2):
+            with mock.patch('openquake.kvs.get_client') as get_client:
+                get_client.return_value = self.client
+
+                with mock.patch.object(self.client, 'delete', delete):
+                    self.assertEqual(3, kvs.cache_gc(self.test_job))
+
+        # the memory backend deletes the emptied index set with delete()
+        index_key = kvs.tokens.job_keys_index_key(self.test_job)
+        batches = [args for args, _ in delete.call_args_list
+                   if args != (index_key,)]
+
+        # one command for the first two keys, one for the last one
+        self.assertEqual(2, len(batches))
+        self.assertEqual([2, 1], [len(batch) for batch in batches])
+
+        for key in (self.gmf1_key, self.gmf2_key, self.vuln_key):
+            self.assertFalse(self.client.exists(key))
+
+    def test_gc_does_not_touch_other_jobs(self):
+        """
+        Test that the data of other jobs is left alone.
+        """
+        other_key = kvs.tokens.gmf_set_key(self.dataless_job, 0, 0)
+        kvs.set(other_key, 'fake gmf data of another job')
+
+        kvs.cache_gc(self.test_job)
+
+        self.assertTrue(self.client.exists(other_key))
+
+    def test_gc_registered_keys(self):
+        """
+        Test that keys written behind the back of the kvs module are garbage
+        collected once registered.
+        """
+        key = kvs.tokens.source_model_key(self.test_job)
+        self.client.set(key, 'fake source model written by java')
+        kvs.register_job_keys([key])
+
+        self.assertEqual(4, kvs.cache_gc(self.test_job))
+        self.assertFalse(self.client.exists(key))
+
+    def test_deleted_job_keys_are_dropped_from_the_index(self):
+        """
+        Test that keys deleted before the job completes are not garbage
+        collected again.
+        """
+        kvs.delete_job_keys([self.gmf1_key, self.gmf2_key])
+
+        self.assertFalse(self.client.exists(self.gmf1_key))
+        self.assertFalse(self.client.exists(self.gmf2_key))
+        self.assertEqual(1, kvs.cache_gc(self.test_job))
+
+    def test_keys_with_ttl_are_not_indexed(self):
+        """
+        Test that keys with a time to live expire on their own and are not
+        added to the job index.
+        """
+        key = kvs.tokens.gmf_set_key(self.test_job, 1, 1)
+        kvs.set_value_array(key, [1.0, 2.0], ttl=60)
+
+        self.assertTrue(self.client.ttl(key) > 0)
+        self.assertFalse(self.client.sismember(
+            kvs.tokens.job_keys_index_key(self.test_job), key))
+
     def test_gc_dataless_job(self):
         """
         Test that :py:function:`openquake.kvs.cache_gc` returns 0 (to indicate
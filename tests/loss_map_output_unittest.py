@@ -214,3 +214,14 @@ class LossMapOutputTestCase(unittest.TestCase):
             actual_event, actual_elem = actual_elems[i]
             self.assertEqual(event, actual_event)
             self.assertEqual(elem.items(), actual_elem.items())
+
+    def test_incremental_loss_map_xml_is_the_same(self):
+        """The incremental writer produces the same document."""
+        self.xml_writer.serialize(SAMPLE_LOSS_MAP_DATA)
+        expected = open(TEST_LOSS_MAP_XML_OUTPUT_PATH).read()
+
+        xml_writer = risk_output.LossMapXMLWriter(
+            TEST_LOSS_MAP_XML_OUTPUT_PATH, incremental=True)
+        xml_writer.serialize(SAMPLE_LOSS_MAP_DATA)
+
+        self.assertEqual(expected, open(TEST_LOSS_MAP_XML_OUTPUT_PATH).read())
@@ -191,3 +191,30 @@ class LossOutputTestCase(unittest.TestCase):
             self.assertAlmostEqual(val, float(loss_ratio_values[idx]), 6)
         for idx, val in enumerate(TEST_LOSS_RATIO_CURVE.ordinates):
             self.assertAlmostEqual(val, float(poe_values[idx]), 6)
+
+    def _serialize(self, writer_class, curves, incremental):
+        """Serialize the given curves, return the content of the file."""
+        writer_class(self.loss_curve_path, incremental=incremental).serialize(
+            curves)
+
+        return open(self.loss_curve_path).read()
+
+    def test_incremental_loss_xml_is_the_same(self):
+        """The incremental writer produces the same document."""
+        for writer_class, curves in (
+            (risk_output.LossCurveXMLWriter, self.loss_curves),
+            (risk_output.LossRatioCurveXMLWriter, self.loss_ratio_curves)):
+
+            self.assertEqual(
+                self._serialize(writer_class, curves, False),
+                self._serialize(writer_class, curves, True))
+
+    def test_incremental_loss_curves_of_an_asset_are_consecutive(self):
+        """The incremental writer refuses the curves of an asset written
+        after the ones of another asset."""
+        xml_writer = risk_output.LossCurveXMLWriter(
+            self.loss_curve_path, incremental=True)
+        curves = self.loss_curves[:1] + self.loss_curves[2:3] + \
+            self.loss_curves[1:2]
+
+        self.assertRaises(ValueError, xml_writer.serialize, curves)
@@ -414,6 +414,17 @@ class HazardCurveDBReaderTestCase(HazardCurveDBBaseTestCase):
         self.assertEquals(self.sort(_normalize(HAZARD_CURVE_DATA())),
                           self.sort(_normalize(data)))
 
+    def test_stream(self):
+        """Hazard curves are streamed a few rows at a time"""
+        self.writer.serialize(HAZARD_CURVE_DATA())
+
+        data = self.reader.stream(self.writer.output.id, fetch_size=1)
+
+        self.assertFalse(isinstance(data, list))
+        self.assertEquals(
+            self.sort(self.reader.deserialize(self.writer.output.id)),
+            self.sort(list(data)))
+
 
 class GmfDBBaseTestCase(unittest.TestCase, helpers.DbTestMixin):
     """Common code for ground motion field db reader/writer test"""
@@ -493,3 +504,13 @@ class GmfDBReaderTestCase(GmfDBBaseTestCase):
 
         self.assertEquals(self.normalize(GMF_DATA().items()),
                           self.normalize(data.items()))
+
+    def test_stream(self):
+        """Ground motion field is streamed a few rows at a time"""
+        self.writer.serialize(GMF_DATA())
+
+        data = self.reader.stream(self.writer.output.id, fetch_size=3)
+
+        self.assertFalse(isinstance(data, dict))
+        self.assertEquals(self.normalize(GMF_DATA().items()),
+                          self.normalize(list(data)))
@@ -167,6 +167,18 @@ class LossCurveDBReaderTestCase(LossCurveDBBaseTestCase):
         self.assertEquals(self.normalize(RISK_LOSS_CURVE_DATA),
                           self.normalize(data))
 
+    def test_stream(self):
+        """
+        Loss curve is streamed a few rows at a time
+        """
+        self.writer.serialize(RISK_LOSS_CURVE_DATA)
+
+        # Call the function under test.
+        data = self.reader.stream(self.writer.output.id, fetch_size=1)
+
+        self.assertEquals(self.normalize(RISK_LOSS_CURVE_DATA),
+                          self.normalize(list(data)))
+
 
 SITE_A = Site(-117.0, 38.0)
 SITE_A_ASSET_ONE = {'assetID': 'a1711'}
@@ -404,6 +416,23 @@ class LossMapDBReaderTestCase(LossMapDBBaseTestCase):
             self.normalize(SAMPLE_NONDETERMINISTIC_LOSS_MAP_DATA[1:]),
             self.normalize(data))
 
+    def test_stream(self):
+        """
+        The metadata are streamed first, then all the losses of each site
+        together, even when they span several fetches
+        """
+        self.writer.serialize(SAMPLE_DETERMINISTIC_LOSS_MAP_DATA)
+
+        # Call the function under test.
+        data = list(self.reader.stream(self.writer.output.id, fetch_size=1))
+
+        self.assertEquals(
+            self.reader.deserialize(self.writer.output.id)[0], data.pop(0))
+        self.assertEquals(2, len(data))
+        self.assertEquals(
+            self.normalize(SAMPLE_DETERMINISTIC_LOSS_MAP_DATA[1:]),
+            self.normalize(data))
+
     def normalize(self, data):
         data = sorted(data, key=lambda e: (e[0].longitude, e[0].latitude))
         result = []
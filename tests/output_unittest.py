@@ -1011,3 +1011,24 @@ class WriterTestCase(unittest.TestCase):
         w.serialize(data)
         self.assertEqual(w_a.serialized, data)
         self.assertEqual(w_b.serialized, data)
+
+        # each writer gets all the items of a generator
+        w_a.serialized, w_b.serialized = [], []
+        w.serialize(item for item in data)
+        self.assertEqual(w_a.serialized, data)
+        self.assertEqual(w_b.serialized, data)
+
+        # the items of a reiterable are produced again for each writer
+        calls = []
+
+        def items():
+            calls.append(len(calls))
+
+            for item in data:
+                yield item
+
+        w_a.serialized, w_b.serialized = [], []
+        w.serialize(writer.Reiterable(items))
+        self.assertEqual(w_a.serialized, data)
+        self.assertEqual(w_b.serialized, data)
+        self.assertEqual([0, 1], calls)
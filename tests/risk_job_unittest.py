@@ -17,11 +17,12 @@
 # version 3 along with OpenQuake.  If not, see
 # <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
 
+import mock
 import os
+import numpy
 import unittest
 
 from openquake import job
-from openquake import kvs
 from openquake import shapes
 from openquake.job import config
 from openquake.job.mixins import Mixin
@@ -106,6 +107,27 @@ class EpsilonTestCase(unittest.TestCase):
                 ValueError, self.epsilon_provider.epsilon, asset)
             break
 
+    def test_epsilons_are_drawn_like_single_epsilons(self):
+        """A seeded job gets the same samples from `epsilons` as from the
+        same number of `epsilon` calls."""
+        _, asset = iter(self.exposure_parser).next()
+
+        numpy.random.seed(42)
+        expected = [self.epsilon_provider.epsilon(asset) for _ in xrange(5)]
+
+        numpy.random.seed(42)
+        self.assertTrue(numpy.allclose(
+            expected, self.epsilon_provider.epsilons(asset, 5)))
+
+    def test_correlated_epsilons(self):
+        """For correlated jobs all the samples of an asset are the one of
+        its building typology."""
+        self.epsilon_provider.__dict__["ASSET_CORRELATION"] = "perfect"
+        for _, asset in self.exposure_parser:
+            sample = self.epsilon_provider.epsilon(asset)
+            self.assertTrue(numpy.all(
+                self.epsilon_provider.epsilons(asset, 3) == [sample] * 3))
+
 
 class BlockTestCase(unittest.TestCase):
 
@@ -122,6 +144,17 @@ class BlockTestCase(unittest.TestCase):
 
         self.assertEqual(block, general.Block.from_kvs(block.id))
 
+    def test_grid_points_are_unique(self):
+        region = shapes.Region.from_simple((0.0, 2.0), (2.0, 0.0))
+        region.cell_size = 1.0
+
+        block = general.Block((self.site, shapes.Site(2.0, 0.0),
+                               shapes.Site(1.1, 0.9), self.site))
+
+        self.assertEqual(
+            [(1, 1), (0, 2)],
+            [(point.row, point.column) for point in block.grid(region)])
+
 
 class BlockSplitterTestCase(unittest.TestCase):
 
@@ -189,7 +222,9 @@ class RiskJobMixinTestCase(unittest.TestCase):
         mixin.params = {config.EXPOSURE: os.path.join(
             helpers.SCHEMA_EXAMPLES_DIR, EXPOSURE_TEST_FILE)}
 
-        mixin.region = None
+        mixin.region = shapes.RegionConstraint.from_simple(
+            (9.0, 46.0), (10.0, 45.0))
+        mixin.job_id = 1234
         mixin.base_path = "."
         mixin.partition()
 
@@ -201,6 +236,17 @@ class RiskJobMixinTestCase(unittest.TestCase):
         self.assertEqual(
             expected, general.Block.from_kvs(mixin.blocks_keys[0]))
 
+        # the assets of the block are stored with it
+        block_assets = general.BlockAssets.from_kvs(
+            1234, mixin.blocks_keys[0])
+
+        self.assertEqual(
+            [("asset_01", 9.15, 45.16667), ("asset_02", 9.15333, 45.122),
+             ("asset_03", 9.14777, 45.17999)],
+            [(asset["assetID"], asset["lon"], asset["lat"])
+             for _, assets in block_assets.points(mixin.region.grid)
+             for asset in assets])
+
     def test_prepares_blocks_using_the_exposure_and_filtering(self):
         """When reading the exposure file, the mixin also provides filtering
         on the region specified in the REGION_VERTEX and REGION_GRID_SPACING
@@ -249,6 +295,27 @@ class RiskJobGeneralTestCase(unittest.TestCase):
         self.assertEqual(expected_sites,
             general.read_sites_from_exposure(test_job))
 
+    def test_group_assets_by_site(self):
+        """Sites are de-duplicated keeping their order, the assets are
+        grouped by site."""
+        site_1 = shapes.Site(1.0, 2.0)
+        site_2 = shapes.Site(3.0, 4.0)
+
+        site_assets = [
+            (site_2, {"assetID": "a1"}),
+            (shapes.Site(1.0, 2.0), {"assetID": "a2"}),
+            (site_2, {"assetID": "a3"}),
+            (site_1, {"assetID": "a4"})]
+
+        sites, assets = general.group_assets_by_site(site_assets)
+
+        self.assertEqual([site_2, site_1], sites)
+        self.assertEqual(
+            [{"assetID": "a1", "lon": 3.0, "lat": 4.0},
+             {"assetID": "a3", "lon": 3.0, "lat": 4.0}], assets[site_2])
+        self.assertEqual(
+            ["a2", "a4"], [asset["assetID"] for asset in assets[site_1]])
+
 
 GRID_ASSETS = {
     (0, 0): {'assetID': 'asset_at_0_0', 'lat': 10.0, 'lon': 10.0},
@@ -263,36 +330,32 @@ class RiskMixinTestCase(unittest.TestCase):
         self.job = helpers.job_from_file(os.path.join(helpers.DATA_DIR,
                                          'config.gem'))
 
-        self.grid = shapes.Grid(shapes.Region.from_coordinates(
-            [(1.0, 3.0), (1.0, 4.0), (2.0, 4.0), (2.0, 3.0)]),
-            1.0)
+        region = shapes.Region.from_coordinates(
+            [(1.0, 3.0), (1.0, 4.0), (2.0, 4.0), (2.0, 3.0)])
+        region.cell_size = 1.0
+        self.grid = region.grid
 
-        # this is the expected output of grid_assets_iterator and an input of
-        # asset_losses_per_site
+        # this is the expected output of block_assets_iterator and an input
+        # of asset_losses_per_site
         self.grid_assets = [
             (shapes.GridPoint(self.grid, 0, 0), GRID_ASSETS[(0, 0)]),
             (shapes.GridPoint(self.grid, 1, 0), GRID_ASSETS[(0, 1)]),
             (shapes.GridPoint(self.grid, 0, 1), GRID_ASSETS[(1, 0)]),
             (shapes.GridPoint(self.grid, 1, 1), GRID_ASSETS[(1, 1)])]
 
-    def test_grid_assets_iterator(self):
-        with patch('openquake.kvs.get_list_json_decoded') as get_mock:
-
-            def get_list_json_decoded(key):
-                row, col = kvs.tokens.asset_row_col_from_kvs_key(key)
-
-                return [GRID_ASSETS[(row, col)]]
-
-            get_mock.side_effect = get_list_json_decoded
-
-            def row_col(item):
-                return item[0].row, item[0].column
+    def test_block_assets_iterator(self):
+        for block_id, (row, col) in enumerate(sorted(GRID_ASSETS)):
+            block_assets = general.BlockAssets(self.job.job_id, block_id)
+            block_assets.add(shapes.GridPoint(self.grid, col, row),
+                             GRID_ASSETS[(row, col)])
+            block_assets.to_kvs()
 
+        with mock.patch.object(job.Job, 'region', self.grid.region):
             with job.mixins.Mixin(self.job, general.RiskJobMixin):
-                got = sorted(self.job.grid_assets_iterator(self.grid),
-                             key=row_col)
+                got = list(self.job.block_assets_iterator(
+                    range(len(GRID_ASSETS))))
 
-                self.assertEqual(sorted(self.grid_assets, key=row_col), got)
+        self.assertEqual(self.grid_assets, got)
 
     def test_asset_losses_per_site(self):
         with patch('openquake.kvs.get') as get_mock:
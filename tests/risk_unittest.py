@@ -18,17 +18,18 @@
 # <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
 
 import os
-import json
 import numpy
 import unittest
 
+from scipy import stats
+
 from openquake import kvs
 from openquake import shapes
 
 from openquake.output import hazard
 
 from openquake.risk.job import aggregate_loss_curve as aggregate
-from openquake.risk.job.general import Block
+from openquake.risk.job.general import Block, BlockAssets
 from openquake.risk.job.classical_psha import ClassicalPSHABasedMixin
 from openquake.risk import probabilistic_event_based as prob
 from openquake.risk import classical_psha_based as psha
@@ -89,11 +90,17 @@ class EpsilonProvider(object):
 
     def __init__(self, asset, epsilons):
         self.asset = asset
-        self.epsilons = epsilons
+        self.samples = epsilons
 
     def epsilon(self, asset):
         assert self.asset is asset
-        return self.epsilons.pop(0)
+        return self.samples.pop(0)
+
+    def epsilons(self, asset, size):
+        assert self.asset is asset
+        samples = self.samples[:size]
+        del self.samples[:size]
+        return numpy.array(samples)
 
 
 class ProbabilisticEventBasedTestCase(unittest.TestCase):
@@ -209,6 +216,8 @@ class ProbabilisticEventBasedTestCase(unittest.TestCase):
         self._store_gmfs(self.gmfs_6, 1, 6)
 
         # store the assets
+        self.block_assets = BlockAssets(
+            self.job_id, kvs.generate_block_id())
         self._store_asset(self.asset_1, 1, 1)
         self._store_asset(self.asset_2, 1, 2)
         self._store_asset(self.asset_3, 1, 3)
@@ -230,8 +239,8 @@ class ProbabilisticEventBasedTestCase(unittest.TestCase):
             pass
 
     def _store_asset(self, asset, row, column):
-        key = kvs.tokens.asset_key(self.job_id, row, column)
-        kvs.get_client().rpush(key, json.JSONEncoder().encode(asset))
+        self.block_assets.add(shapes.GridPoint(None, column, row), asset)
+        self.block_assets.to_kvs()
 
     def _store_gmfs(self, gmfs, row, column):
         key = kvs.tokens.gmf_set_key(self.job_id, column, row)
@@ -661,10 +670,6 @@ class ProbabilisticEventBasedTestCase(unittest.TestCase):
 
 class ClassicalPSHABasedTestCase(unittest.TestCase, helpers.DbTestMixin):
 
-    def _store_asset(self, asset, row, column):
-        key = kvs.tokens.asset_key(self.job_id, row, column)
-        kvs.get_client().rpush(key, json.JSONEncoder().encode(asset))
-
     def setUp(self):
         self.job = None
 
@@ -788,6 +793,50 @@ class ClassicalPSHABasedTestCase(unittest.TestCase, helpers.DbTestMixin):
                     lr_curve_expected.ordinate_for(x_value),
                     loss_ratio_curve.ordinate_for(x_value), atol=0.005))
 
+    def test_lrem_matches_the_distribution_of_each_iml(self):
+        psha.STEPS_PER_INTERVAL = 2
+
+        imls = [0.1, 0.2, 0.4, 0.6]
+        loss_ratios = [0.05, 0.08, 0.2, 0.4]
+        covs = [0.5, 0.3, 0.2, 0.1]
+        vuln_function = shapes.VulnerabilityFunction(imls, loss_ratios, covs)
+
+        lrem = psha._compute_lrem(vuln_function)
+        lrem_loss_ratios = psha._generate_loss_ratios(vuln_function)
+
+        self.assertEqual((lrem_loss_ratios.size, len(imls)), lrem.shape)
+
+        for idx, (mean_val, cov) in enumerate(zip(loss_ratios, covs)):
+            variance = (cov * mean_val) ** 2.0
+            mu = numpy.log(mean_val ** 2.0 / numpy.sqrt(
+                variance + mean_val ** 2.0))
+            sigma = numpy.sqrt(numpy.log(variance / mean_val ** 2.0 + 1.0))
+
+            for row, loss_ratio in enumerate(lrem_loss_ratios):
+                self.assertAlmostEqual(
+                    stats.lognorm.sf(loss_ratio, sigma,
+                                     scale=numpy.exp(mu)),
+                    lrem[row][idx])
+
+    def test_lrem_is_cached_per_vulnerability_function(self):
+        psha.STEPS_PER_INTERVAL = 2
+
+        vuln_function = shapes.VulnerabilityFunction(
+            [0.1, 0.2], [0.05, 0.08], [0.5, 0.3])
+        same_vuln_function = shapes.VulnerabilityFunction(
+            [0.1, 0.2], [0.05, 0.08], [0.5, 0.3])
+
+        lrem = psha._compute_lrem(vuln_function)
+
+        self.assertTrue(lrem is psha._compute_lrem(same_vuln_function))
+
+        # the loss ratios depend on the steps between them
+        psha.STEPS_PER_INTERVAL = 3
+
+        self.assertEqual(
+            psha._generate_loss_ratios(vuln_function).size,
+            len(psha._compute_lrem(vuln_function)))
+
     def test_splits_single_interval_with_no_steps_between(self):
         self.assertTrue(numpy.allclose(numpy.array([1.0, 2.0]),
                 psha._split_loss_ratios([1.0, 2.0], 1)))
@@ -889,21 +938,20 @@ class ClassicalPSHABasedTestCase(unittest.TestCase, helpers.DbTestMixin):
         mixin.vuln_curves = {"ID": self.vuln_function}
         mixin.params = {}
 
-        block = Block.from_kvs(self.block_id)
-
         asset = {"vulnerabilityFunctionReference": "ID",
                  "assetID": 22.61, "assetValue": 1}
 
-        self._store_asset(asset, 10, 10)
+        block_assets = BlockAssets(self.job_id, self.block_id)
+        block_assets.add(shapes.GridPoint(None, 10, 10), asset)
+        block_assets.to_kvs()
 
         # computes the loss curves and puts them in kvs
         self.assertTrue(mixin.compute_risk(self.block_id,
             point=shapes.GridPoint(None, 10, 20)))
 
-        for point in block.grid(mixin.region):
-            asset_key = kvs.tokens.asset_key(self.job_id, point.row,
-                point.column)
-            for asset in kvs.get_list_json_decoded(asset_key):
+        block_assets = BlockAssets.from_kvs(self.job_id, self.block_id)
+        for point, assets in block_assets.points(mixin.region.grid):
+            for asset in assets:
                 loss_ratio_key = kvs.tokens.loss_ratio_key(
                     self.job_id, point.row, point.column, asset['assetID'])
                 self.assertTrue(kvs.get(loss_ratio_key))
@@ -19,6 +19,8 @@
 import logging
 import unittest
 
+import mock
+
 from openquake import signalling
 
 from tests.utils.helpers import patch
@@ -126,3 +128,27 @@ class CollectorTestCase(unittest.TestCase):
 
             self.assertEqual([(getattr(logging, level.upper()), 'a msg')],
                              logger.logs)
+
+
+class JobOutcomeMonitorTestCase(unittest.TestCase):
+    def test_monitor_records_completed_jobs(self):
+        class FakeMessage(object):
+            def __init__(self, routing_key):
+                self.delivery_tag = 1
+                self.delivery_info = {'routing_key': routing_key}
+
+        monitor = signalling.JobOutcomeMonitor()
+        chn = monitor.chn
+        monitor.chn = mock.Mock()
+
+        try:
+            for job_id, outcome in [(7, 'succeeded'), (8, 'failed')]:
+                monitor.message_callback(FakeMessage(
+                    signalling.generate_routing_key(job_id, outcome)))
+
+            monitor.message_callback(FakeMessage('not.a.key'))
+        finally:
+            monitor.chn = chn
+            monitor.__exit__()
+
+        self.assertEqual(set([7, 8]), monitor.completed)
@@ -179,6 +179,22 @@ def timeit(method):
     return _timed
 
 
+def peak_memory(function):
+    """Run the function in a forked process, return its peak resident set
+    size in KB."""
+    pid = os.fork()
+
+    if pid == 0:
+        try:
+            function()
+        finally:
+            os._exit(0)  # pylint: disable=W0212
+
+    _, _, rusage = os.wait4(pid, 0)
+
+    return rusage.ru_maxrss
+
+
 def skipit(method):
     """Decorator for skipping tests"""
     try:
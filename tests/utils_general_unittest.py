@@ -90,3 +90,38 @@ class MemoizerTestCase(unittest.TestCase):
 
         # should be called only one time
         self.assertEqual(self.counter, 1)
+
+
+class MemoizeLRUTestCase(unittest.TestCase):
+    """Tests the behaviour of utils.general.MemoizeLRU"""
+
+    def setUp(self):
+        self.calls = []
+
+        @general.MemoizeLRU(2, lambda values: tuple(values))
+        def my_memoized_function(values):
+            """ the memoized decorated function """
+            self.calls.append(values)
+            return sum(values)
+
+        self.memoized = my_memoized_function
+
+    def test_results_are_cached_by_key(self):
+        self.assertEqual(3, self.memoized([1, 2]))
+        self.assertEqual(3, self.memoized([1, 2]))
+
+        self.assertEqual([[1, 2]], self.calls)
+
+    def test_least_recently_used_result_is_dropped(self):
+        self.memoized([1])
+        self.memoized([2])
+        # [1] is now the most recently used
+        self.memoized([1])
+        self.memoized([3])
+
+        self.assertEqual(2, len(self.memoized.memo))
+
+        self.memoized([1])
+        self.memoized([2])
+
+        self.assertEqual([[1], [2], [3], [2]], self.calls)
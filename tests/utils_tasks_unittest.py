@@ -22,8 +22,13 @@
 Unit tests for the utils.tasks module.
 """
 
+import mock
+import socket
+import threading
 import unittest
 
+from openquake.kvs import memory
+from openquake.kvs import tokens
 from openquake.utils import tasks
 
 from tests.utils.helpers import patch
@@ -193,6 +198,140 @@ class DistributeTestCase(unittest.TestCase):
         self.assertEqual(expected, result)
 
 
+class DistributeDynamicallyTestCase(unittest.TestCase):
+    """Tests the behaviour of utils.tasks.distribute_dynamically()."""
+
+    def test_distribute_dynamically_returns_flattened_results(self):
+        """Flattened results are returned in the order of the data."""
+        result = tasks.distribute_dynamically(
+            2, reflect_data_to_be_processed, ("data", range(20)),
+            flatten_results=True)
+        self.assertEqual(range(20), result)
+
+    def test_distribute_dynamically_passes_the_other_args(self):
+        """The chunks of data are passed with the other parameters."""
+        result = tasks.distribute_dynamically(
+            2, reflect_args, ("data", range(5)), dict(job_id=11))
+
+        self.assertEqual(
+            range(5), sum((actual_kwargs(kwargs)["data"]
+                           for _, kwargs in result), []))
+        self.assertTrue(
+            all(actual_kwargs(kwargs)["job_id"] == 11 for _, kwargs in result))
+
+    def test_distribute_dynamically_with_no_data(self):
+        """One subtask is run even when there is no data."""
+        self.assertEqual(["hello"], tasks.distribute_dynamically(
+            3, just_say_hello, ("data", [])))
+
+    def test_distribute_dynamically_with_failing_subtask(self):
+        """At least one subtask failed, a `TaskFailed` exception is raised."""
+        self.assertRaises(
+            tasks.TaskFailed, tasks.distribute_dynamically,
+            2, failing_task, ("data", range(5)))
+
+
+class DataChunkerTestCase(unittest.TestCase):
+    """Tests the sizing of the chunks of dynamically distributed data."""
+
+    def _chunks(self, chunker):
+        chunks = []
+
+        while not chunker.exhausted():
+            chunks.append(chunker.next_chunk())
+
+        return chunks
+
+    def test_chunks_get_smaller(self):
+        """The chunks are at most half the remaining data per task."""
+        chunks = self._chunks(tasks.DataChunker(range(100), 5))
+
+        self.assertEqual([10, 9, 9, 8, 7, 6, 6, 5, 4, 4, 4, 3, 3, 3, 2, 2,
+                          2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+                         [len(chunk) for _, chunk in chunks])
+        self.assertEqual(
+            range(100), sum((chunk for _, chunk in chunks), []))
+        self.assertEqual(
+            [sum(len(chunk) for _, chunk in chunks[:i])
+             for i in xrange(len(chunks))],
+            [offset for offset, _ in chunks])
+
+    def test_chunks_are_sized_on_the_run_time(self):
+        """The chunks take about CHUNK_TARGET_TIME seconds."""
+        chunker = tasks.DataChunker(range(1000), 2)
+
+        self.assertEqual(250, len(chunker.next_chunk()[1]))
+
+        # 5 items per second
+        chunker.record(100, 20.0)
+        self.assertEqual(
+            5 * tasks.CHUNK_TARGET_TIME, len(chunker.next_chunk()[1]))
+
+        # very slow items are still handed out one at a time
+        chunker.record(1, 1000.0)
+        self.assertEqual(1, len(chunker.next_chunk()[1]))
+
+    def test_no_data(self):
+        """A single, empty, chunk is handed out when there is no data."""
+        self.assertEqual([(0, [])], self._chunks(tasks.DataChunker([], 3)))
+
+
+class DistributeManyTestCase(unittest.TestCase):
+    """Tests the behaviour of utils.tasks.distribute_many()."""
+
+    def setUp(self):
+        self.started = []
+        self.finished = {}
+
+    def _start(self, index):
+        self.started.append(index)
+
+    def _finish(self, index, results):
+        self.assertTrue(index in self.started)
+        self.finished[index] = results
+
+    def test_distribute_many_runs_all_the_task_sets(self):
+        """Each run is processed and its results handed to `finish`."""
+        runs = [dict(run=run) for run in xrange(5)]
+
+        tasks.distribute_many(
+            2, reflect_args, ("data", range(3)), runs, 2,
+            start=self._start, finish=self._finish)
+
+        self.assertEqual(range(5), self.started)
+        self.assertEqual(range(5), sorted(self.finished))
+
+        for index, results in self.finished.iteritems():
+            self.assertEqual(
+                [{"data": [0], "run": index}, {"data": [1, 2], "run": index}],
+                [actual_kwargs(kwargs) for _, kwargs in results])
+
+    def test_distribute_many_returns_flattened_results(self):
+        """Flattened results are handed to `finish`."""
+        tasks.distribute_many(
+            3, reflect_data_to_be_processed, ("data", range(7)), [{}, {}], 1,
+            finish=self._finish, flatten_results=True)
+
+        self.assertEqual({0: range(7), 1: range(7)}, self.finished)
+
+    def test_distribute_many_with_failing_subtask(self):
+        """At least one subtask failed, a `TaskFailed` exception is raised."""
+        self.assertRaises(
+            tasks.TaskFailed, tasks.distribute_many,
+            1, failing_task, ("data", range(5)), [{}, {}], 2)
+
+    def test_distribute_many_dynamically(self):
+        """Each run is distributed dynamically and handed to `finish`."""
+        tasks.distribute_many(
+            3, reflect_data_to_be_processed, ("data", range(7)),
+            [{}, {}, {}], 2, start=self._start, finish=self._finish,
+            flatten_results=True, dynamic=True)
+
+        self.assertEqual(range(3), self.started)
+        self.assertEqual({0: range(7), 1: range(7), 2: range(7)},
+                         self.finished)
+
+
 class ParallelizeTestCase(unittest.TestCase):
     """Tests the behaviour of utils.tasks.parallelize()."""
 
@@ -310,6 +449,13 @@ class ParallelizeTestCase(unittest.TestCase):
 
 
 class CheckJobStatusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.job_status = tasks.JOB_STATUS
+        tasks.JOB_STATUS = tasks.JobStatusCache()
+
+    def tearDown(self):
+        tasks.JOB_STATUS = self.job_status
+
     def test_not_completed(self):
         with patch('openquake.job.Job.is_job_completed') as mock:
             mock.return_value = False
@@ -326,3 +472,209 @@ class CheckJobStatusTestCase(unittest.TestCase):
             else:
                 self.fail('JobCompletedError wasn\'t raised')
             self.assertEqual(mock.call_args_list, [((31, ), {})])
+
+    def test_completed_job_is_dropped_from_the_cache(self):
+        with patch('openquake.kvs.cache.JOB_CACHE.invalidate') as invalidate:
+            with patch('openquake.job.Job.is_job_completed') as mock:
+                mock.return_value = True
+                self.assertRaises(tasks.JobCompletedError,
+                                  tasks.check_job_status, 31)
+            self.assertEqual(invalidate.call_args_list, [((31, ), {})])
+
+
+class FakeMonitor(object):
+    """Stands in for a JobOutcomeMonitor, runs until `stop` is set."""
+
+    def __init__(self):
+        self.completed = set()
+        self.stop = threading.Event()
+
+    def run(self):
+        self.stop.wait()
+
+
+class JobStatusCacheTestCase(unittest.TestCase):
+    """Tests the worker-local record of the completed jobs."""
+
+    def setUp(self):
+        self.job_status = tasks.JobStatusCache()
+
+    def tearDown(self):
+        if self.job_status.monitor:
+            self.job_status.monitor.stop.set()
+
+    def test_db_is_checked_once_per_job(self):
+        with mock.patch('openquake.signalling.JobOutcomeMonitor', FakeMonitor):
+            with patch('openquake.job.Job.is_job_completed') as completed:
+                completed.return_value = False
+
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.assertEqual([((3, ), {})], completed.call_args_list)
+
+    def test_completion_is_pushed(self):
+        with mock.patch('openquake.signalling.JobOutcomeMonitor', FakeMonitor):
+            with patch('openquake.job.Job.is_job_completed') as completed:
+                completed.return_value = False
+
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.job_status.monitor.completed.add(3)
+
+                self.assertTrue(self.job_status.is_job_completed(3))
+                self.assertEqual(1, completed.call_count)
+
+    def test_completed_before_listening(self):
+        with mock.patch('openquake.signalling.JobOutcomeMonitor', FakeMonitor):
+            with patch('openquake.job.Job.is_job_completed') as completed:
+                completed.return_value = True
+
+                self.assertTrue(self.job_status.is_job_completed(3))
+                self.assertTrue(self.job_status.is_job_completed(3))
+                self.assertEqual(1, completed.call_count)
+
+    def test_no_signalling(self):
+        """Without signalling, the status is always read from the DB"""
+        with mock.patch('openquake.signalling.JobOutcomeMonitor') as monitor:
+            monitor.side_effect = socket.error
+
+            with patch('openquake.job.Job.is_job_completed') as completed:
+                completed.return_value = False
+
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.assertEqual(2, completed.call_count)
+                self.assertEqual(1, monitor.call_count)
+
+    def test_monitor_stopped(self):
+        """When the monitor stops, the status is read from the DB"""
+        with mock.patch('openquake.signalling.JobOutcomeMonitor', FakeMonitor):
+            with patch('openquake.job.Job.is_job_completed') as completed:
+                completed.return_value = False
+
+                self.assertFalse(self.job_status.is_job_completed(3))
+
+                self.job_status.monitor.stop.set()
+                self.job_status.thread.join()
+
+                self.assertFalse(self.job_status.is_job_completed(3))
+                self.assertEqual(2, completed.call_count)
+
+
+class FakeResult(object):
+    """Stands in for the result of a subtask."""
+
+    def __init__(self, task_id, value):
+        self.task_id = task_id
+        self.value = value
+
+    def get(self):
+        if isinstance(self.value, Exception):
+            raise self.value
+
+        return self.value
+
+
+class FakeTaskSetResult(object):
+    """Stands in for the result of a task set."""
+
+    def __init__(self, *subtasks):
+        self.taskset_id = 'ts-1'
+        self.subtasks = list(subtasks)
+        self.is_ready = False
+
+    def ready(self):
+        return self.is_ready
+
+
+class TaskSetMonitorTestCase(unittest.TestCase):
+    """Tests the tracking of the completion of the subtasks."""
+
+    def setUp(self):
+        self.kvs = memory.MemoryKVS()
+        self.kvs.flushdb()
+
+        self.result = FakeTaskSetResult(
+            FakeResult('a', 1), FakeResult('b', NotImplementedError([2])))
+
+    def tearDown(self):
+        self.kvs.flushdb()
+
+    def test_update(self):
+        monitor = tasks.TaskSetMonitor(self.result)
+
+        self.assertEqual(set(['a', 'b']), monitor.pending)
+
+        monitor.update(dict(task_id='a', time=0.5, failed=False))
+
+        self.assertFalse(monitor.done())
+        self.assertEqual({'a': 0.5}, monitor.timings)
+
+    def test_failure_is_raised_at_once(self):
+        monitor = tasks.TaskSetMonitor(self.result)
+
+        try:
+            monitor.update(dict(task_id='b', time=0.1, failed=True))
+        except tasks.TaskFailed, exc:
+            self.assertEqual([2], exc.args[0])
+        else:
+            self.fail("TaskFailed wasn't raised")
+
+    def test_ready_task_set(self):
+        self.result.is_ready = True
+
+        self.assertTrue(tasks.TaskSetMonitor(self.result).done())
+
+    def test_completions_are_pushed(self):
+        """The completions pushed by the workers are waited for"""
+
+        class FakeTask(object):
+            class request(object):
+                taskset = 'ts-1'
+
+        monitor = tasks.TaskSetMonitor(self.result)
+
+        with mock.patch('openquake.kvs.get_client') as get_client:
+            get_client.return_value = self.kvs
+
+            for task_id in ('b', 'a'):
+                tasks._subtask_started(task_id=task_id, task=FakeTask)
+                tasks._subtask_finished(task_id=task_id)
+
+            tasks._wait_for_any([monitor])
+            self.assertEqual(set(['a']), monitor.pending)
+
+            tasks._wait_for_any([monitor])
+            self.assertTrue(monitor.done())
+
+        self.assertEqual(set(['a', 'b']), set(monitor.timings))
+        self.assertTrue(
+            self.kvs.ttl(tokens.taskset_done_key('ts-1')) is None)
+
+    def test_results_are_checked_without_completions(self):
+        """The task sets are checked when no completion is pushed"""
+        monitor = tasks.TaskSetMonitor(self.result)
+        self.result.is_ready = True
+
+        with mock.patch('openquake.kvs.get_client') as get_client:
+            get_client.return_value = self.kvs
+
+            with mock.patch('openquake.utils.tasks.'
+                            'COMPLETION_CHECK_INTERVAL', 0.01):
+                tasks._wait_for_any([monitor])
+
+        self.assertTrue(monitor.done())
+
+    def test_tasks_outside_task_sets(self):
+        """Nothing is pushed for the tasks not run in a task set"""
+
+        class FakeTask(object):
+            class request(object):
+                pass
+
+        with mock.patch('openquake.kvs.get_client') as get_client:
+            get_client.return_value = self.kvs
+
+            tasks._subtask_started(task_id='c', task=FakeTask)
+            tasks._subtask_finished(task_id='c')
+
+        self.assertEqual([], self.kvs.keys())
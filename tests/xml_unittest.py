@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+import os
+import threading
+import unittest
+
+from lxml import etree
+
+from openquake import xml
+
+from tests.utils import helpers
+
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="value" type="xs:double"/>
+</xs:schema>
+"""
+
+
+class SchemaRegistryTestCase(unittest.TestCase, helpers.TestMixin):
+
+    def setUp(self):
+        self.schema_path = self.touch(SCHEMA, suffix=".xsd")
+        self.registry = xml.SchemaRegistry()
+
+    def tearDown(self):
+        os.remove(self.schema_path)
+
+    def test_schemas_are_compiled_once(self):
+        schema = self.registry.schema(self.schema_path)
+
+        self.assertTrue(isinstance(schema, etree.XMLSchema))
+        self.assertTrue(schema is self.registry.schema(self.schema_path))
+        self.assertTrue(self.registry.compile_time > 0.0)
+        self.assertEqual(0.0, self.registry.validate_time)
+
+    def test_validate(self):
+        self.assertTrue(self.registry.validate(
+            etree.fromstring("<value>1.0</value>"), self.schema_path))
+        self.assertFalse(self.registry.validate(
+            etree.fromstring("<value>one</value>"), self.schema_path))
+
+    def test_assert_valid(self):
+        self.registry.assert_valid(
+            etree.fromstring("<value>1.0</value>"), "ok.xml",
+            self.schema_path)
+
+        self.assertRaises(
+            xml.XMLValidationError, self.registry.assert_valid,
+            etree.fromstring("<value>one</value>"), "wrong.xml",
+            self.schema_path)
+
+    def test_parser_schema(self):
+        schema = self.registry.parser_schema(True, self.schema_path)
+
+        self.assertTrue(isinstance(schema, etree.XMLSchema))
+        self.assertTrue(schema is self.registry.parser_schema(
+            True, self.schema_path))
+        self.assertTrue(
+            self.registry.parser_schema(False, self.schema_path) is None)
+
+    def test_parser_schemas_are_not_shared_by_threads(self):
+        schemas = []
+
+        def parser_schema():
+            schemas.append(self.registry.parser_schema(True, self.schema_path))
+
+        for _ in xrange(2):
+            thread = threading.Thread(target=parser_schema)
+            thread.start()
+            thread.join()
+
+        parser_schema()
+
+        self.assertEqual(3, len(set(id(schema) for schema in schemas)))
+        self.assertFalse(self.registry.schema(self.schema_path) in schemas)
+
+    def test_validate_schema_setting(self):
+        with helpers.patch("openquake.utils.config.get") as get:
+            get.return_value = None
+            self.assertTrue(xml.validate_schema())
+
+            get.return_value = "false"
+            self.assertFalse(xml.validate_schema())
+
+            get.return_value = "maybe"
+            self.assertRaises(ValueError, xml.validate_schema)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+
+# simple non-automated speed tests for the exposure DB writer; run with
+# nosetests -s to see timing and rows per second for single tests
+#
+# ExposureDBWriterTestCase.test_insert_datum saves one ExposureData at a
+# time (the way assets were loaded before the COPY based writer),
+# ExposureDBWriterTestCase.test_serialize loads them with COPY FROM STDIN
+#
+# ExposureIngestionTestCase groups synthetic assets (4 per site) by site
+# and splits the sites into blocks of grid points, the way the risk jobs
+# do; some indicative timings (grouping/blocks):
+# 10k assets      0.02 sec/0.06 sec
+# 100k assets     0.15 sec/0.3 sec
+# 1M assets       2.9 sec/3 sec
+# (de-duplicating the sites of 10k assets with a list took 11 sec, and
+# ~400 sec when sites read their coordinates from the shapely point)
+
+
+import time
+import unittest
+
+from openquake.input.exposure import ExposureDBWriter
+from openquake.risk.job import general
+from openquake.shapes import Region, Site
+
+from tests.utils import helpers
+
+
+ASSETS = 20000
+
+
+def EXPOSURE_DATA(count):
+    for i in xrange(count):
+        yield (Site(-179.0 + (i % 3600) * 0.1, -90.0 + (i / 3600) * 0.1),
+               {'assetID': 'a%s' % i,
+                'assetValue': 250000.0,
+                'assetCategory': 'buildings',
+                'assetValueUnit': 'EUR',
+                'listDescription': 'Exposure speed test',
+                'structureCategory': 'RC-LR-PC',
+                'vulnerabilityFunctionReference': 'RC/DMRF-D/LR'})
+
+
+class ExposureDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
+    """Load 20k assets in the DB."""
+
+    def setUp(self):
+        self.writer = ExposureDBWriter(self.default_user())
+        self.start = time.time()
+
+    def tearDown(self):
+        print '%.0f rows per second' % (
+            ASSETS / (time.time() - self.start))
+
+        if self.writer.model:
+            self.writer.model.delete()
+
+    @helpers.timeit
+    def test_insert_datum(self):
+        for point, values in EXPOSURE_DATA(ASSETS):
+            self.writer.insert_datum(point, values)
+
+    @helpers.timeit
+    def test_serialize(self):
+        self.writer.serialize(EXPOSURE_DATA(ASSETS))
+
+
+def SITE_ASSETS(count, assets_per_site=4):
+    for i, (site, asset) in enumerate(EXPOSURE_DATA(count / assets_per_site)):
+        for j in xrange(assets_per_site):
+            asset = dict(asset, assetID='a%s_%s' % (i, j))
+            yield site, asset
+
+
+class ExposureIngestionTestCase(unittest.TestCase):
+    """Group 10k, 100k and 1M assets by site and split their sites in
+    blocks."""
+
+    def setUp(self):
+        self.region = Region.from_simple((-179.0, 90.0), (181.0, -90.0))
+
+    def _ingest(self, count):
+        site_assets = list(SITE_ASSETS(count))
+
+        start = time.time()
+        sites, _assets = general.group_assets_by_site(site_assets)
+        print '%s assets at %s sites grouped in %.2f sec' % (
+            count, len(sites), time.time() - start)
+
+        start = time.time()
+        for block in general.split_into_blocks(sites):
+            list(block.grid(self.region))
+        print 'sites split into blocks of grid points in %.2f sec' % (
+            time.time() - start)
+
+    @helpers.timeit
+    def test_10k_assets(self):
+        self._ingest(10000)
+
+    @helpers.timeit
+    def test_100k_assets(self):
+        self._ingest(100000)
+
+    @helpers.timeit
+    def test_1m_assets(self):
+        self._ingest(1000000)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+# simple non-automated speed tests for the KVS; run with
+# nosetests -s to see timing and number of KVS round-trips for single tests
+
+
+import unittest
+
+import numpy
+
+from openquake import kvs
+from openquake.shapes import Site
+
+from tests.utils import helpers
+
+
+JOB_ID = 1
+REALIZATION = 0
+
+
+def HAZARD_CURVE_DATA(r1, r2):
+    data = []
+    poes = numpy.array([0.1] * 20)
+
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            data.append((Site(lon, lat), poes))
+
+    return data
+
+
+def commands_processed(client):
+    """Number of commands processed so far by the KVS server."""
+    return int(client.info()['total_commands_processed'])
+
+
+class HazardCurveKVSWriteTestCase(unittest.TestCase):
+    """Write the hazard curves of 10k sites, one value at a time and with a
+    :py:class:`openquake.kvs.BulkWriter`."""
+
+    def setUp(self):
+        self.client = kvs.get_client()
+        self.client.flushdb()
+        self.data = HAZARD_CURVE_DATA(100, 100)
+        self.start = commands_processed(self.client)
+
+    def tearDown(self):
+        # the INFO command used to read the counter is not included
+        print '%s sites, %s KVS round-trips' % (
+            len(self.data), commands_processed(self.client) - self.start - 1)
+        self.client.flushdb()
+
+    @helpers.timeit
+    def test_write_one_by_one(self):
+        for site, poes in self.data:
+            kvs.set_value_array(
+                kvs.tokens.hazard_curve_poes_key(JOB_ID, REALIZATION, site),
+                poes)
+
+    @helpers.timeit
+    def test_write_bulk(self):
+        with kvs.BulkWriter() as writer:
+            for site, poes in self.data:
+                writer.set_value_array(
+                    kvs.tokens.hazard_curve_poes_key(
+                        JOB_ID, REALIZATION, site), poes)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+# simple non-automated speed tests for the NRML writers and readers; run with
+# nosetests -s to see timing and peak memory for single tests
+#
+# each writer/reader runs in a forked process, its peak resident set size is
+# reported net of the one of an idle forked process
+#
+# some indicative peak memory figures (whole tree/incremental):
+# GMFXMLWriter            124 MB/ 4 MB
+# HazardCurveXMLWriter    235 MB/ 4 MB
+# HazardMapXMLWriter      178 MB/ 4 MB
+# LossCurveXMLWriter      332 MB/19 MB
+# LossMapXMLWriter        450 MB/176 MB (the data has to be in a list)
+#
+# and for the readers of the same files (keeping the whole tree/discarding
+# the processed nodes):
+# NrmlFile                  - / 5 MB (looking up the IML of each node
+#                                     among all its siblings made the
+#                                     whole tree version quadratic: 8.7 sec
+#                                     against 1.5 for 10k nodes, unfinished
+#                                     after 20 min for 100k)
+# GMFReader               212 MB/ 6 MB
+
+
+import os
+import unittest
+
+from openquake import writer
+from openquake.output.hazard import *
+from openquake.parser.hazard import GMFReader, NrmlFile
+from openquake.output.risk import *
+from openquake.shapes import Site, Curve
+
+from tests.utils import helpers
+
+
+# 100k curves/nodes
+R1, R2 = 250, 400
+
+
+def HAZARD_CURVE_DATA(r1, r2):
+    poes = imls = [0.1] * 20
+
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            yield (Site(lon, lat),
+                   {'investigationTimeSpan': '50.0',
+                    'IMLValues': imls,
+                    'PoEValues': poes,
+                    'IMT': 'PGA',
+                    'statistics': 'mean'})
+
+
+def HAZARD_CURVE_BRANCH_DATA(r1, r2):
+    """Curves of a logic tree branch, with the metadata required by the
+    hazard curve reader."""
+    for site, attributes in HAZARD_CURVE_DATA(r1, r2):
+        del attributes['statistics']
+        attributes.update({'IDmodel': 'MMI_3_1',
+                           'saPeriod': 0.1,
+                           'saDamping': 0.2,
+                           'endBranchLabel': '1_1'})
+
+        yield site, attributes
+
+
+def HAZARD_MAP_DATA(r1, r2):
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            yield (Site(lon, lat),
+                   {'IML': 1.9266716959669603,
+                    'IMT': 'PGA',
+                    'investigationTimeSpan': '50.0',
+                    'poE': 0.01,
+                    'statistics': 'mean',
+                    'vs30': 760.0})
+
+
+def GMF_DATA(r1, r2):
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            yield (Site(lon, lat), {'groundMotion': 0.0})
+
+
+def LOSS_CURVE_DATA(r1, r2):
+    poes = imls = [0.1] * 20
+    curve = Curve(zip(imls, poes))
+
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            yield (Site(lon, lat),
+                   (curve, {'assetID': 'a%s_%s' % (lon, lat)}))
+
+
+def LOSS_MAP_DATA(r1, r2):
+    yield {'deterministic': True}
+
+    for lon in xrange(-179, -179 + r1):
+        for lat in xrange(-90, -90 + r2):
+            yield (Site(lon, lat),
+                   [({'mean_loss': 120000.0, 'stddev_loss': 2000.0},
+                     {'assetID': 'a%s_%s' % (lon, lat)})])
+
+
+class NRMLWriterMemoryTestCase(unittest.TestCase):
+    """Serialize 100k curves/nodes keeping the whole tree in memory and
+    incrementally."""
+
+    def setUp(self):
+        self.path = helpers.get_output_path("nrml-speedtest.xml")
+        self.baseline = helpers.peak_memory(lambda: None)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _serialize(self, writer_class, data_function):
+        for incremental in (False, True):
+            def serialize():
+                """Serialize the data with the writer under test."""
+                writer = writer_class(self.path, incremental=incremental)
+                data = data_function(R1, R2)
+
+                # LossMapXMLWriter.serialize() looks for the metadata at
+                # the start of a list
+                if writer_class is LossMapXMLWriter:
+                    data = list(data)
+
+                writer.serialize(data)
+
+            print '%s (incremental=%s) peak memory %s KB' % (
+                writer_class.__name__, incremental,
+                helpers.peak_memory(serialize) - self.baseline)
+
+    @helpers.timeit
+    def test_hazard_curves(self):
+        self._serialize(HazardCurveXMLWriter, HAZARD_CURVE_DATA)
+
+    @helpers.timeit
+    def test_hazard_map(self):
+        self._serialize(HazardMapXMLWriter, HAZARD_MAP_DATA)
+
+    @helpers.timeit
+    def test_gmf(self):
+        self._serialize(GMFXMLWriter, GMF_DATA)
+
+    @helpers.timeit
+    def test_loss_curves(self):
+        self._serialize(LossCurveXMLWriter, LOSS_CURVE_DATA)
+
+    @helpers.timeit
+    def test_loss_map(self):
+        self._serialize(LossMapXMLWriter, LOSS_MAP_DATA)
+
+
+class NRMLReaderMemoryTestCase(unittest.TestCase):
+    """Read 100k curves/nodes serialized incrementally."""
+
+    def setUp(self):
+        self.path = helpers.get_output_path("nrml-speedtest.xml")
+        self.baseline = helpers.peak_memory(lambda: None)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read(self, writer_class, data_function, reader_class):
+        writer_class(self.path, incremental=True).serialize(
+            data_function(R1, R2))
+
+        def read():
+            """Read all the nodes with the reader under test."""
+            for _ in reader_class(self.path):
+                pass
+
+        print '%s peak memory %s KB' % (
+            reader_class.__name__,
+            helpers.peak_memory(read) - self.baseline)
+
+    @helpers.timeit
+    def test_hazard_curves(self):
+        self._read(HazardCurveXMLWriter, HAZARD_CURVE_BRANCH_DATA, NrmlFile)
+
+    @helpers.timeit
+    def test_gmf(self):
+        self._read(GMFXMLWriter, GMF_DATA, GMFReader)
+
+
+class HazardCurveExportMemoryTestCase(unittest.TestCase, helpers.DbTestMixin):
+    """Export 100k curves to the DB and to XML (the default job output),
+    with the curves in a list and produced again for each writer."""
+
+    def setUp(self):
+        self.job = self.setup_classic_job()
+        self.path = helpers.get_output_path("nrml-speedtest.xml")
+        self.baseline = helpers.peak_memory(lambda: None)
+
+    def tearDown(self):
+        self.teardown_job(self.job)
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _export(self, data_function):
+        def export():
+            """Serialize the curves with the db+xml writer."""
+            curve_writer = create_hazardcurve_writer(
+                self.job.id, ['db', 'xml'], self.path)
+            curve_writer.serialize(data_function())
+
+        print 'peak memory %s KB' % (
+            helpers.peak_memory(export) - self.baseline)
+
+    @helpers.timeit
+    def test_list(self):
+        self._export(lambda: list(HAZARD_CURVE_DATA(R1, R2)))
+
+    @helpers.timeit
+    def test_reiterable(self):
+        self._export(lambda: writer.Reiterable(HAZARD_CURVE_DATA, R1, R2))
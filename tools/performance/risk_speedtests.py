@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+# simple non-automated speed tests for the classical PSHA based risk
+# computations; run with nosetests -s to see timing and per-asset cost
+#
+# some indicative per-asset costs (30 vulnerability functions, 100 IMLs):
+# LossRatioCurveTestCase.test_cold_cache   6.4 ms
+# LossRatioCurveTestCase.test_warm_cache   0.8 ms
+# (computing each LREM cell with its own lognorm.sf() call took ~2 sec
+# with a cold cache, and pickling the cache key 5.9 ms with a warm one)
+
+
+import time
+import unittest
+
+import numpy
+from scipy import stats
+
+from openquake import shapes
+from openquake.risk import classical_psha_based as psha
+
+from tests.utils import helpers
+
+
+ASSETS = 1000
+
+
+def VULN_FUNCTIONS(count):
+    """Vulnerability functions shaped like the HAZUS ones used by the
+    smoke tests: 100 IMLs, lognormal loss ratios, CoV 0.3."""
+    imls = list(numpy.linspace(0.0, 4.0, 100))
+    functions = []
+
+    for median in numpy.linspace(0.1, 2.0, count):
+        loss_ratios = list(numpy.round(
+            stats.lognorm.cdf(imls, 0.6, scale=median), 2))
+        functions.append(shapes.VulnerabilityFunction(
+            imls, loss_ratios, [0.3] * len(imls)))
+
+    return functions
+
+
+HAZARD_CURVE = shapes.Curve(
+    zip(numpy.linspace(0.005, 4.0, 19),
+        numpy.linspace(0.99, 0.0001, 19)))
+
+
+class LossRatioCurveTestCase(unittest.TestCase):
+    """Compute the loss ratio curves of 1000 assets, with 30 different
+    vulnerability functions."""
+
+    def setUp(self):
+        psha.STEPS_PER_INTERVAL = 5
+        self.functions = VULN_FUNCTIONS(30)
+        self._clear_caches()
+        self.start = time.time()
+
+    def tearDown(self):
+        print '%.1f ms per asset' % (
+            (time.time() - self.start) * 1000.0 / ASSETS)
+
+    def _clear_caches(self):
+        for function in (psha._compute_lrem, psha._generate_loss_ratios,
+                         psha._compute_imls):
+            function.memo.clear()
+
+    def _compute(self, clear_cache):
+        for asset in xrange(ASSETS):
+            if clear_cache:
+                self._clear_caches()
+
+            psha.compute_loss_ratio_curve(
+                self.functions[asset % len(self.functions)], HAZARD_CURVE)
+
+    @helpers.timeit
+    def test_cold_cache(self):
+        self._compute(True)
+
+    @helpers.timeit
+    def test_warm_cache(self):
+        self._compute(False)
@@ -21,6 +21,13 @@
 # simple non-automated speed tests; run with
 # nosetests -s to see timing for single tests
 #
+# the serialize tests bulk insert the rows with COPY, the *_insert ones
+# with the multi-row INSERT queries the timings below were measured with
+#
+# the deserialize tests also report the peak memory of reading an output
+# with deserialize() and with stream(), each in a forked process, net of
+# the one of an idle forked process
+#
 # some indicative timings:
 # GMFDBWriterTestCase.test_serialize_small            2.71 sec
 # HazardCurveDBWriterTestCase.test_deserialize_small 24.32 sec
@@ -32,6 +39,8 @@
 
 import unittest
 
+from django.db import connections
+
 from openquake.output.hazard import *
 from openquake.output.risk import *
 from openquake.shapes import Site, Curve
@@ -127,6 +136,38 @@ def LOSS_MAP_DATA(assets, r1, r2):
     return data
 
 
+def read(reader, output_id):
+    """Read the output with the given reader ten times, then report the
+    peak memory of deserializing and of streaming it."""
+    for i in xrange(0, 10):
+        # Call the function under test.
+        reader.deserialize(output_id)
+
+    def forked(function):
+        """Run the function in a forked process with its own connections
+        to the database."""
+        def _forked():
+            for connection in connections.all():
+                connection.connection = None
+
+            function()
+
+        return _forked
+
+    def stream():
+        for _ in reader.stream(output_id):
+            pass
+
+    baseline = helpers.peak_memory(lambda: None)
+
+    for name, function in [
+        ('deserialize', lambda: reader.deserialize(output_id)),
+        ('stream', stream)]:
+        print '%s.%s() peak memory %s KB' % (
+            reader.__class__.__name__, name,
+            helpers.peak_memory(forked(function)) - baseline)
+
+
 class HazardCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
     def tearDown(self):
         if hasattr(self, "job") and self.job:
@@ -134,8 +175,7 @@ class HazardCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    @helpers.timeit
-    def test_serialize_small(self):
+    def _serialize_small(self, backend):
         data = HAZARD_CURVE_DATA(['1_1', '1_2', '2_2', '2'], 20, 4)
 
         self.job = self.setup_classic_job()
@@ -144,9 +184,19 @@ class HazardCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         for i in xrange(0, 10):
             hcw = HazardCurveDBWriter(output_path + str(i), self.job.id)
 
+            hcw.bulk_inserter.backend = backend
+
             # Call the function under test.
             hcw.serialize(data)
 
+    @helpers.timeit
+    def test_serialize_small(self):
+        self._serialize_small("copy")
+
+    @helpers.timeit
+    def test_serialize_small_insert(self):
+        self._serialize_small("insert")
+
     @helpers.timeit
     def test_deserialize_small(self):
         data = HAZARD_CURVE_DATA(['1_1', '1_2', '2_2', '2'], 20, 4)
@@ -158,11 +208,7 @@ class HazardCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         hcw.serialize(data)
 
         # deserialize
-        hcr = HazardCurveDBReader()
-
-        for i in xrange(0, 10):
-            # Call the function under test.
-            hcr.deserialize(hcw.output.id)
+        read(HazardCurveDBReader(), hcw.output.id)
 
 
 class HazardMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
@@ -172,8 +218,7 @@ class HazardMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    @helpers.timeit
-    def test_serialize_small(self):
+    def _serialize_small(self, backend):
         data = HAZARD_MAP_DATA(20, 4)
 
         self.job = self.setup_classic_job()
@@ -182,9 +227,19 @@ class HazardMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         for i in xrange(0, 10):
             hmw = HazardMapDBWriter(output_path + str(i), self.job.id)
 
+            hmw.bulk_inserter.backend = backend
+
             # Call the function under test.
             hmw.serialize(data)
 
+    @helpers.timeit
+    def test_serialize_small(self):
+        self._serialize_small("copy")
+
+    @helpers.timeit
+    def test_serialize_small_insert(self):
+        self._serialize_small("insert")
+
 
 class GmfDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
     def tearDown(self):
@@ -193,8 +248,7 @@ class GmfDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    @helpers.timeit
-    def test_serialize_small(self):
+    def _serialize_small(self, backend):
         data = GMF_DATA(20, 4)
 
         self.job = self.setup_classic_job()
@@ -203,9 +257,31 @@ class GmfDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         for i in xrange(0, 10):
             gmfw = GmfDBWriter(output_path + str(i), self.job.id)
 
+            gmfw.bulk_inserter.backend = backend
+
             # Call the function under test.
             gmfw.serialize(data)
 
+    @helpers.timeit
+    def test_serialize_small(self):
+        self._serialize_small("copy")
+
+    @helpers.timeit
+    def test_serialize_small_insert(self):
+        self._serialize_small("insert")
+
+    @helpers.timeit
+    def test_deserialize_small(self):
+        data = GMF_DATA(20, 4)
+
+        self.job = self.setup_classic_job()
+        output_path = self.generate_output_path(self.job)
+
+        gmfw = GmfDBWriter(output_path, self.job.id)
+        gmfw.serialize(data)
+
+        read(GmfDBReader(), gmfw.output.id)
+
 
 class LossCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
     def tearDown(self):
@@ -214,8 +290,7 @@ class LossCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    @helpers.timeit
-    def test_serialize_small(self):
+    def _serialize_small(self, backend):
         data = LOSS_CURVE_DATA(20, 4)
 
         self.job = self.setup_classic_job()
@@ -224,9 +299,31 @@ class LossCurveDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         for i in xrange(0, 20):
             lcw = LossCurveDBWriter(output_path + str(i), self.job.id)
 
+            lcw.bulk_inserter.backend = backend
+
             # Call the function under test.
             lcw.serialize(data)
 
+    @helpers.timeit
+    def test_serialize_small(self):
+        self._serialize_small("copy")
+
+    @helpers.timeit
+    def test_serialize_small_insert(self):
+        self._serialize_small("insert")
+
+    @helpers.timeit
+    def test_deserialize_small(self):
+        data = LOSS_CURVE_DATA(20, 4)
+
+        self.job = self.setup_classic_job()
+        output_path = self.generate_output_path(self.job)
+
+        lcw = LossCurveDBWriter(output_path, self.job.id)
+        lcw.serialize(data)
+
+        read(LossCurveDBReader(), lcw.output.id)
+
 
 class LossMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
     def tearDown(self):
@@ -235,8 +332,7 @@ class LossMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         if hasattr(self, "output") and self.output:
             self.teardown_output(self.output)
 
-    @helpers.timeit
-    def test_serialize_small(self):
+    def _serialize_small(self, backend):
         data = LOSS_MAP_DATA(['a%d' % i for i in range(5)], 20, 4)
 
         self.job = self.setup_classic_job()
@@ -245,5 +341,27 @@ class LossMapDBWriterTestCase(unittest.TestCase, helpers.DbTestMixin):
         for i in xrange(0, 10):
             lmw = LossMapDBWriter(output_path + str(i), self.job.id)
 
+            lmw.bulk_inserter.backend = backend
+
             # Call the function under test.
             lmw.serialize(data)
+
+    @helpers.timeit
+    def test_serialize_small(self):
+        self._serialize_small("copy")
+
+    @helpers.timeit
+    def test_serialize_small_insert(self):
+        self._serialize_small("insert")
+
+    @helpers.timeit
+    def test_deserialize_small(self):
+        data = LOSS_MAP_DATA(['a%d' % i for i in range(5)], 20, 4)
+
+        self.job = self.setup_classic_job()
+        output_path = self.generate_output_path(self.job)
+
+        lmw = LossMapDBWriter(output_path, self.job.id)
+        lmw.serialize(data)
+
+        read(LossMapDBReader(), lmw.output.id)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+# simple non-automated speed tests for the region grids; run with
+# nosetests -s to see timing for single tests
+#
+# some indicative timings (10x10 degrees region, 0.01 degrees cells, ~1M
+# grid points):
+# GridTestCase.test_mask     0.2 sec
+# GridTestCase.test_sites   52 sec (most of it spent building the sites)
+# (checking each grid point with shapely took ~130 sec)
+
+
+import unittest
+
+from openquake import shapes
+
+from tests.utils import helpers
+
+
+class GridTestCase(unittest.TestCase):
+    """Find the ~1M grid points contained by a 10x10 degrees region."""
+
+    def setUp(self):
+        self.region = shapes.Region.from_simple((10.0, 50.0), (20.0, 40.0))
+        self.region.cell_size = 0.01
+
+    @helpers.timeit
+    def test_mask(self):
+        print '%s points' % self.region.grid.mask().sum()
+
+    @helpers.timeit
+    def test_sites(self):
+        print '%s sites' % len(self.region.sites)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2010-2011, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# only, as published by the Free Software Foundation.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License version 3 for more details
+# (a copy is included in the LICENSE file that accompanied this code).
+#
+# You should have received a copy of the GNU Lesser General Public License
+# version 3 along with OpenQuake.  If not, see
+# <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
+
+
+
+# simple non-automated speed tests for the source model DB loader; run with
+# nosetests -s to see timing and sources per second for single tests
+#
+# SourceModelWriterTestCase.test_write_simple_fault saves the models of
+# one source at a time with the ORM, test_write_simple_faults writes each
+# table with a single COPY command
+
+
+import time
+import unittest
+
+from openquake import java
+from openquake import xml
+from openquake.utils.db import loader as db_loader
+
+from tests.utils import helpers
+
+
+TEST_SRC_FILE = helpers.get_data_path('example-source-model.xml')
+
+# the simple fault of the source model fixture is written this many times
+SOURCES = 1000
+
+
+class SourceModelWriterTestCase(unittest.TestCase):
+    """Write 1000 simple fault sources to the DB."""
+
+    def setUp(self):
+        java.jvm().java.lang.System.setProperty(
+            "openquake.nrml.schema", xml.nrml_schema_file())
+        src_reader = java.jclass('SourceModelReader')(
+            TEST_SRC_FILE, db_loader.SourceModelLoader.DEFAULT_MFD_BIN_WIDTH)
+        simple = src_reader.read()[0]
+
+        self.simple_data = [db_loader.parse_simple_fault_src(simple)
+                            for _ in xrange(SOURCES)]
+        self.start = time.time()
+
+    def tearDown(self):
+        print '%.0f sources per second' % (
+            SOURCES / (time.time() - self.start))
+
+    @helpers.timeit
+    def test_write_simple_fault(self):
+        for simple_data in self.simple_data:
+            db_loader.write_simple_fault(simple_data, 1, None)
+
+    @helpers.timeit
+    def test_write_simple_faults(self):
+        db_loader.write_simple_faults(self.simple_data, 1, None)